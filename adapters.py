@@ -0,0 +1,212 @@
+import io
+import csv
+import gzip
+import json
+from itertools import islice
+from checkpoint import POSITION
+from validation import REQUIRED
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+PARQUET_MAGIC = b'PAR1'
+
+# Rows per batch read from the input
+BATCH_SIZE = 1000
+
+
+def compression_of(path):
+    """gzip, zstd or None, from the first bytes of the file."""
+    with open(path, 'rb') as data:
+        head = data.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def open_stream(path, compression):
+    """Binary stream of a file, decompressed on the fly."""
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError(f"{path} is zstd compressed, install the zstandard package to read it.")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def detect_format(path):
+    """Format of an input file from its content: Parquet, or CSV or JSON lines, compressed or not."""
+    with open(path, 'rb') as data:
+        if data.read(4) == PARQUET_MAGIC:
+            return 'parquet'
+    with open_stream(path, compression_of(path)) as stream:
+        head = stream.read(4096).lstrip()
+    return 'jsonl' if head.startswith(b'{') else 'csv'
+
+
+class Adapter:
+    """Rows of an input file, each tagged with its position for the load checkpoints.
+
+    The position is (byte offset after the row, row number). Only seekable
+    inputs have a byte offset; the others report 0 and resume by skipping
+    the rows already loaded.
+    """
+    seekable = False
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def batches(self, size=BATCH_SIZE):
+        rows = iter(self)
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+    def position(self):
+        return (self.offset if self.seekable else 0, self.row_number)
+
+    def close(self):
+        pass
+
+
+class LineAdapter(Adapter):
+    """Base of the text formats, read line by line from a possibly compressed file.
+
+    The lines are split here from the binary stream, so the byte offset after
+    each row is exact, also for values spanning several lines.
+    """
+
+    def __init__(self, path, byte_offset=0, row_number=0):
+        self.path = path
+        compression = compression_of(path)
+        self.seekable = compression is None
+        self.file = open_stream(path, compression)
+        self.offset = 0
+        self.row_number = 0
+        self.skip = 0
+        self.read_header()
+        if self.seekable and byte_offset:
+            self.file.seek(byte_offset)
+            self.offset = byte_offset
+            self.row_number = row_number
+        else:
+            self.skip = row_number
+
+    def read_header(self):
+        pass
+
+    def lines(self):
+        for line in self.file:
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+    def records(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        for row in self.records():
+            self.row_number += 1
+            if self.row_number <= self.skip:
+                continue
+            row[POSITION] = self.position()
+            yield row
+
+    def close(self):
+        self.file.close()
+
+
+class CsvAdapter(LineAdapter):
+    """CSV with a header line, the values are strings."""
+
+    def read_header(self):
+        line = self.file.readline()
+        self.offset += len(line)
+        self.fieldnames = next(csv.reader([line.decode('utf-8')]))
+
+    def records(self):
+        return csv.DictReader(self.lines(), fieldnames=self.fieldnames)
+
+
+class JsonLinesAdapter(LineAdapter):
+    """One JSON object per line, with JSON numbers and booleans."""
+    fieldnames = list(REQUIRED)
+
+    def records(self):
+        for line in self.lines():
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise ValueError(f"Row {self.row_number + 1} of {self.path} is not valid JSON: {error}")
+
+
+class ParquetAdapter(Adapter):
+    """Parquet file, reading only the columns the loader uses, with their Parquet types."""
+
+    def __init__(self, path, byte_offset=0, row_number=0):
+        if parquet is None:
+            raise ValueError(f"{path} is a Parquet file, install the pyarrow package to read it.")
+        self.file = parquet.ParquetFile(path)
+        names = self.file.schema_arrow.names
+        self.fieldnames = [name for name in REQUIRED if name in names]
+        self.offset = 0
+        self.row_number = 0
+
+        # Row groups before the resume point aren't read at all
+        self.row_groups = []
+        for i in range(self.file.num_row_groups):
+            rows = self.file.metadata.row_group(i).num_rows
+            if not self.row_groups and self.row_number + rows <= row_number:
+                self.row_number += rows
+                continue
+            self.row_groups.append(i)
+        self.skip = row_number
+
+    def batches(self, size=BATCH_SIZE):
+        if not self.row_groups:
+            return
+        for record_batch in self.file.iter_batches(batch_size=size, row_groups=self.row_groups, columns=self.fieldnames):
+            batch = []
+            for row in record_batch.to_pylist():
+                self.row_number += 1
+                if self.row_number <= self.skip:
+                    continue
+                row[POSITION] = self.position()
+                batch.append(row)
+            if batch:
+                yield batch
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+
+ADAPTERS = {
+    'csv': CsvAdapter,
+    'jsonl': JsonLinesAdapter,
+    'parquet': ParquetAdapter,
+}
+
+
+def open_input(path, format='auto', byte_offset=0, row_number=0):
+    """Adapter reading an input file from a checkpoint position, detecting its format unless given."""
+    if format == 'auto':
+        format = detect_format(path)
+    return ADAPTERS[format](path, byte_offset, row_number)
@@ -0,0 +1,113 @@
+import os
+import sys
+import math
+import argparse
+import psycopg2
+from collections import namedtuple
+from database import Router
+from binning import estimated_rows
+
+# Assessments read per answer, the sample fraction is chosen from the table size to get about this many
+SAMPLE_ROWS = 100_000
+
+# Normal quantile of the 95% confidence intervals
+Z = 1.96
+
+# Grouping -> (label expression, joins from the sampled assessments)
+GROUPS = {
+    'course': ("course.course_name", """
+        JOIN exam_event ON exam_event.exam_event_id = assessment.exam_event_id
+        JOIN course ON course.course_id = exam_event.course_id
+    """),
+    'room': ("room.room_name", """
+        JOIN exam_event ON exam_event.exam_event_id = assessment.exam_event_id
+        JOIN room ON room.room_id = exam_event.room_id
+    """),
+    'exam_type': ("exam_type.exam_name", """
+        JOIN exam_event ON exam_event.exam_event_id = assessment.exam_event_id
+        JOIN exam_type ON exam_type.exam_type_id = exam_event.exam_type_id
+    """),
+}
+
+# Estimated number of assessments and average grade of a group, with the half widths of their confidence intervals
+Estimate = namedtuple('Estimate', 'label sampled count count_margin average average_margin')
+
+# TABLESAMPLE SYSTEM picks whole pages, so the pages are the sampling units:
+# the sums per page give the variance of the estimates
+SAMPLE_QUERY = """
+    SELECT label, SUM(n), SUM(s), SUM(s * s), SUM(s * n), SUM(n * n)
+    FROM (
+        SELECT {label} AS label, COUNT(*)::float8 AS n, SUM(assessment.grade)::float8 AS s
+        FROM assessment TABLESAMPLE SYSTEM (%s)
+        {joins}
+        GROUP BY 1, assessment.tableoid, (assessment.ctid::text::point)[0]
+    ) pages
+    GROUP BY label;
+"""
+
+
+def enabled():
+    """The menus start in approximate mode with APPROXIMATE=1 in the environment."""
+    return (os.getenv("APPROXIMATE") or '').lower() in ('1', 'true', 'yes')
+
+
+def sample_percent(cursor, rows=SAMPLE_ROWS):
+    """Percentage of the assessment pages to sample, 100 for tables of up to rows assessments."""
+    total = estimated_rows(cursor, 'assessment')
+    if total <= rows:
+        return 100.0
+    return 100.0 * rows / total
+
+
+def estimate(cursor, by, rows=SAMPLE_ROWS):
+    """Sample percentage and estimates of every group of the assessments, from a page sample.
+
+    Every page is in the sample with probability p, so a count is estimated
+    as the sampled count / p and an average as the ratio of the sampled sums.
+    Their variances are those of a Poisson sample of pages, with (1 - p)
+    making a 100% sample exact.
+    """
+    label, joins = GROUPS[by]
+    percent = sample_percent(cursor, rows)
+    cursor.execute(SAMPLE_QUERY.format(label=label, joins=joins), (percent,))
+    p = percent / 100
+
+    estimates = []
+    for label, n, s, s_squares, s_n, n_squares in cursor.fetchall():
+        average = s / n
+        # Sum over the pages of (s - average * n)^2
+        spread = max(0.0, s_squares - 2 * average * s_n + average * average * n_squares)
+        estimates.append(Estimate(
+            label=label,
+            sampled=int(n),
+            count=n / p,
+            count_margin=Z * math.sqrt((1 - p) * n_squares) / p,
+            average=average,
+            average_margin=Z * math.sqrt((1 - p) * spread) / n,
+        ))
+    return percent, estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the number of assessments and the average grade by group from a sample.")
+    parser.add_argument('by', choices=list(GROUPS))
+    parser.add_argument('--rows', type=int, default=SAMPLE_ROWS, help="assessments to sample, about")
+    args = parser.parse_args()
+
+    conn = Router().connect_read()
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+    try:
+        percent, estimates = estimate(cursor, args.by, args.rows)
+        print(f"Estimated from a {percent:.2f}% sample of the assessments (95% confidence intervals):")
+        for item in sorted(estimates, key=lambda item: item.average, reverse=True):
+            print(f"{item.label}: average {item.average:.2f} ± {item.average_margin:.2f}, "
+                  f"{item.count:.0f} ± {item.count_margin:.0f} assessments ({item.sampled} sampled)")
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
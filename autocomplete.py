@@ -0,0 +1,121 @@
+import bisect
+import difflib
+from generation import current_generation
+
+try:
+    import readline
+except ImportError:
+    # Not available on Windows, the prompts then work without tab completion
+    readline = None
+
+# Table, id column and name column of every kind of name
+KINDS = {
+    'course': ('course', 'course_id', 'course_name'),
+    'building': ('building', 'building_id', 'building_name'),
+    'room': ('room', 'room_id', 'room_name'),
+    'exam_type': ('exam_type', 'exam_type_id', 'exam_name'),
+    'state': ('state', 'state_id', 'state_name'),
+}
+
+# Suggestions offered for a name that doesn't match
+SUGGESTIONS = 5
+
+# Similarity below which a name isn't suggested as a correction
+CUTOFF = 0.6
+
+# Sorts after every character, the end of a prefix range
+LAST = '\U0010ffff'
+
+
+class NameIndex:
+    """Names of one kind in a sorted array, searched by prefix with bisect.
+
+    Keys are case folded, so searches ignore case but return the names as
+    they are stored.
+    """
+
+    def __init__(self, names):
+        entries = sorted({(name.casefold(), name) for name in names})
+        self.keys = [key for key, _ in entries]
+        self.names = [name for _, name in entries]
+
+    def __len__(self):
+        return len(self.names)
+
+    def prefixed(self, prefix):
+        """Names starting with a prefix, in alphabetical order."""
+        key = prefix.casefold()
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + LAST, start)
+        return self.names[start:end]
+
+    def find(self, name):
+        """The stored spelling of a name, None if there is no such name."""
+        key = name.casefold()
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.names[i]
+        return None
+
+    def suggest(self, text, limit=SUGGESTIONS):
+        """Names ranked by how well they match: prefix, then contained word, then close spelling."""
+        key = text.casefold()
+        ranked = sorted(self.prefixed(text), key=len)
+        if len(ranked) < limit:
+            ranked += [name for name, name_key in zip(self.names, self.keys) if key in name_key and name not in ranked]
+        if len(ranked) < limit:
+            close = difflib.get_close_matches(key, self.keys, limit, CUTOFF)
+            ranked += [self.names[self.keys.index(match)] for match in close]
+        suggestions = []
+        for name in ranked:
+            if name not in suggestions:
+                suggestions.append(name)
+        return suggestions[:limit]
+
+
+class Names:
+    """Name indexes of every kind, loaded once per load generation."""
+
+    def __init__(self):
+        self.generation = None
+        self.indexes = {}
+
+    def load(self, cursor):
+        for kind, (table, _, column) in KINDS.items():
+            cursor.execute(f"SELECT {column} FROM {table};")
+            self.indexes[kind] = NameIndex(row[0] for row in cursor.fetchall())
+
+    def index(self, cursor, kind):
+        """Index of a kind of name, reloaded when a load happened since it was built."""
+        generation = current_generation(cursor)
+        if generation != self.generation:
+            self.load(cursor)
+            self.generation = generation
+        return self.indexes[kind]
+
+
+def complete_input(prompt, index):
+    """input() with tab completion of the whole line from the names of an index."""
+    if readline is None:
+        return input(prompt)
+
+    matches = []
+
+    def completer(text, state):
+        if state == 0:
+            matches[:] = index.prefixed(readline.get_line_buffer())
+        return matches[state] if state < len(matches) else None
+
+    previous = readline.get_completer(), readline.get_completer_delims()
+    readline.set_completer(completer)
+    # Names contain spaces, complete the line rather than the last word
+    readline.set_completer_delims('')
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    try:
+        return input(prompt)
+    finally:
+        readline.set_completer(previous[0])
+        readline.set_completer_delims(previous[1])
@@ -0,0 +1,165 @@
+import sys
+import csv
+import json
+import time
+import argparse
+import psycopg2
+from io import StringIO
+from database import db_params
+
+# Above this many keys they are copied into a temporary table and joined,
+# below it they are passed as a single array parameter to "= ANY(%s)".
+TEMP_TABLE_THRESHOLD = 10000
+
+# Rows fetched per round trip from the server side cursor
+ITERSIZE = 5000
+
+# Entity name -> (select list, key columns matched against the given names)
+ENTITIES = {
+    'students': ("""
+        SELECT student_id, first_name, last_name, email, date_of_birth, gpa, state_id
+        FROM student
+    """, ('first_name', 'last_name')),
+    'courses': ("""
+        SELECT course_id, course_name
+        FROM course
+    """, ('course_name',)),
+    'buildings': ("""
+        SELECT building_id, building_name
+        FROM building
+    """, ('building_name',)),
+    'rooms': ("""
+        SELECT room_id, room_name, building_id, capacity, has_projector, has_computers, is_accessible
+        FROM room
+    """, ('room_name',)),
+}
+
+
+def read_keys(path):
+    """Read one key per line from a file ('-' for stdin), skipping blank lines."""
+    source = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        keys = [line.strip() for line in source if line.strip()]
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    # Keep the first occurrence of each key, in order
+    return list(dict.fromkeys(keys))
+
+
+def build_query(cursor, entity, keys):
+    """Build the batch query for the given keys, loading them into a temporary table when there are many."""
+    select, key_columns = ENTITIES[entity]
+
+    if len(keys) <= TEMP_TABLE_THRESHOLD:
+        where = " OR ".join(f"{column} = ANY(%s)" for column in key_columns)
+        return f"{select} WHERE {where};", tuple(keys for _ in key_columns)
+
+    cursor.execute("CREATE TEMP TABLE batch_keys (name TEXT PRIMARY KEY) ON COMMIT DROP;")
+    buffer = StringIO()
+    for key in keys:
+        buffer.write(key.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n') + '\n')
+    buffer.seek(0)
+    cursor.copy_from(buffer, 'batch_keys', columns=('name',))
+    cursor.execute("ANALYZE batch_keys;")
+
+    where = " OR ".join(f"{column} IN (SELECT name FROM batch_keys)" for column in key_columns)
+    return f"{select} WHERE {where};", None
+
+
+def write_csv(out, columns, rows):
+    """Write rows as CSV with a header line."""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(out, columns, rows):
+    """Write rows as JSON lines, one object per row."""
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row)), default=str) + '\n')
+        count += 1
+    return count
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
+
+
+def stream_rows(cursor):
+    """Yield rows from a named cursor in blocks of ITERSIZE."""
+    while True:
+        rows = cursor.fetchmany(ITERSIZE)
+        if not rows:
+            break
+        yield from rows
+
+
+def run_batch(conn, entity, keys, out=sys.stdout, output_format='csv'):
+    """Resolve all keys of an entity with one query and stream the results to out."""
+    start = time.perf_counter()
+
+    with conn.cursor() as setup:
+        setup.execute("SET search_path TO grades;")
+        query, params = build_query(setup, entity, keys)
+
+    with conn.cursor(name=f"batch_{entity}") as cursor:
+        cursor.itersize = ITERSIZE
+        cursor.execute(query, params)
+        # The first fetch populates cursor.description on named cursors
+        first = cursor.fetchmany(ITERSIZE)
+        columns = [column[0] for column in cursor.description] if cursor.description else []
+
+        def rows():
+            yield from first
+            yield from stream_rows(cursor)
+
+        count = WRITERS[output_format](out, columns, rows())
+
+    conn.commit()
+    out.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"Resolved {len(keys)} {entity} keys into {count} rows in {elapsed:.2f}s ({rate:.0f} rows/s)", file=sys.stderr)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up many students, courses, buildings or rooms at once.")
+    parser.add_argument('entity', choices=ENTITIES.keys())
+    parser.add_argument('keys_file', nargs='?', default=None, help="file with one name per line ('-' for stdin)")
+    parser.add_argument('--keys', nargs='+', default=[], help="names given directly on the command line")
+    parser.add_argument('--format', choices=WRITERS.keys(), default='csv')
+    parser.add_argument('--output', default='-', help="output file ('-' for stdout)")
+    args = parser.parse_args()
+
+    keys = list(dict.fromkeys(args.keys + (read_keys(args.keys_file) if args.keys_file else [])))
+    if not keys:
+        parser.error("no keys given, pass a keys file or --keys")
+
+    try:
+        conn = psycopg2.connect(**db_params)
+    except psycopg2.Error as e:
+        print(f"Error connecting to the database: {e}", file=sys.stderr)
+        return 1
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        run_batch(conn, args.entity, keys, out, args.format)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# Above this many rows (estimated) the plots get binned counts instead of the raw values
+BIN_THRESHOLD = 50_000
+
+BINS = 20
+GRID_BINS = 40
+
+# Value ranges, from the CHECK constraints of the tables
+GPA_RANGE = (0, 4)
+GRADE_RANGE = (0, 100)
+
+
+def estimated_rows(cursor, table):
+    """Row count estimate of a table from the planner statistics, adding up the partitions of partitioned tables."""
+    cursor.execute("""
+        SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)
+        FROM pg_class
+        WHERE oid = to_regclass(%s)
+           OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s));
+    """, (table, table))
+    return int(cursor.fetchone()[0])
+
+
+def edges(low, high, bins):
+    step = (high - low) / bins
+    return [low + i * step for i in range(bins + 1)]
+
+
+def bucket(column, bins):
+    # width_bucket puts the upper bound (e.g. a GPA of 4) in bucket bins + 1, it belongs to the last one
+    return f"LEAST(GREATEST(width_bucket({column}, %s, %s, {int(bins)}), 1), {int(bins)})"
+
+
+def histogram(cursor, query, params, value_range, bins=BINS):
+    """Bin edges and counts of the single column selected by a query."""
+    low, high = value_range
+    cursor.execute(f"""
+        SELECT {bucket('value', bins)} AS bin, COUNT(*)
+        FROM ({query}) data (value)
+        WHERE value IS NOT NULL
+        GROUP BY bin;
+    """, (low, high) + tuple(params or ()))
+    counts = [0] * bins
+    for bin, count in cursor.fetchall():
+        counts[bin - 1] = count
+    return edges(low, high, bins), counts
+
+
+def grid(cursor, query, params, x_range, y_range, bins=GRID_BINS):
+    """Bin edges of both axes and counts (a row per y bin) of the two columns selected by a query."""
+    cursor.execute(f"""
+        SELECT {bucket('x', bins)} AS x_bin, {bucket('y', bins)} AS y_bin, COUNT(*)
+        FROM ({query}) data (x, y)
+        WHERE x IS NOT NULL AND y IS NOT NULL
+        GROUP BY x_bin, y_bin;
+    """, x_range + y_range + tuple(params or ()))
+    counts = [[0] * bins for _ in range(bins)]
+    for x_bin, y_bin, count in cursor.fetchall():
+        counts[y_bin - 1][x_bin - 1] = count
+    return edges(*x_range, bins), edges(*y_range, bins), counts
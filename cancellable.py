@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import threading
+import psycopg2
+import psycopg2.extensions
+
+# Seconds before the spinner shows up, quick queries don't flash it
+SPINNER_DELAY = 0.3
+SPINNER_FRAMES = '|/-\\'
+
+
+class QueryCancelled(Exception):
+    """Raised when a query was cancelled with Ctrl-C or hit its statement timeout."""
+
+
+class CancellableCursor(psycopg2.extensions.cursor):
+    """Cursor running each query on a worker thread.
+
+    The calling thread shows a spinner with the elapsed time while waiting.
+    Ctrl-C sends a cancel request to the server (the same as pg_cancel_backend
+    on the query's backend) and raises QueryCancelled once the server has
+    stopped, so no query is left running after returning to the menu.
+    """
+
+    def execute(self, query, vars=None):
+        outcome = {}
+
+        def run():
+            try:
+                super(CancellableCursor, self).execute(query, vars)
+            except BaseException as error:
+                outcome['error'] = error
+
+        worker = threading.Thread(target=run, daemon=True)
+        start = time.perf_counter()
+        worker.start()
+
+        spinner = Spinner(start)
+        try:
+            while worker.is_alive():
+                worker.join(0.1)
+                spinner.tick()
+        except KeyboardInterrupt:
+            self.connection.cancel()
+            worker.join()
+            spinner.clear()
+            raise QueryCancelled(f"Query cancelled after {time.perf_counter() - start:.1f}s.")
+        spinner.clear()
+
+        error = outcome.get('error')
+        if isinstance(error, psycopg2.extensions.QueryCanceledError):
+            raise QueryCancelled(f"Query stopped by the statement timeout after {time.perf_counter() - start:.1f}s.")
+        if error is not None:
+            raise error
+
+
+class Spinner:
+    """Elapsed time indicator written to stderr while a query runs."""
+
+    def __init__(self, start):
+        self.start = start
+        self.frame = 0
+        self.shown = False
+        self.enabled = sys.stderr.isatty()
+
+    def tick(self):
+        elapsed = time.perf_counter() - self.start
+        if not self.enabled or elapsed < SPINNER_DELAY:
+            return
+        self.frame = (self.frame + 1) % len(SPINNER_FRAMES)
+        sys.stderr.write(f"\r{SPINNER_FRAMES[self.frame]} Running query... {elapsed:.1f}s (Ctrl-C to cancel)")
+        sys.stderr.flush()
+        self.shown = True
+
+    def clear(self):
+        if self.shown:
+            sys.stderr.write('\r' + ' ' * 60 + '\r')
+            sys.stderr.flush()
+            self.shown = False
+
+
+def statement_timeouts():
+    """Read the statement timeouts in milliseconds from the environment.
+
+    STATEMENT_TIMEOUT is the default for every action and STATEMENT_TIMEOUTS
+    overrides it per action, e.g. "gpa_vs_grade=5000,plot_room_utilization=10000".
+    """
+    default = int(os.getenv("STATEMENT_TIMEOUT") or 0)
+    timeouts = {}
+    for item in (os.getenv("STATEMENT_TIMEOUTS") or "").split(','):
+        if '=' in item:
+            action, milliseconds = item.split('=', 1)
+            timeouts[action.strip()] = int(milliseconds)
+    return default, timeouts
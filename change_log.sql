@@ -0,0 +1,45 @@
+SET SEARCH_PATH TO grades;
+
+-- Append-only log of the changes made to assessment, enrollment and exam_event.
+-- It is not dropped by grades.sql, so consumers keep their position across
+-- reloads; the loader writes a RESET entry whenever the schema is recreated.
+CREATE TABLE IF NOT EXISTS change_log (
+    seq BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    row_data JSONB,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+
+-- The logical table name is passed as argument so that rows inserted through
+-- a partition are logged under the name of the partitioned table.
+CREATE OR REPLACE FUNCTION log_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (table_name, operation, row_data)
+        VALUES (TG_ARGV[0], TG_OP, to_jsonb(OLD));
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO change_log (table_name, operation, row_data)
+    VALUES (TG_ARGV[0], TG_OP, to_jsonb(NEW));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS assessment_change_log ON assessment;
+CREATE TRIGGER assessment_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON assessment
+    FOR EACH ROW EXECUTE FUNCTION log_change('assessment');
+
+DROP TRIGGER IF EXISTS enrollment_change_log ON enrollment;
+CREATE TRIGGER enrollment_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON enrollment
+    FOR EACH ROW EXECUTE FUNCTION log_change('enrollment');
+
+DROP TRIGGER IF EXISTS exam_event_change_log ON exam_event;
+CREATE TRIGGER exam_event_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON exam_event
+    FOR EACH ROW EXECUTE FUNCTION log_change('exam_event');
@@ -0,0 +1,179 @@
+import sys
+import json
+import time
+import argparse
+import psycopg2
+from collections import namedtuple
+from database import db_params
+
+Change = namedtuple('Change', 'seq table_name operation row_data changed_at')
+
+# Operation written when the loader recreates the schema, consumers must resync from scratch
+RESET = 'RESET'
+
+TABLES = ('assessment', 'enrollment', 'exam_event')
+
+
+def install(cursor):
+    """Create the change log table and the triggers feeding it."""
+    cursor.execute(open("change_log.sql", "r").read())
+
+
+def mark_reset(cursor):
+    """Record that every table was recreated, so that consumers know their copies are stale."""
+    cursor.execute("""
+        INSERT INTO change_log (table_name, operation)
+        VALUES ('*', %s);
+    """, (RESET,))
+
+
+def latest_seq(cursor):
+    """Return the sequence number of the last change, 0 if there is none."""
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log;")
+    return cursor.fetchone()[0]
+
+
+def read_snapshot(cursor):
+    """(xmin, xmax, last sequence number) of the snapshot of the current statement.
+
+    Transactions below xmin are over, those from xmax on started after the snapshot.
+    """
+    cursor.execute("""
+        SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint,
+               pg_snapshot_xmax(pg_current_snapshot())::text::bigint,
+               COALESCE(MAX(seq), 0)
+        FROM change_log;
+    """)
+    return cursor.fetchone()
+
+
+def read_changes(cursor, since=0, batch_size=1000, tables=None):
+    """Read the next batch_size changes with a sequence number greater than since, in order.
+
+    Returns (seq, change) pairs, the change is None for the changes of other
+    tables, so that the gaps in the sequence numbers can be told apart from
+    the filtered changes.
+    """
+    cursor.execute("""
+        SELECT seq, table_name, operation, row_data, changed_at,
+               %s OR table_name = ANY(%s) OR operation = %s
+        FROM change_log
+        WHERE seq > %s
+        ORDER BY seq
+        LIMIT %s;
+    """, (not tables, list(tables or ()), RESET, since, batch_size))
+    return [(row[0], Change(*row[:5]) if row[5] else None) for row in cursor.fetchall()]
+
+
+class ChangeFeed:
+    """Consumer of the change log that remembers how far it has read.
+
+    Each poll reads the next batch after the cursor with an index range scan
+    on the sequence number, so catching up costs time proportional to the
+    number of new changes, not to the size of the tables.
+
+    Sequence numbers are taken when a change is written but become visible
+    when its transaction commits, so a change may show up after changes
+    with higher numbers. The cursor only moves past a gap in the numbers
+    once the gap is final: every change up to the last number of a snapshot
+    is committed or rolled back for good once the xmin of a later snapshot
+    reaches the xmax of that one, as the triggers log the changes of
+    transactions that already have an id.
+    """
+
+    def __init__(self, conn, since=0, batch_size=1000, tables=None):
+        self.conn = conn
+        self.cursor = since
+        self.batch_size = batch_size
+        self.tables = tables
+        # No change up to final_seq can still appear
+        self.final_seq = since
+        # (last sequence number, xmax) of the snapshot waited for to move final_seq
+        self.horizon = None
+
+    def poll(self):
+        """Return the next batch of changes (empty when caught up) and advance the cursor."""
+        with self.conn.cursor() as cursor:
+            cursor.execute("SET search_path TO grades;")
+            xmin, xmax, last_seq = read_snapshot(cursor)
+            changes = read_changes(cursor, self.cursor, self.batch_size, self.tables)
+        # Don't keep a transaction open between polls
+        self.conn.rollback()
+
+        # With no transaction in progress (xmin = xmax) the current snapshot is final right away
+        for horizon in (self.horizon, (last_seq, xmax)):
+            if horizon and xmin >= horizon[1]:
+                self.final_seq = max(self.final_seq, horizon[0])
+        if self.horizon is None or xmin >= self.horizon[1]:
+            self.horizon = (last_seq, xmax)
+
+        batch = []
+        for seq, change in changes:
+            # A missing number before seq may belong to a transaction still in progress
+            if seq != self.cursor + 1 and seq > self.final_seq:
+                break
+            self.cursor = seq
+            if change:
+                batch.append(change)
+        return batch
+
+    def batches(self, follow=False, interval=1.0):
+        """Yield batches of changes until caught up, or forever when follow is set."""
+        while True:
+            cursor = self.cursor
+            changes = self.poll()
+            if changes:
+                yield changes
+            elif self.cursor != cursor:
+                # Only changes of other tables
+                continue
+            elif follow:
+                time.sleep(interval)
+            else:
+                return
+
+
+def load_cursor(path):
+    try:
+        with open(path, 'r') as cursor_file:
+            return int(cursor_file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def save_cursor(path, seq):
+    with open(path, 'w') as cursor_file:
+        cursor_file.write(f"{seq}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the changes of the grades tables as JSON lines.")
+    parser.add_argument('--since', type=int, default=None, help="sequence number to start after")
+    parser.add_argument('--cursor-file', default=None, help="file storing the last sequence number read")
+    parser.add_argument('--tables', nargs='+', choices=TABLES, default=None)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--follow', action='store_true', help="keep polling for new changes")
+    args = parser.parse_args()
+
+    since = args.since
+    if since is None:
+        since = load_cursor(args.cursor_file) if args.cursor_file else 0
+
+    conn = psycopg2.connect(**db_params)
+    feed = ChangeFeed(conn, since, args.batch_size, args.tables)
+    try:
+        for changes in feed.batches(args.follow):
+            for change in changes:
+                sys.stdout.write(json.dumps(change._asdict(), default=str) + '\n')
+            sys.stdout.flush()
+            if args.cursor_file:
+                save_cursor(args.cursor_file, feed.cursor)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
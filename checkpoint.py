@@ -0,0 +1,52 @@
+import hashlib
+from collections import namedtuple
+
+Checkpoint = namedtuple('Checkpoint', 'file_hash file_name partitioned byte_offset row_number rejects_offset completed')
+
+# Key added to every input row with the (byte offset after the row, row number) of the row
+POSITION = '_position'
+
+
+def install(cursor):
+    """Create the load_checkpoint table if it doesn't exist yet."""
+    cursor.execute(open("load_checkpoint.sql", "r").read())
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """SHA-256 of a file, so that a load is only resumed on the same file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as data:
+        for block in iter(lambda: data.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def start(cursor, path, digest, partitioned):
+    """Record a new load from the start of a file, forgetting the loads of the dropped tables."""
+    cursor.execute("DELETE FROM load_checkpoint;")
+    cursor.execute("""
+        INSERT INTO load_checkpoint (file_hash, file_name, partitioned)
+        VALUES (%s, %s, %s);
+    """, (digest, path, partitioned))
+    return Checkpoint(digest, path, partitioned, 0, 0, 0, False)
+
+
+def find(cursor, digest):
+    """The checkpoint of the load of a file, None if it was never loaded."""
+    cursor.execute("""
+        SELECT file_hash, file_name, partitioned, byte_offset, row_number, rejects_offset, completed
+        FROM load_checkpoint
+        WHERE file_hash = %s;
+    """, (digest,))
+    row = cursor.fetchone()
+    return Checkpoint(*row) if row else None
+
+
+def save(cursor, digest, byte_offset, row_number, rejects_offset=0, completed=False):
+    """Move the checkpoint after the last row of a batch, in the transaction of the batch."""
+    cursor.execute("""
+        UPDATE load_checkpoint
+        SET byte_offset = %s, row_number = %s, rejects_offset = %s, completed = %s, updated_at = now()
+        WHERE file_hash = %s;
+    """, (byte_offset, row_number, rejects_offset, completed, digest))
+
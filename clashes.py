@@ -0,0 +1,177 @@
+import sys
+import argparse
+import psycopg2
+from collections import namedtuple, defaultdict
+from datetime import datetime, timedelta
+from database import db_params
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+ExamDate = namedtuple('ExamDate', 'exam_event_id course_id date')
+Clash = namedtuple('Clash', 'date course_ids exam_event_ids students')
+Move = namedtuple('Move', 'exam_event_id course_id old_date new_date')
+
+
+def fetch_enrollment(cursor):
+    """(student_id, course_id) of every enrollment."""
+    cursor.execute("SELECT student_id, course_id FROM enrollment ORDER BY student_id;")
+    return cursor.fetchall()
+
+
+def fetch_exam_dates(cursor, start, end):
+    """The exam events between start and end with their course."""
+    cursor.execute("""
+        SELECT exam_event_id, course_id, date
+        FROM exam_event
+        WHERE date BETWEEN %s AND %s
+        ORDER BY date, exam_event_id;
+    """, (start, end))
+    return [ExamDate(*row) for row in cursor.fetchall()]
+
+
+def fetch_course_names(cursor):
+    cursor.execute("SELECT course_id, course_name FROM course;")
+    return dict(cursor.fetchall())
+
+
+class CoEnrollment:
+    """Number of students shared by every pair of courses.
+
+    The enrollments are a sparse student x course incidence matrix A, and
+    the co-enrollment counts are the product A^T A: entry (a, b) is the
+    number of students taking both courses, and the diagonal is the size of
+    every course. With scipy the product is a sparse matrix product; without
+    it, the same product is added up one student row at a time, which only
+    touches the pairs of courses a student takes.
+    """
+
+    def __init__(self, enrollment):
+        self.course_ids = sorted({course_id for _, course_id in enrollment})
+        self.index = {course_id: i for i, course_id in enumerate(self.course_ids)}
+        # (a, b) with a <= b -> students taking both
+        self.counts = self.product_scipy(enrollment) if sparse is not None else self.product(enrollment)
+        # Courses sharing at least one student with each course, itself included
+        self.neighbors = defaultdict(set)
+        for a, b in self.counts:
+            self.neighbors[self.course_ids[a]].add(self.course_ids[b])
+            self.neighbors[self.course_ids[b]].add(self.course_ids[a])
+
+    def product(self, enrollment):
+        counts = defaultdict(int)
+        courses_of_student = defaultdict(list)
+        for student_id, course_id in enrollment:
+            courses_of_student[student_id].append(self.index[course_id])
+        for courses in courses_of_student.values():
+            courses.sort()
+            for i, a in enumerate(courses):
+                for b in courses[i:]:
+                    counts[a, b] += 1
+        return dict(counts)
+
+    def product_scipy(self, enrollment):
+        students = {}
+        rows = [students.setdefault(student_id, len(students)) for student_id, _ in enrollment]
+        columns = [self.index[course_id] for _, course_id in enrollment]
+        incidence = sparse.csr_matrix(([1] * len(rows), (rows, columns)),
+                                      shape=(len(students), len(self.course_ids)), dtype='int32')
+        product = sparse.triu(incidence.T @ incidence).tocoo()
+        return {(int(a), int(b)): int(count) for a, b, count in zip(product.row, product.col, product.data)}
+
+    def students(self, course_a, course_b):
+        """Students enrolled in both courses, or in the course when they are the same."""
+        if course_a not in self.index or course_b not in self.index:
+            return 0
+        a, b = sorted((self.index[course_a], self.index[course_b]))
+        return self.counts.get((a, b), 0)
+
+
+def find_clashes(co_enrollment, exams):
+    """Pairs of exam events on the same date sharing students, the most students first."""
+    by_date = defaultdict(list)
+    for exam in exams:
+        by_date[exam.date].append(exam)
+
+    clashes = []
+    for date, day_exams in by_date.items():
+        for i, first in enumerate(day_exams):
+            for second in day_exams[i + 1:]:
+                students = co_enrollment.students(first.course_id, second.course_id)
+                if students:
+                    clashes.append(Clash(date, (first.course_id, second.course_id),
+                                         (first.exam_event_id, second.exam_event_id), students))
+    clashes.sort(key=lambda clash: (-clash.students, clash.date))
+    return clashes
+
+
+def candidate_dates(start, end, weekdays=False):
+    """Every date between start and end, without weekends if asked."""
+    dates = [start + timedelta(days=day) for day in range((end - start).days + 1)]
+    return [date for date in dates if not weekdays or date.weekday() < 5]
+
+
+def propose_dates(co_enrollment, exams, dates):
+    """Greedily give every exam event a date without shared students, moving as few as possible.
+
+    Exam events of the courses with the most co-enrolled students are placed
+    first, each on its current date if it is still free of clashes, else on
+    the first candidate date that is. Returns the moves and the exam events
+    no clash-free date was found for, which keep their date.
+    """
+    degree = lambda exam: sum(co_enrollment.students(exam.course_id, other) for other in co_enrollment.neighbors[exam.course_id])
+    # Courses placed on each date so far, an exam event fits a date none of its neighbors are on
+    placed = defaultdict(set)
+    moves = []
+    unplaced = []
+    for exam in sorted(exams, key=degree, reverse=True):
+        neighbors = co_enrollment.neighbors[exam.course_id]
+        date = next((date for date in [exam.date] + dates if not neighbors & placed[date]), None)
+        if date is None:
+            unplaced.append(exam)
+            date = exam.date
+        elif date != exam.date:
+            moves.append(Move(exam.exam_event_id, exam.course_id, exam.date, date))
+        placed[date].add(exam.course_id)
+    moves.sort(key=lambda move: (move.old_date, move.exam_event_id))
+    return moves, unplaced
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find exam events on the same date sharing students, and propose dates without clashes.")
+    parser.add_argument('start', help="first date (YYYY-MM-DD)")
+    parser.add_argument('end', help="last date (YYYY-MM-DD)")
+    parser.add_argument('--propose', action='store_true', help="propose new dates for the exam events between start and end")
+    parser.add_argument('--weekdays', action='store_true', help="only propose dates from Monday to Friday")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date()
+
+    conn = psycopg2.connect(**db_params)
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+    co_enrollment = CoEnrollment(fetch_enrollment(cursor))
+    exams = fetch_exam_dates(cursor, start, end)
+    names = fetch_course_names(cursor)
+    cursor.close()
+    conn.close()
+
+    clashes = find_clashes(co_enrollment, exams)
+    for clash in clashes:
+        first, second = (names[course_id] for course_id in clash.course_ids)
+        print(f"{clash.date} {first} / {second}: {clash.students} students (exam events {clash.exam_event_ids})")
+    print(f"{len(clashes)} clashes found between {start} and {end}.")
+
+    if args.propose:
+        moves, unplaced = propose_dates(co_enrollment, exams, candidate_dates(start, end, args.weekdays))
+        for move in moves:
+            print(f"   - move exam event {move.exam_event_id} ({names[move.course_id]}) from {move.old_date} to {move.new_date}")
+        for exam in unplaced:
+            print(f"   - no date without clashes for exam event {exam.exam_event_id} ({names[exam.course_id]})")
+    return 1 if clashes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import mmap
+import array
+import shutil
+import argparse
+import psycopg2
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from database import db_params
+from generation import current_generation
+
+DEFAULT_DIR = '.column_cache'
+
+# Dates are stored as days since this day
+EPOCH = date(1970, 1, 1)
+
+# Rows fetched from the server at a time while building
+FETCH_SIZE = 50_000
+
+# Fact column -> array typecode of its file
+COLUMNS = {
+    'student_id': 'i',
+    'exam_event_id': 'i',
+    'course_id': 'i',
+    'exam_type_id': 'i',
+    'room_id': 'i',
+    'date': 'i',
+    'grade': 'd',
+}
+
+# A sorted copy of the facts per entity, the first sort column has an offset index
+ORDERS = {
+    'student': ('student_id', 'date', 'exam_event_id'),
+    'course': ('course_id', 'exam_event_id', 'student_id'),
+}
+
+FACTS_QUERY = """
+    SELECT assessment.student_id AS student_id, assessment.exam_event_id AS exam_event_id,
+           exam_event.course_id AS course_id, exam_event.exam_type_id AS exam_type_id,
+           exam_event.room_id AS room_id, exam_event.date - DATE '1970-01-01' AS date,
+           assessment.grade::FLOAT8 AS grade
+    FROM assessment
+    JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
+    ORDER BY {order};
+"""
+
+
+def enabled():
+    """The cache is opt-in with COLUMN_CACHE=1 in the environment."""
+    return (os.getenv("COLUMN_CACHE") or '').lower() in ('1', 'true', 'yes')
+
+
+def cache_dir():
+    return os.getenv("COLUMN_CACHE_DIR") or DEFAULT_DIR
+
+
+def write_order(conn, path, sort_columns):
+    """Write the facts sorted by the given columns, with the offsets of each value of the first one."""
+    os.makedirs(path)
+    files = {column: open(os.path.join(path, f"{column}.bin"), 'wb') for column in COLUMNS}
+    key_index = list(COLUMNS).index(sort_columns[0])
+    keys = array.array('i')
+    offsets = array.array('q')
+    rows = 0
+
+    try:
+        # Server-side cursor, the facts are streamed rather than held in memory
+        with conn.cursor(name='column_cache') as cursor:
+            cursor.itersize = FETCH_SIZE
+            cursor.execute(FACTS_QUERY.format(order=', '.join(sort_columns)))
+            while True:
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    break
+                columns = list(zip(*batch))
+                for (column, typecode), values in zip(COLUMNS.items(), columns):
+                    array.array(typecode, values).tofile(files[column])
+                for key in columns[key_index]:
+                    if not keys or keys[-1] != key:
+                        keys.append(key)
+                        offsets.append(rows)
+                    rows += 1
+    finally:
+        for column_file in files.values():
+            column_file.close()
+
+    offsets.append(rows)
+    with open(os.path.join(path, 'keys.bin'), 'wb') as keys_file:
+        keys.tofile(keys_file)
+    with open(os.path.join(path, 'offsets.bin'), 'wb') as offsets_file:
+        offsets.tofile(offsets_file)
+    return rows
+
+
+def build(conn, generation, directory=None):
+    """Materialize the assessment facts of a load generation and remove the older generations."""
+    directory = directory or cache_dir()
+    target = os.path.join(directory, f"generation_{generation}")
+    building = target + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    for order, sort_columns in ORDERS.items():
+        rows = write_order(conn, os.path.join(building, order), sort_columns)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT course_id, course_name FROM course;")
+        courses = dict(cursor.fetchall())
+    with open(os.path.join(building, 'meta.json'), 'w') as meta_file:
+        json.dump({'generation': generation, 'rows': rows, 'columns': COLUMNS, 'courses': courses}, meta_file)
+
+    # The finished directory replaces any other one, readers never see a partial cache
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(building, target)
+    for name in os.listdir(directory):
+        if name.startswith('generation_') and name != os.path.basename(target):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return target
+
+
+class ColumnCache:
+    """Memory-mapped column files of the assessment facts of one load generation.
+
+    Each order (by student, by course) keeps the facts sorted by its entity
+    with the sorted entity ids and their start offsets, so the facts of one
+    student or course are slices of memoryviews over the mapped files and
+    nothing is copied until the values are read.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+        self.generation = meta['generation']
+        self.rows = meta['rows']
+        self.courses = {int(course_id): name for course_id, name in meta['courses'].items()}
+        self.maps = []
+        self.orders = {}
+        for order in ORDERS:
+            files = dict(COLUMNS, keys='i', offsets='q')
+            self.orders[order] = {
+                column: self.map(os.path.join(path, order, f"{column}.bin"), typecode)
+                for column, typecode in files.items()
+            }
+
+    def map(self, path, typecode):
+        if os.path.getsize(path) == 0:
+            # Empty files can't be mapped
+            return memoryview(array.array(typecode))
+        with open(path, 'rb') as column_file:
+            mapped = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def bounds(self, order, key):
+        """Start and end offsets of the facts of an entity in an order."""
+        data = self.orders[order]
+        i = bisect_left(data['keys'], key)
+        if i == len(data['keys']) or data['keys'][i] != key:
+            return 0, 0
+        return data['offsets'][i], data['offsets'][i + 1]
+
+    def slice(self, order, key):
+        """Columns of the facts of an entity as zero-copy views."""
+        start, end = self.bounds(order, key)
+        data = self.orders[order]
+        return {column: data[column][start:end] for column in COLUMNS}
+
+    def student(self, student_id):
+        """Facts of a student, sorted by date."""
+        return self.slice('student', student_id)
+
+    def course(self, course_id):
+        """Facts of a course, sorted by exam event."""
+        return self.slice('course', course_id)
+
+    def exam_event_grades(self, course_id, exam_event_id):
+        """Grades of an exam event, a sub-slice of the facts of its course."""
+        facts = self.course(course_id)
+        start = bisect_left(facts['exam_event_id'], exam_event_id)
+        end = bisect_right(facts['exam_event_id'], exam_event_id)
+        return facts['grade'][start:end]
+
+    def course_averages(self):
+        """(course_name, average grade) of every course with grades."""
+        data = self.orders['course']
+        grades, offsets = data['grade'], data['offsets']
+        return [
+            (self.courses[course_id], sum(grades[offsets[i]:offsets[i + 1]]) / (offsets[i + 1] - offsets[i]))
+            for i, course_id in enumerate(data['keys'])
+        ]
+
+    @staticmethod
+    def date_of(days):
+        return EPOCH + timedelta(days=days)
+
+
+def open_cache(conn, generation=None, directory=None):
+    """Open the cache of the current load generation, building it first if needed."""
+    directory = directory or cache_dir()
+    if generation is None:
+        with conn.cursor() as cursor:
+            generation = current_generation(cursor)
+    path = os.path.join(directory, f"generation_{generation}")
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        path = build(conn, generation, directory)
+    return ColumnCache(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local column cache of the assessment facts.")
+    parser.add_argument('--dir', default=None, help=f"cache directory (COLUMN_CACHE_DIR, defaults to {DEFAULT_DIR})")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET search_path TO grades;")
+        cache = open_cache(conn, directory=args.dir)
+        print(f"Column cache of generation {cache.generation}: {cache.rows} assessments.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
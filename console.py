@@ -0,0 +1,139 @@
+import os
+import sys
+import shutil
+import subprocess
+from itertools import islice
+
+ENDC = '\033[0m'
+
+# Rows written to the output in one call
+BLOCK_SIZE = 1000
+
+# Rows used to compute the column widths of a table
+SAMPLE_SIZE = 200
+
+
+def use_colors(out=None):
+    """Check whether ANSI colors should be written to out (a terminal and NO_COLOR unset)."""
+    out = out or sys.stdout
+    return hasattr(out, 'isatty') and out.isatty() and 'NO_COLOR' not in os.environ
+
+
+def colorize(text, color, out=None):
+    """Wrap text in an ANSI color when writing to a terminal."""
+    if color and use_colors(out):
+        return color + text + ENDC
+    return text
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+class Renderer:
+    """Buffered writer for large listings.
+
+    Lines are collected and written in blocks of BLOCK_SIZE instead of one
+    print per line, colors are dropped when the output is not a terminal and
+    Ctrl-C stops the listing without leaving the menu. With pager=True the
+    output goes through $PAGER (less by default) when stdout is a terminal.
+    """
+
+    def __init__(self, out=None, color=None, block_size=BLOCK_SIZE, pager=False):
+        self.out = out or sys.stdout
+        self.pager = None
+        if pager and self.out is sys.stdout and sys.stdout.isatty():
+            command = os.environ.get('PAGER', 'less -R -F -X')
+            try:
+                self.pager = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, text=True)
+                self.out = self.pager.stdin
+            except OSError:
+                self.pager = None
+        self.colors = use_colors(sys.stdout) if color is None else color
+        self.block_size = block_size
+        self.block = []
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, line, color=None):
+        """Queue a line, flushing when a block is full."""
+        if color and self.colors:
+            line = color + line + ENDC
+        self.block.append(line)
+        if len(self.block) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.block:
+            try:
+                self.out.write('\n'.join(self.block) + '\n')
+                self.out.flush()
+            except BrokenPipeError:
+                # The pager was closed before the end of the listing
+                pass
+            self.written += len(self.block)
+            self.block = []
+
+    def close(self):
+        self.flush()
+        if self.pager:
+            try:
+                self.pager.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.pager.wait()
+            self.pager = None
+
+    def lines(self, lines, color=None):
+        """Write an iterable of lines, stopping cleanly on Ctrl-C. Return the number of lines written."""
+        count = 0
+        try:
+            for line in lines:
+                self.write(line, color)
+                count += 1
+        except KeyboardInterrupt:
+            self.flush()
+            self.out.write(f"(stopped after {count} rows)\n")
+        self.flush()
+        return count
+
+    def table(self, rows, columns=None, color=None, sample_size=SAMPLE_SIZE):
+        """Write rows as an aligned table, with column widths computed from the first rows."""
+        rows = iter(rows)
+        sample = [tuple(map(format_value, row)) for row in islice(rows, sample_size)]
+        if not sample:
+            return 0
+
+        widths = [0] * len(sample[0])
+        for row in [columns or ()] + sample:
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(value))
+        # The last column is not padded to avoid trailing spaces
+        template = '  '.join(f"{{:<{width}}}" for width in widths[:-1]) + ('  {}' if len(widths) > 1 else '{}')
+
+        if columns:
+            self.write(template.format(*columns), color)
+            self.write('  '.join('-' * width for width in widths), color)
+
+        def lines():
+            for row in sample:
+                yield template.format(*row)
+            for row in rows:
+                yield template.format(*map(format_value, row))
+
+        return self.lines(lines(), color)
+
+
+def needs_pager(count):
+    """Check whether a listing of count lines is taller than the terminal."""
+    return sys.stdout.isatty() and count > shutil.get_terminal_size().lines
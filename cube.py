@@ -0,0 +1,155 @@
+import sys
+import math
+import argparse
+import psycopg2
+from collections import namedtuple
+from database import db_params
+
+# Dimensions of the cube, in the order of the bits of grouping_id (highest first)
+DIMENSIONS = ('state', 'course', 'exam_type', 'month')
+
+# Dimension -> (cube column, name expression)
+COLUMNS = {
+    'state': ('state_id', 'state.state_name'),
+    'course': ('course_id', 'course.course_name'),
+    'exam_type': ('exam_type_id', 'exam_type.exam_name'),
+    'month': ('month', "to_char(grade_cube.month, 'YYYY-MM')"),
+    # Half years as in partitions.py, e.g. 2023_2
+    'term': ('month', "to_char(grade_cube.month, 'YYYY') || CASE WHEN EXTRACT(MONTH FROM grade_cube.month) < 7 THEN '_1' ELSE '_2' END"),
+}
+
+Cell = namedtuple('Cell', 'labels count average stddev min max')
+
+CUBE_QUERY = """
+    INSERT INTO grade_cube (grouping_id, state_id, course_id, exam_type_id, month, count, sum, sum_squares, min, max)
+    SELECT GROUPING(state_id, course_id, exam_type_id, month), state_id, course_id, exam_type_id, month,
+           COUNT(*), SUM(grade), SUM(grade * grade), MIN(grade), MAX(grade)
+    FROM ({facts}) facts
+    GROUP BY CUBE (state_id, course_id, exam_type_id, month)
+"""
+
+FACTS_QUERY = """
+    SELECT student.state_id, exam_event.course_id, exam_event.exam_type_id,
+           date_trunc('month', exam_event.date)::DATE AS month, assessment.grade
+    FROM assessment
+    JOIN student ON student.student_id = assessment.student_id
+    JOIN exam_event ON exam_event.exam_event_id = assessment.exam_event_id
+"""
+
+
+def install(cursor):
+    """Create an empty grade_cube table."""
+    cursor.execute(open("grade_cube.sql", "r").read())
+
+
+def rebuild(cursor):
+    """Recompute every cell of the cube from all assessments."""
+    cursor.execute("TRUNCATE grade_cube;")
+    cursor.execute(CUBE_QUERY.format(facts=FACTS_QUERY) + ";")
+    cursor.execute("ANALYZE grade_cube;")
+
+
+def apply(cursor, facts):
+    """Add (state_id, course_id, exam_type_id, exam_date, grade) tuples of new assessments to the cube.
+
+    The batch is aggregated with the same CUBE as a rebuild and merged into
+    the existing cells, so only the cells of the batch are touched.
+    """
+    if not facts:
+        return
+    columns = list(zip(*facts))
+    cursor.execute(CUBE_QUERY.format(facts="""
+        SELECT state_id, course_id, exam_type_id, date_trunc('month', exam_date)::DATE AS month, grade
+        FROM unnest(%s::INTEGER[], %s::INTEGER[], %s::INTEGER[], %s::DATE[], %s::NUMERIC[])
+            AS batch(state_id, course_id, exam_type_id, exam_date, grade)
+    """) + """
+        ON CONFLICT (grouping_id, COALESCE(state_id, 0), COALESCE(course_id, 0), COALESCE(exam_type_id, 0),
+                     COALESCE(month, DATE '1970-01-01'))
+        DO UPDATE SET
+            count = grade_cube.count + EXCLUDED.count,
+            sum = grade_cube.sum + EXCLUDED.sum,
+            sum_squares = grade_cube.sum_squares + EXCLUDED.sum_squares,
+            min = LEAST(grade_cube.min, EXCLUDED.min),
+            max = GREATEST(grade_cube.max, EXCLUDED.max);
+    """, [list(column) for column in columns])
+
+
+def grouping_id(kept):
+    """grouping_id of the cells where the kept dimensions are grouped and the others rolled up."""
+    return sum(1 << (len(DIMENSIONS) - 1 - i) for i, dimension in enumerate(DIMENSIONS) if dimension not in kept)
+
+
+def query(cursor, by=(), state_id=None, course_id=None, exam_type_id=None, term=None, month=None):
+    """Grade statistics of a slice of the cube, one Cell per value of the `by` dimensions.
+
+    `by` takes any of state, course, exam_type, month and term; the filters
+    fix a dimension to one value. Every other dimension is rolled up, and
+    terms are added up from their months.
+    """
+    filters = {'state': state_id, 'course': course_id, 'exam_type': exam_type_id, 'term': term, 'month': month}
+    filters = {dimension: value for dimension, value in filters.items() if value is not None}
+    kept = {'month' if dimension == 'term' else dimension for dimension in set(by) | set(filters)}
+
+    conditions, params = ["grade_cube.grouping_id = %s"], [grouping_id(kept)]
+    for dimension, value in filters.items():
+        if dimension == 'term':
+            conditions.append(f"{COLUMNS['term'][1]} = %s")
+        else:
+            conditions.append(f"grade_cube.{COLUMNS[dimension][0]} = %s")
+        params.append(value)
+
+    labels = [COLUMNS[dimension][1] for dimension in by]
+    cursor.execute(f"""
+        SELECT {''.join(label + ', ' for label in labels)}
+               SUM(grade_cube.count)::BIGINT, SUM(grade_cube.sum), SUM(grade_cube.sum_squares),
+               MIN(grade_cube.min), MAX(grade_cube.max)
+        FROM grade_cube
+        LEFT JOIN state ON state.state_id = grade_cube.state_id
+        LEFT JOIN course ON course.course_id = grade_cube.course_id
+        LEFT JOIN exam_type ON exam_type.exam_type_id = grade_cube.exam_type_id
+        WHERE {' AND '.join(conditions)}
+        {'GROUP BY ' + ', '.join(labels) if labels else ''}
+        {'ORDER BY ' + ', '.join(labels) if labels else ''};
+    """, params)
+
+    cells = []
+    for row in cursor.fetchall():
+        count, total, squares, minimum, maximum = row[len(labels):]
+        if not count:
+            continue
+        average = float(total) / count
+        # Sample standard deviation, like stddev() in PostgreSQL
+        variance = (float(squares) - float(total) * average) / (count - 1) if count > 1 else 0.0
+        cells.append(Cell(row[:len(labels)], count, average, math.sqrt(max(variance, 0.0)), minimum, maximum))
+    return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or query the grade rollup cube.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help="recompute the cube from all assessments")
+    show = subparsers.add_parser('query', help="print a slice of the cube")
+    show.add_argument('--by', nargs='*', default=[], choices=list(COLUMNS))
+    show.add_argument('--term')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**db_params)
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+    try:
+        if args.command == 'rebuild':
+            rebuild(cursor)
+            conn.commit()
+            print("Grade cube rebuilt.")
+            return 0
+        for cell in query(cursor, args.by, term=args.term):
+            print(f"{' / '.join(str(label) for label in cell.labels) or 'All'}: {cell.count} grades, "
+                  f"average {cell.average:.2f}, stddev {cell.stddev:.2f}, min {cell.min}, max {cell.max}")
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import itertools
+import psycopg2
+from psycopg2.extensions import parse_dsn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database connection parameters
+db_params = {
+    'host': os.getenv("HOST"),
+    'port': os.getenv("PORT"),
+    'database': os.getenv("DATABASE"),
+    'user': os.getenv("DB_USER"),
+    'password':os.getenv("DB_PASS")
+}
+
+# Seconds between two health checks of the servers
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL") or 30)
+
+# Seconds to wait for a server to accept a connection
+CONNECT_TIMEOUT = 3
+
+BALANCING = ('round_robin', 'least_latency')
+
+
+def replica_dsns():
+    """Read-only replica DSNs, comma separated in REPLICAS (e.g. "host=replica1 port=5432 dbname=grades")."""
+    return [dsn.strip() for dsn in (os.getenv("REPLICAS") or '').split(',') if dsn.strip()]
+
+
+class Node:
+    """A database server with the results of its last health check."""
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.healthy = True
+        self.latency = None
+        self.generation = None
+        self.error = None
+        # Kept open to read the generation of the primary before every read
+        self.conn = None
+
+    def read_generation(self, cursor):
+        cursor.execute("SELECT to_regclass('grades.load_generation') IS NOT NULL;")
+        self.generation = None
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT generation FROM grades.load_generation;")
+            row = cursor.fetchone()
+            self.generation = row[0] if row else None
+        return self.generation
+
+    def fail(self, error):
+        self.healthy = False
+        self.error = str(error).strip()
+
+    def check(self):
+        """Connect, read the load generation and time it."""
+        start = time.perf_counter()
+        try:
+            conn = psycopg2.connect(**dict(self.params, connect_timeout=CONNECT_TIMEOUT))
+            try:
+                with conn.cursor() as cursor:
+                    self.read_generation(cursor)
+            finally:
+                conn.close()
+        except psycopg2.Error as error:
+            self.fail(error)
+            return False
+
+        elapsed = time.perf_counter() - start
+        # Smoothed so that one slow check doesn't move every read
+        self.latency = elapsed if self.latency is None else 0.7 * self.latency + 0.3 * elapsed
+        self.healthy = True
+        self.error = None
+        return True
+
+    def current_generation(self):
+        """Read the load generation now, on the connection kept for it, None when the server is down."""
+        try:
+            if self.conn is None or self.conn.closed:
+                self.conn = psycopg2.connect(**dict(self.params, connect_timeout=CONNECT_TIMEOUT))
+                self.conn.autocommit = True
+            with self.conn.cursor() as cursor:
+                return self.read_generation(cursor)
+        except psycopg2.Error as error:
+            self.close()
+            self.fail(error)
+            return None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Router:
+    """Send writes to the primary and reads to the replicas.
+
+    The servers are health checked at most every HEALTH_CHECK_INTERVAL
+    seconds. Reads go to the healthy replicas that have replayed the last
+    load, i.e. that have the same load generation as the primary, either in
+    turn or to the fastest one. The generation of the primary is read again
+    for every read connection, a replica checked before a load never serves
+    reads after it. When no replica has caught up (right after a
+    load) reads fall back to the primary, so they never see older data than
+    the primary.
+    """
+
+    def __init__(self, primary=None, replicas=None, balancing=None):
+        self.primary = Node('primary', primary or db_params)
+        dsns = replica_dsns() if replicas is None else replicas
+        self.replicas = [Node(f"replica {i}", parse_dsn(dsn)) for i, dsn in enumerate(dsns, 1)]
+        self.balancing = balancing or os.getenv("LOAD_BALANCING") or 'round_robin'
+        if self.balancing not in BALANCING:
+            raise ValueError(f"Unknown balancing '{self.balancing}', use one of {', '.join(BALANCING)}.")
+        self.turn = itertools.count()
+        self.checked_at = None
+
+    def check(self, force=False):
+        """Health check every server, unless they were checked recently."""
+        if not force and self.checked_at is not None and time.monotonic() - self.checked_at < HEALTH_CHECK_INTERVAL:
+            return
+        self.checked_at = time.monotonic()
+        for node in [self.primary] + self.replicas:
+            node.check()
+
+    def read_node(self):
+        """The server for the next read-only connection."""
+        if not self.replicas:
+            return self.primary
+        self.check()
+        current = [replica for replica in self.replicas if replica.healthy]
+        generation = self.primary.current_generation()
+        if self.primary.healthy:
+            current = [replica for replica in current if replica.generation == generation]
+        if not current:
+            return self.primary
+        if self.balancing == 'least_latency':
+            return min(current, key=lambda replica: replica.latency)
+        return current[next(self.turn) % len(current)]
+
+    def connect_read(self, **kwargs):
+        """Connection for read-only queries, on a replica when one is up to date."""
+        node = self.read_node()
+        try:
+            return psycopg2.connect(**node.params, **kwargs)
+        except psycopg2.Error:
+            if node is self.primary:
+                raise
+            # Skip it until the next health check
+            node.healthy = False
+            return self.connect_read(**kwargs)
+
+    def connect_write(self, **kwargs):
+        """Connection for writes, always on the primary."""
+        return psycopg2.connect(**self.primary.params, **kwargs)
+
+    def nodes(self):
+        return [self.primary] + self.replicas
+
+    def close(self):
+        self.primary.close()
+
+
+def main():
+    router = Router()
+    router.check(force=True)
+    for node in router.nodes():
+        if not node.healthy:
+            state = node.error
+        elif node.latency is None:
+            state = "not checked"
+        else:
+            state = f"{node.latency * 1000:.1f} ms, load generation {node.generation}"
+        print(f"{node.name}: {'up' if node.healthy else 'down'} ({state})")
+    print(f"Reads go to: {router.read_node().name} ({router.balancing})")
+    router.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import os
+import math
+import shutil
+import hashlib
+import tempfile
+from validation import as_text
+from checkpoint import POSITION
+
+# Natural key of a row: the student and the exam event (date, course, exam type, room)
+KEY_FIELDS = ('email', 'exam_date', 'course_name', 'exam_name', 'room_name')
+
+DIGEST_SIZE = 16
+
+# Distinct keys kept in memory before switching to the Bloom filter and the spill files
+EXACT_LIMIT = 2_000_000
+
+# Keys and false positive rate the Bloom filter is sized for, more keys only mean more candidates
+BLOOM_CAPACITY = 20_000_000
+BLOOM_ERROR_RATE = 0.01
+
+# Spill files, the keys of one of them are counted in memory at a time
+BUCKETS = 64
+
+MODES = ('drop', 'merge', 'off')
+
+
+def row_key(row):
+    """Digest of the natural key of a row."""
+    values = [as_text(row.get(field)) for field in KEY_FIELDS]
+    values[0] = values[0].lower()
+    return hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+class BloomFilter:
+    """Bit array answering whether a digest may have been added before."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, digest):
+        # Double hashing on the two halves of the digest
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, digest):
+        """Add a digest and return whether it may have been added before."""
+        present = True
+        for position in self.positions(digest):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                present = False
+                self.bits[position >> 3] |= mask
+        return present
+
+
+class DuplicateCounter:
+    """Count the rows sharing a natural key, exactly, in bounded memory.
+
+    Keys are kept in a set up to EXACT_LIMIT. Past that the set is replaced
+    by a Bloom filter and every key is appended to one of BUCKETS spill
+    files. Keys the filter may have seen before are candidates, and their
+    exact counts are taken from the spill files one bucket at a time.
+    """
+
+    def __init__(self, exact_limit=EXACT_LIMIT):
+        self.exact_limit = exact_limit
+        self.seen = set()
+        self.counts = {}
+        self.bloom = None
+        self.candidates = set()
+        self.directory = None
+        self.spill_files = []
+
+    def add(self, digest):
+        if self.bloom is None:
+            if digest in self.seen:
+                self.counts[digest] = self.counts.get(digest, 1) + 1
+                return
+            self.seen.add(digest)
+            if len(self.seen) > self.exact_limit:
+                self.start_spilling()
+            return
+
+        if self.bloom.add(digest):
+            self.candidates.add(digest)
+        self.spill_files[digest[0] % BUCKETS].write(digest)
+
+    def start_spilling(self):
+        self.directory = tempfile.mkdtemp(prefix='dedup_')
+        self.spill_files = [open(os.path.join(self.directory, f"{i:03d}.keys"), 'wb') for i in range(BUCKETS)]
+        self.bloom = BloomFilter(max(BLOOM_CAPACITY, 10 * self.exact_limit), BLOOM_ERROR_RATE)
+        for digest in self.seen:
+            self.bloom.add(digest)
+            self.spill_files[digest[0] % BUCKETS].write(digest * self.counts.get(digest, 1))
+        self.candidates = set(self.counts)
+        self.seen = set()
+        self.counts = {}
+
+    def duplicates(self):
+        """Number of rows of every key seen more than once."""
+        if self.bloom is None:
+            return self.counts
+
+        counts = {}
+        try:
+            for spill_file in self.spill_files:
+                spill_file.close()
+                with open(spill_file.name, 'rb') as keys:
+                    data = keys.read()
+                for start in range(0, len(data), DIGEST_SIZE):
+                    digest = data[start:start + DIGEST_SIZE]
+                    if digest in self.candidates:
+                        counts[digest] = counts.get(digest, 0) + 1
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        return {digest: count for digest, count in counts.items() if count > 1}
+
+
+def count_duplicates(rows, exact_limit=EXACT_LIMIT):
+    """First pass over the rows, returning the number of rows of every duplicated key."""
+    counter = DuplicateCounter(exact_limit)
+    for row in rows:
+        counter.add(row_key(row))
+    return counter.duplicates()
+
+
+class Deduplicator:
+    """Remove the duplicated rows found by count_duplicates from the row stream.
+
+    In drop mode the first row of a key is kept. In merge mode the rows of a
+    key are held until its last one, which is emitted with the values of the
+    later rows overriding the earlier ones (empty values don't override).
+
+    A resumed load replays the rows it loaded before its checkpoint, up to
+    row number replayed: they rebuild the kept and pending keys, so the
+    rows after the checkpoint are deduplicated as in a load without
+    interruption, but are neither yielded nor counted again.
+    """
+
+    def __init__(self, mode, counts):
+        self.mode = mode
+        self.counts = counts
+        self.removed = 0
+
+    def rows(self, rows, replayed=0):
+        kept = set()
+        pending = {}
+        for row in rows:
+            loaded = row[POSITION][1] <= replayed
+            digest = row_key(row)
+            total = self.counts.get(digest)
+            if total is None:
+                if not loaded:
+                    yield row
+                continue
+
+            if self.mode == 'drop':
+                if digest in kept:
+                    self.removed += not loaded
+                    continue
+                kept.add(digest)
+                if not loaded:
+                    yield row
+                continue
+
+            merged, seen = pending.pop(digest, ({}, 0))
+            merged.update((field, value) for field, value in row.items() if as_text(value))
+            if seen + 1 < total:
+                pending[digest] = (merged, seen + 1)
+                self.removed += not loaded
+                continue
+            # The merged row has the position of the last row of its key
+            if not loaded:
+                yield merged
@@ -0,0 +1,28 @@
+SET SEARCH_PATH TO grades;
+
+-- Denormalized read model of the exam events with their course, exam type,
+-- room and building names and assessment totals, so that the exam event and
+-- course screens don't repeat the joins. Kept current by the loader through
+-- read_model.py.
+DROP TABLE IF EXISTS exam_event_summary;
+
+CREATE TABLE exam_event_summary (
+    exam_event_id INTEGER PRIMARY KEY,
+    date DATE NOT NULL,
+    exam_type_id INTEGER NOT NULL,
+    exam_name TEXT NOT NULL,
+    course_id INTEGER NOT NULL,
+    course_name TEXT NOT NULL,
+    room_id INTEGER NOT NULL,
+    room_name TEXT NOT NULL,
+    building_id INTEGER NOT NULL,
+    building_name TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    assessment_count INTEGER NOT NULL DEFAULT 0,
+    grade_sum NUMERIC NOT NULL DEFAULT 0,
+    average_grade NUMERIC GENERATED ALWAYS AS (grade_sum / NULLIF(assessment_count, 0)) STORED
+);
+
+CREATE INDEX ON exam_event_summary (date);
+CREATE INDEX ON exam_event_summary (course_id, date);
+CREATE INDEX ON exam_event_summary (course_name);
@@ -0,0 +1,20 @@
+def install(cursor):
+    """Create the load_generation table if it doesn't exist yet."""
+    cursor.execute(open("load_generation.sql", "r").read())
+
+
+def bump_generation(cursor):
+    """Start a new load generation and return its number."""
+    cursor.execute("""
+        UPDATE load_generation
+        SET generation = generation + 1, loaded_at = now()
+        RETURNING generation;
+    """)
+    return cursor.fetchone()[0]
+
+
+def current_generation(cursor):
+    """Number of the last load."""
+    cursor.execute("SELECT generation FROM load_generation;")
+    row = cursor.fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,174 @@
+import sys
+import json
+import argparse
+import psycopg2
+from bisect import bisect_right
+from collections import defaultdict
+from database import db_params
+
+CONFIG_FILE = 'gpa_config.json'
+
+# Differences below this are rounding noise between the incremental and the full computation
+TOLERANCE = 1e-6
+
+
+def load_config(path=CONFIG_FILE):
+    """Read the grade to points mapping and the exam type weights."""
+    with open(path, 'r') as config_file:
+        return json.load(config_file)
+
+
+class GpaEngine:
+    """Derive GPAs from assessment grades.
+
+    Every grade is mapped to points on the configured scale and weighted by its
+    exam type. The student_gpa table keeps, per student, the running sums of
+    weighted points and weights, so a batch of new assessments only touches
+    the students it contains.
+    """
+
+    def __init__(self, config=None):
+        config = config or load_config()
+        scale = sorted((float(minimum), float(points)) for minimum, points in config['grade_points'])
+        self.minimums = [minimum for minimum, _ in scale]
+        self.points_scale = [points for _, points in scale]
+        self.exam_weights = {name: float(weight) for name, weight in config.get('exam_weights', {}).items()}
+        self.default_weight = float(config.get('default_weight', 1.0))
+
+    def points(self, grade):
+        """Grade points of a grade, 0 below the lowest step of the scale."""
+        # Grades are stored as NUMERIC(5, 2), round the same way before comparing
+        i = bisect_right(self.minimums, round(float(grade), 2)) - 1
+        return self.points_scale[i] if i >= 0 else 0.0
+
+    def weight(self, exam_name):
+        return self.exam_weights.get(exam_name, self.default_weight)
+
+    def sums(self, assessments):
+        """Aggregate (student_id, exam_name, grade) tuples into per-student (points, weight, count) sums."""
+        sums = defaultdict(lambda: [0.0, 0.0, 0])
+        for student_id, exam_name, grade in assessments:
+            weight = self.weight(exam_name)
+            total = sums[student_id]
+            total[0] += self.points(grade) * weight
+            total[1] += weight
+            total[2] += 1
+        return sums
+
+    def apply(self, cursor, assessments):
+        """Add a batch of new assessments to the running sums of their students."""
+        sums = self.sums(assessments)
+        if not sums:
+            return 0
+        student_ids = list(sums)
+        cursor.execute("""
+            INSERT INTO student_gpa (student_id, weighted_points, total_weight, assessments)
+            SELECT * FROM unnest(%s::INTEGER[], %s::NUMERIC[], %s::NUMERIC[], %s::INTEGER[])
+            ON CONFLICT (student_id) DO UPDATE SET
+                weighted_points = student_gpa.weighted_points + EXCLUDED.weighted_points,
+                total_weight = student_gpa.total_weight + EXCLUDED.total_weight,
+                assessments = student_gpa.assessments + EXCLUDED.assessments;
+        """, (
+            student_ids,
+            [sums[student_id][0] for student_id in student_ids],
+            [sums[student_id][1] for student_id in student_ids],
+            [sums[student_id][2] for student_id in student_ids],
+        ))
+        return len(student_ids)
+
+    def case_sql(self):
+        """SQL expressions (and their parameters) for the points and the weight of an assessment row."""
+        points = "CASE " + " ".join("WHEN grade >= %s THEN %s" for _ in self.minimums[::-1]) + " ELSE 0 END"
+        points_params = [value for pair in zip(self.minimums[::-1], self.points_scale[::-1]) for value in pair]
+        weight = "COALESCE((%s::JSONB ->> exam_type.exam_name)::NUMERIC, %s)"
+        weight_params = [json.dumps(self.exam_weights), self.default_weight]
+        return points, points_params, weight, weight_params
+
+    def full_sums(self, cursor):
+        """Compute the sums of every student from all assessments."""
+        points, points_params, weight, weight_params = self.case_sql()
+        cursor.execute(f"""
+            SELECT assessment.student_id, SUM(({points}) * {weight}), SUM({weight}), COUNT(*)
+            FROM assessment
+            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
+            JOIN exam_type ON exam_event.exam_type_id = exam_type.exam_type_id
+            GROUP BY assessment.student_id;
+        """, points_params + weight_params + weight_params)
+        return {row[0]: (float(row[1]), float(row[2]), row[3]) for row in cursor.fetchall()}
+
+    def verify(self, cursor):
+        """Compare the running sums with a full computation and return the students that differ."""
+        expected = self.full_sums(cursor)
+        cursor.execute("SELECT student_id, weighted_points, total_weight, assessments FROM student_gpa;")
+        actual = {row[0]: (float(row[1]), float(row[2]), row[3]) for row in cursor.fetchall()}
+
+        mismatches = []
+        for student_id in expected.keys() | actual.keys():
+            want = expected.get(student_id, (0.0, 0.0, 0))
+            got = actual.get(student_id, (0.0, 0.0, 0))
+            if want[2] != got[2] or abs(want[0] - got[0]) > TOLERANCE or abs(want[1] - got[1]) > TOLERANCE:
+                mismatches.append((student_id, want, got))
+        return mismatches
+
+    def rebuild(self, cursor):
+        """Replace the running sums with a full computation from all assessments."""
+        sums = self.full_sums(cursor)
+        cursor.execute("TRUNCATE student_gpa;")
+        student_ids = list(sums)
+        cursor.execute("""
+            INSERT INTO student_gpa (student_id, weighted_points, total_weight, assessments)
+            SELECT * FROM unnest(%s::INTEGER[], %s::NUMERIC[], %s::NUMERIC[], %s::INTEGER[]);
+        """, (
+            student_ids,
+            [sums[student_id][0] for student_id in student_ids],
+            [sums[student_id][1] for student_id in student_ids],
+            [sums[student_id][2] for student_id in student_ids],
+        ))
+        return len(student_ids)
+
+
+def install(cursor):
+    """Create an empty student_gpa table."""
+    cursor.execute(open("gpa.sql", "r").read())
+
+
+def derived_gpa(cursor, student_id):
+    """Return the GPA derived from the assessments of a student, None if they have none."""
+    cursor.execute("""
+        SELECT weighted_points / NULLIF(total_weight, 0)
+        FROM student_gpa
+        WHERE student_id = %s;
+    """, (student_id,))
+    row = cursor.fetchone()
+    return float(row[0]) if row and row[0] is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or verify the GPAs derived from assessments.")
+    parser.add_argument('command', choices=('verify', 'rebuild'))
+    parser.add_argument('--config', default=CONFIG_FILE)
+    args = parser.parse_args()
+
+    engine = GpaEngine(load_config(args.config))
+    conn = psycopg2.connect(**db_params)
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+    try:
+        if args.command == 'verify':
+            mismatches = engine.verify(cursor)
+            for student_id, want, got in mismatches:
+                print(f"Student {student_id}: expected {want}, running sums {got}")
+            print(f"{len(mismatches)} students differ from a full rebuild.")
+            return 1 if mismatches else 0
+
+        count = engine.rebuild(cursor)
+        conn.commit()
+        print(f"Rebuilt the GPA of {count} students.")
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+SET SEARCH_PATH TO grades;
+
+-- Running sums of the weighted grade points of each student, maintained by
+-- gpa.py while loading. The derived GPA is weighted_points / total_weight.
+DROP TABLE IF EXISTS student_gpa;
+
+CREATE TABLE student_gpa (
+    student_id INTEGER PRIMARY KEY,
+    weighted_points NUMERIC NOT NULL,
+    total_weight NUMERIC NOT NULL,
+    assessments INTEGER NOT NULL
+);
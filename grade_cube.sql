@@ -0,0 +1,27 @@
+SET SEARCH_PATH TO grades;
+
+-- Rollup cube of the assessment grades by home state, course, exam type and
+-- exam month, with every GROUPING SETS subtotal of the four dimensions. A
+-- NULL dimension is rolled up, grouping_id tells which ones (GROUPING() of
+-- state, course, exam type and month, state being the highest bit). Terms
+-- are answered by adding up their months. Maintained by cube.py.
+DROP TABLE IF EXISTS grade_cube;
+
+CREATE TABLE grade_cube (
+    grouping_id INTEGER NOT NULL,
+    state_id INTEGER,
+    course_id INTEGER,
+    exam_type_id INTEGER,
+    month DATE,
+    count BIGINT NOT NULL,
+    sum NUMERIC NOT NULL,
+    sum_squares NUMERIC NOT NULL,
+    min NUMERIC NOT NULL,
+    max NUMERIC NOT NULL
+);
+
+-- One row per cell, rolled up dimensions included
+CREATE UNIQUE INDEX grade_cube_cell ON grade_cube (
+    grouping_id, COALESCE(state_id, 0), COALESCE(course_id, 0), COALESCE(exam_type_id, 0),
+    COALESCE(month, DATE '1970-01-01')
+);
@@ -1,4 +1,4 @@
-import os
+import argparse
 import psycopg2
 import psycopg2.extras
 from pydantic import BaseModel
@@ -7,6 +7,23 @@ from datetime import datetime, date
 from dotenv import load_dotenv
 import matplotlib.pyplot as plt
 from functools import wraps
+from scheduling import build_schedule
+import clashes
+from itertools import chain, islice
+from console import BLOCK_SIZE, Renderer, colorize, needs_pager
+from gpa import derived_gpa
+import ranking
+import cube
+import binning
+import approximate
+from cancellable import CancellableCursor, QueryCancelled, statement_timeouts
+from prefetch import Prefetcher
+from database import Router
+from column_cache import ColumnCache, open_cache, enabled as column_cache_enabled
+from generation import current_generation
+from autocomplete import Names, complete_input
+from profiling import Profiler
+from partitions import is_partitioned
 
 load_dotenv()
 
@@ -75,11 +92,11 @@ class RoomModel(BaseModel):
         return f"{self.room_name}"
     
     def print_details(self):
-        print(bcolors.OKGREEN + f" - {self.room_name}:" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f"   - Capacity: {self.capacity}" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f"   - Has projector: {'Yes' if self.has_projector else 'No'}" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f"   - Has computers: {'Yes' if self.has_computers else 'No'}" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f"   - Is accessible: {'Yes' if self.is_accessible else 'No'}" + bcolors.ENDC)
+        print(colorize(f" - {self.room_name}:", bcolors.OKGREEN))
+        print(colorize(f"   - Capacity: {self.capacity}", bcolors.OKGREEN))
+        print(colorize(f"   - Has projector: {'Yes' if self.has_projector else 'No'}", bcolors.OKGREEN))
+        print(colorize(f"   - Has computers: {'Yes' if self.has_computers else 'No'}", bcolors.OKGREEN))
+        print(colorize(f"   - Is accessible: {'Yes' if self.is_accessible else 'No'}", bcolors.OKGREEN))
 
 class ExamEventModel(BaseModel):
     exam_event_id: int
@@ -89,24 +106,36 @@ class ExamEventModel(BaseModel):
     room_id: int
     course_name: Optional[str] = None
     exam_name: Optional[str] = None
+    room_name: Optional[str] = None
+    building_name: Optional[str] = None
+    capacity: Optional[int] = None
+    assessment_count: Optional[int] = None
+    average_grade: Optional[float] = None
     def __str__(self):
         return f"Exam Event ID: {self.exam_event_id}, Exam Name: {self.exam_name}, Date: {self.date}, Course Name: {self.course_name}, Room ID: {self.room_id}"
 
     def print_details(self):
         print(self.course_name)
         print(self.exam_name)
-        print(bcolors.OKGREEN + f" - Exam Event ID: {self.exam_event_id}" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f" - Date: {self.date}" + bcolors.ENDC)
+        print(colorize(f" - Exam Event ID: {self.exam_event_id}", bcolors.OKGREEN))
+        print(colorize(f" - Date: {self.date}", bcolors.OKGREEN))
         if self.exam_name:
-            print(bcolors.OKGREEN + f" - Exam Type Name: {self.exam_name}" + bcolors.ENDC)
+            print(colorize(f" - Exam Type Name: {self.exam_name}", bcolors.OKGREEN))
         else:
-            print(bcolors.OKGREEN + f" - Exam Type ID: {self.exam_type_id}" + bcolors.ENDC)
+            print(colorize(f" - Exam Type ID: {self.exam_type_id}", bcolors.OKGREEN))
         
         if self.course_name:
-            print(bcolors.OKGREEN + f" - Course Name: {self.course_name}" + bcolors.ENDC)
+            print(colorize(f" - Course Name: {self.course_name}", bcolors.OKGREEN))
         else:
-            print(bcolors.OKGREEN + f" - Course ID: {self.course_id}" + bcolors.ENDC)
-        print(bcolors.OKGREEN + f" - Room ID: {self.room_id}" + bcolors.ENDC)
+            print(colorize(f" - Course ID: {self.course_id}", bcolors.OKGREEN))
+        if self.room_name:
+            print(colorize(f" - Room: {self.room_name} ({self.building_name}, capacity {self.capacity})", bcolors.OKGREEN))
+        else:
+            print(colorize(f" - Room ID: {self.room_id}", bcolors.OKGREEN))
+        if self.assessment_count is not None:
+            print(colorize(f" - Assessments: {self.assessment_count}", bcolors.OKGREEN))
+        if self.average_grade is not None:
+            print(colorize(f" - Average Grade: {self.average_grade:.2f}", bcolors.OKGREEN))
 
 class EnrollmentModel(BaseModel):
     student_id: int
@@ -125,26 +154,40 @@ def enter_to_continue(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         result = func(self, *args, **kwargs)
-        input("Press enter to continue...")
+        # The wait for the user isn't part of the profile of the action
+        with Menu.profiler.paused():
+            input("Press enter to continue...")
         return result
 
     return wrapper
 
 
 class Menu:
-    # Database connection parameters
-    db_params = {
-        'host': os.getenv("HOST"),
-        'port': os.getenv("PORT"),
-        'database': os.getenv("DATABASE"),
-        'user': os.getenv("DB_USER"),
-        'password':os.getenv("DB_PASS")
-    }
+    # The menus only read, their connections go to the replicas when there are any
+    router = Router()
+    # Background queries of the session, shared by all menus
+    prefetcher: Prefetcher = None
+    # Local memory-mapped assessment facts, opt-in with COLUMN_CACHE=1
+    facts_cache: ColumnCache = None
+    # Course, building, room, exam type and state names, searched locally
+    names: Names = None
+    # Answer the large aggregates from a sample of the assessments, toggled from the main menu
+    approximate_mode = approximate.enabled()
+    # Python side profiles per menu action, enabled with --profile
+    profiler = Profiler()
+    # Extra condition of the assessment to exam_event joins, set when the tables are partitioned by term
+    pruning = ""
+
+    # Statement timeouts in milliseconds, the default and per action name
+    default_timeout, action_timeouts = statement_timeouts()
+
     def connect_to_database(self):
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = self.router.connect_read(cursor_factory=CancellableCursor)
             cursor = conn.cursor(cursor_factory = psycopg2.extras.RealDictCursor)
             cursor.execute("SET search_path TO grades") 
+            # Commit so that rolling back after a cancelled query keeps the search path
+            conn.commit()
             return conn
         except psycopg2.Error as e:
             self.print(f"Error connecting to the Database: {e}", bcolors.FAIL)
@@ -158,8 +201,104 @@ class Menu:
     def print(self, text="", color=bcolors.OKGREEN):
         if isinstance(text, BaseModel):
             text = text.__str__()
-        print(color + text + bcolors.ENDC)
+        print(colorize(text, color))
+
+    def fetchall(self, query, params=None):
+        """Run a query and return its rows, from the session when it was prefetched."""
+        if Menu.prefetcher:
+            return Menu.prefetcher.fetchall(self.cursor, query, params)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def sql(self, query):
+        """A query joining assessment and exam_event, with the {pruning} condition of the schema filled in.
+
+        Partitioned tables are joined on the exam date too, so that the
+        planner only reads the matching term partitions of both tables.
+        """
+        return query.format(pruning=Menu.pruning)
+
+    def prefetch(self, queries):
+        """Start the (action, query, params) of the next screens in the background.
+
+        Each query gets the statement timeout of the action that reads it.
+        """
+        if Menu.prefetcher:
+            Menu.prefetcher.sync(self.cursor)
+            Menu.prefetcher.prefetch([(query, params, self.statement_timeout(action.__name__))
+                                      for action, query, params in queries])
+
+    def cached_facts(self):
+        """The local column cache of the current load, None when it is disabled."""
+        if not column_cache_enabled():
+            return None
+        generation = current_generation(self.cursor)
+        if Menu.facts_cache is None or Menu.facts_cache.generation != generation:
+            self.print(f"Opening the local column cache of load {generation}...", bcolors.OKCYAN)
+            Menu.facts_cache = open_cache(self.connection, generation)
+        return Menu.facts_cache
+
+    def ask_name(self, prompt, kind):
+        """Ask for a name of a kind, with tab completion and suggestions when it doesn't exist."""
+        if Menu.names is None:
+            Menu.names = Names()
+        index = Menu.names.index(self.cursor, kind)
+        text = complete_input(prompt, index).strip()
+        if not text:
+            return text
+        name = index.find(text)
+        if name:
+            return name
+
+        suggestions = index.suggest(text)
+        if not suggestions:
+            return text
+        self.print(f"No exact match for '{text}', did you mean:", bcolors.WARNING)
+        for i, suggestion in enumerate(suggestions, 1):
+            self.print(f"[{i}] {suggestion}")
+        choice = input("Select a name by number (empty to keep yours): ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+            return suggestions[int(choice) - 1]
+        return text
+
+    def render_rooms(self, rooms):
+        """Write room rows (room_id, room_name, building_id, capacity, features...) as a table."""
+        yes_no = lambda value: 'Yes' if value else 'No'
+        self.render(
+            ((room[1], room[3], yes_no(room[4]), yes_no(room[5]), yes_no(room[6])) for room in rooms),
+            ('Room', 'Capacity', 'Has projector', 'Has computers', 'Is accessible')
+        )
+
+    def render_cells(self, cells, columns):
+        """Write grade statistics of the rollup cube, labelled with the given columns."""
+        self.render(
+            (tuple(cell.labels) + (cell.count, f"{cell.average:.2f}", f"{cell.stddev:.2f}", cell.min, cell.max) for cell in cells),
+            tuple(columns) + ('Grades', 'Average', 'Std dev', 'Min', 'Max')
+        )
+
+    def plot_histogram(self, edges, counts, **style):
+        """Draw a histogram from bin edges and counts."""
+        plt.hist(edges[:-1], bins=edges, weights=counts, **style)
 
+    def render(self, rows, columns=None, color=bcolors.OKGREEN):
+        """Write rows as an aligned table in buffered blocks, through the pager when taller than the terminal.
+
+        rows can be a list, an iterator or a cursor. The first BLOCK_SIZE
+        rows are read to decide on the pager, the others as they are written.
+        """
+        rows = iter(rows)
+        first = list(islice(rows, BLOCK_SIZE))
+        with Renderer(pager=needs_pager(len(first))) as renderer:
+            return renderer.table(chain(first, rows), columns, color)
+
+
+    def statement_timeout(self, action):
+        """Statement timeout configured for an action (0 disables it)."""
+        return self.action_timeouts.get(action, self.default_timeout)
+
+    def set_statement_timeout(self, action):
+        """Apply the statement timeout configured for an action."""
+        self.cursor.execute("SET statement_timeout = %s", (self.statement_timeout(action),))
 
     def exit(self):
         """Exit Menu"""
@@ -191,18 +330,76 @@ class Menu:
             '3': Building().menu,
             '4': Room().menu,
             '5': ExamEvent().menu,
+            '6': self.show_statistics,
+            '7': Rollup().menu,
+            '8': self.toggle_approximate,
         }
         retorno = self.print_menu(options)
         return retorno
     
     
+    @enter_to_continue
+    def toggle_approximate(self):
+        """Switch the approximate mode on or off."""
+        Menu.approximate_mode = not Menu.approximate_mode
+        if Menu.approximate_mode:
+            self.print("Approximate mode on: grades by course and room utilization are estimated from a sample.")
+        else:
+            self.print("Approximate mode off: every answer is exact.")
+        return self.initial_menu
+
+    def sampled(self, by):
+        """Estimates of a grouping from a sample of the assessments, with the sample percentage."""
+        percent, estimates = approximate.estimate(self.cursor, by)
+        self.print(f"Estimated from a {percent:.2f}% sample of the assessments, the error bars are 95% confidence intervals.", bcolors.OKCYAN)
+        return percent, estimates
+
+    @enter_to_continue
+    def show_statistics(self):
+        """Show session statistics."""
+        prefetcher = Menu.prefetcher
+        if prefetcher:
+            self.print(f"Prefetch: {prefetcher.hits} hits, {prefetcher.misses} misses ({prefetcher.hit_rate():.0%} hit rate)")
+        else:
+            self.print("Prefetch is disabled.", bcolors.WARNING)
+        # Without replicas every read goes to the primary, there is nothing to show
+        for node in self.router.nodes() if self.router.replicas else []:
+            if node.healthy:
+                latency = f", {node.latency * 1000:.1f} ms" if node.latency is not None else ""
+                self.print(f"{node.name}: up (load generation {node.generation}{latency})")
+            else:
+                self.print(f"{node.name}: down ({node.error})", bcolors.FAIL)
+        return self.initial_menu
+
     def run(self):
         """Run main menu."""
+        try:
+            Menu.prefetcher = Prefetcher(self.router)
+        except psycopg2.Error as e:
+            self.print(f"Prefetch disabled: {e}", bcolors.WARNING)
+        if is_partitioned(self.cursor):
+            Menu.pruning = "AND assessment.exam_date = exam_event.date"
+
         func = self.initial_menu
         while True:
-            last_func = func()
+            # Actions are bound to the menu (and connection) of their entity
+            owner = getattr(func, '__self__', self)
+            try:
+                owner.set_statement_timeout(func.__name__)
+                # Keyed by the label of the action in the menus
+                with self.profiler.section(func.__doc__ or func.__name__):
+                    last_func = func()
+            except QueryCancelled as cancelled:
+                owner.connection.rollback()
+                self.print(str(cancelled), bcolors.WARNING)
+                last_func = owner.menu if hasattr(owner, 'menu') else self.initial_menu
 
             if last_func.__doc__ == self.exit.__doc__:
+                if Menu.prefetcher:
+                    self.print(f"Prefetch hit rate: {Menu.prefetcher.hit_rate():.0%}", bcolors.OKCYAN)
+                    Menu.prefetcher.close()
+                self.router.close()
+                self.profiler.write()
                 self.print("Bye!", bcolors.OKGREEN)
                 break
             if last_func:
@@ -218,6 +415,33 @@ class Student(Menu):
 
     """Student menu."""
     student: StudentModel = None
+
+    # Queries of the screens of a selected student, also run ahead by the prefetcher
+    COURSES_QUERY = """
+            SELECT course.course_name
+            FROM course
+            JOIN enrollment ON course.course_id = enrollment.course_id
+            WHERE student_id = %s;
+        """
+
+    GRADES_QUERY = """
+            SELECT course.course_name, assessment.grade
+            FROM assessment
+            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id {pruning}
+            JOIN course ON exam_event.course_id = course.course_id
+            WHERE student_id = %s
+            ORDER BY assessment.grade DESC;
+        """
+
+    GRADES_OVER_TIME_QUERY = """
+            SELECT course.course_name, assessment.grade, exam_event.date
+            FROM assessment
+            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id {pruning}
+            JOIN course ON exam_event.course_id = course.course_id
+            WHERE student_id = %s
+            ORDER BY exam_event.date;
+        """
+
     def __str__(self) -> str:
         return "Student Menu"
 
@@ -282,13 +506,7 @@ class Student(Menu):
     @enter_to_continue
     def get_courses(self):
         """Show the courses the student is enrolled in."""
-        self.cursor.execute("""
-            SELECT course.course_name
-            FROM course
-            JOIN enrollment ON course.course_id = enrollment.course_id
-            WHERE student_id = %s;
-        """, (self.student.student_id,))
-        courses = self.cursor.fetchall()
+        courses = self.fetchall(self.COURSES_QUERY, (self.student.student_id,))
         self.print(f"{self.student.first_name} {self.student.last_name} is enrolled in the following courses:")
         for course in courses:
             self.print(f"- {course[0]}")
@@ -300,18 +518,36 @@ class Student(Menu):
         self.print(f"{self.student.first_name} {self.student.last_name}'s GPA is {self.student.gpa:.2f}.")
         return self.menu
     
+    @enter_to_continue
+    def get_course_ranks(self):
+        """Show the rank of the student in each of their courses."""
+        ranks = ranking.course_ranks_of_student(self.cursor, self.student.student_id)
+        if not ranks:
+            self.print("No grades recorded for the student.", bcolors.FAIL)
+            return self.menu
+
+        self.print(f"Ranks of {self.student.first_name} {self.student.last_name}:")
+        self.render(
+            [(course_name, float(average), f"{rank} of {total}", float(percentile)) for course_name, average, rank, percentile, total in ranks],
+            ('Course', 'Average', 'Rank', 'Percentile')
+        )
+        return self.menu
+
+    @enter_to_continue
+    def compare_gpa(self):
+        """Compare the recorded GPA with the GPA derived from the assessments."""
+        derived = derived_gpa(self.cursor, self.student.student_id)
+        self.print(f"{self.student.first_name} {self.student.last_name}'s recorded GPA is {self.student.gpa:.2f}.")
+        if derived is None:
+            self.print("No assessments recorded to derive a GPA from.", bcolors.WARNING)
+        else:
+            self.print(f"The GPA derived from the assessments is {derived:.2f} ({derived - self.student.gpa:+.2f}).")
+        return self.menu
+
     @enter_to_continue
     def get_grade_for_all_courses(self):
         """Get the grade for each course the student is enrolled in."""
-        self.cursor.execute("""
-            SELECT course.course_name, assessment.grade
-            FROM assessment
-            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
-            JOIN course ON exam_event.course_id = course.course_id
-            WHERE student_id = %s
-            ORDER BY assesment.grade DESC;
-        """, (self.student.student_id,))
-        grades = self.cursor.fetchall()
+        grades = self.fetchall(self.sql(self.GRADES_QUERY), (self.student.student_id,))
         self.print(f"Grades for {self.student.first_name} {self.student.last_name}:")
         for grade in grades:
             self.print(f"- {grade[0]}: {grade[1]}")
@@ -324,21 +560,13 @@ class Student(Menu):
             SELECT student_id, first_name, last_name, email, date_of_birth, gpa, state_id
             FROM student;
         """)
-        students = self.cursor.fetchall()
 
-        if students:
+        if self.cursor.rowcount > 0:
             self.print("All students:")
-            for student in students:
-                self.print(StudentModel(
-                    student_id = student[0],
-                    first_name = student[1],
-                    last_name = student[2],
-                    email = student[3],
-                    date_of_birth = student[4],
-                    gpa = student[5],
-                    state_id = student[6]
-                ))
-                self.print()
+            self.render(
+                ((f"{student[1]} {student[2]}", student[3], student[4], student[5]) for student in self.cursor),
+                ('Name', 'Email', 'Date of birth', 'GPA')
+            )
         else:
             self.print("No students found in the database.", bcolors.FAIL)
 
@@ -346,17 +574,24 @@ class Student(Menu):
     
     def histogram_of_gpa(self):
         """Show a histogram of the GPA of all students."""
-        self.cursor.execute("""
-            SELECT gpa
-            FROM student;
-        """)
-        gpas = [row[0] for row in self.cursor.fetchall()]
+        if binning.estimated_rows(self.cursor, 'student') > binning.BIN_THRESHOLD:
+            edges, counts = binning.histogram(self.cursor, "SELECT gpa FROM student", None, binning.GPA_RANGE)
+            if not any(counts):
+                self.print("No GPAs recorded for the students.", bcolors.FAIL)
+                return None, self.menu
+            self.plot_histogram(edges, counts, alpha=0.7, color='b', edgecolor='k')
+        else:
+            self.cursor.execute("""
+                SELECT gpa
+                FROM student;
+            """)
+            gpas = [row[0] for row in self.cursor.fetchall()]
 
-        if not gpas:
-            self.print("No GPAs recorded for the students.", bcolors.FAIL)
-            return None, self.menu
+            if not gpas:
+                self.print("No GPAs recorded for the students.", bcolors.FAIL)
+                return None, self.menu
 
-        plt.hist(gpas, bins=20, alpha=0.7, color='b', edgecolor='k')
+            plt.hist(gpas, bins=20, alpha=0.7, color='b', edgecolor='k')
         plt.xlabel('GPAs')
         plt.ylabel('Frequency')
         plt.title('GPA Distribution')
@@ -365,21 +600,33 @@ class Student(Menu):
         plt.show()
         return self.menu
 
-    def gpa_vs_grade(self):
-        """Show a scatter plot of the GPA vs. the grade for all students."""
-        self.cursor.execute("""
+    GPA_VS_GRADE_QUERY = """
             SELECT gpa, AVG(grade)
             FROM student
             JOIN assessment ON student.student_id = assessment.student_id
-            GROUP BY student.student_id;
-        """)
-        gpas, grades = zip(*self.cursor.fetchall())
+            GROUP BY student.student_id
+        """
 
-        if not gpas or not grades:
-            self.print("No GPAs or grades recorded for the students.", bcolors.FAIL)
-            return None, self.menu
+    def gpa_vs_grade(self):
+        """Show a scatter plot of the GPA vs. the grade for all students."""
+        # One point per student, too many to draw one by one: count them in a grid of cells instead
+        if binning.estimated_rows(self.cursor, 'student') > binning.BIN_THRESHOLD:
+            gpa_edges, grade_edges, counts = binning.grid(self.cursor, self.GPA_VS_GRADE_QUERY, None, binning.GPA_RANGE, binning.GRADE_RANGE)
+            if not any(map(any, counts)):
+                self.print("No GPAs or grades recorded for the students.", bcolors.FAIL)
+                return None, self.menu
+            plt.pcolormesh(gpa_edges, grade_edges, counts, cmap='Blues')
+            plt.colorbar(label='Students')
+        else:
+            self.cursor.execute(self.GPA_VS_GRADE_QUERY)
+            points = self.cursor.fetchall()
 
-        plt.scatter(gpas, grades, alpha=0.7, color='b')
+            if not points:
+                self.print("No GPAs or grades recorded for the students.", bcolors.FAIL)
+                return None, self.menu
+
+            gpas, grades = zip(*points)
+            plt.scatter(gpas, grades, alpha=0.7, color='b')
         plt.xlabel('GPAs')
         plt.ylabel('Grades (average)')
         plt.title('GPAs vs. Grades (average)')
@@ -390,24 +637,37 @@ class Student(Menu):
     
     def grades_by_course(self):
         """Show a bar plot of the average grade for each course."""
-        self.cursor.execute("""
-            SELECT course.course_name, AVG(grade)
-            FROM assessment
-            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
-            JOIN course ON exam_event.course_id = course.course_id
-            GROUP BY course.course_name
-            ORDER BY AVG(grade) DESC;
-        """)
-        courses, grades = zip(*self.cursor.fetchall())
-
-        if not courses or not grades:
+        cache = self.cached_facts()
+        margins = None
+        title = 'Average Grades by Course'
+        if cache:
+            averages = sorted(cache.course_averages(), key=lambda average: average[1], reverse=True)
+        elif Menu.approximate_mode:
+            percent, estimates = self.sampled('course')
+            estimates.sort(key=lambda estimate: estimate.average, reverse=True)
+            averages = [(estimate.label, estimate.average) for estimate in estimates]
+            margins = [estimate.average_margin for estimate in estimates]
+            title += f" (estimated, {percent:.2f}% sample)"
+        else:
+            self.cursor.execute(self.sql("""
+                SELECT course.course_name, AVG(grade)
+                FROM assessment
+                JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id {pruning}
+                JOIN course ON exam_event.course_id = course.course_id
+                GROUP BY course.course_name
+                ORDER BY AVG(grade) DESC;
+            """))
+            averages = self.cursor.fetchall()
+
+        if not averages:
             self.print("No courses or grades recorded for the students.", bcolors.FAIL)
             return None, self.menu
+        courses, grades = zip(*averages)
 
-        plt.bar(courses, grades, alpha=0.7, color='b')
+        plt.bar(courses, grades, yerr=margins, alpha=0.7, color='b')
         plt.xlabel('Courses')
         plt.ylabel('Grades (average)')
-        plt.title('Average Grades by Course')
+        plt.title(title)
         plt.grid(True)
         plt.xticks(rotation=90)
         plt.show()
@@ -416,30 +676,23 @@ class Student(Menu):
     @enter_to_continue
     def average_grade_for_each_students(self):
         """Get the average grade for each student."""
-        self.cursor.execute("""
-            SELECT student.first_name, student.last_name, AVG(grade)
-            FROM assessment
-            JOIN student ON assessment.student_id = student.student_id
-            GROUP BY student.student_id
-            ORDER BY AVG(grade) DESC;
-        """)
-        response = self.cursor.fetchall()
+        response = ranking.all_ranked(self.cursor, 'student')
         self.print(f"Average grades for each student:")
-        for student in response:
-            self.print(f"{student[0]} {student[1]}: {student[2]:.2f}")
+        self.render(
+            [(student.rank, f"{student.first_name} {student.last_name}", float(student.value), float(student.percentile)) for student in response],
+            ('Rank', 'Name', 'Average', 'Percentile')
+        )
         return self.menu
 
     def grades_over_time(self):
         """Plot one line of the average grade of a student for each course over time."""
-        self.cursor.execute("""
-            SELECT course.course_name, assessment.grade, exam_event.date
-            FROM assessment
-            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
-            JOIN course ON exam_event.course_id = course.course_id
-            WHERE student_id = %s
-            ORDER BY exam_event.date;
-        """, (self.student.student_id,))
-        grades = self.cursor.fetchall()
+        cache = self.cached_facts()
+        if cache:
+            facts = cache.student(self.student.student_id)
+            grades = [(cache.courses[course_id], grade, cache.date_of(day))
+                      for course_id, grade, day in zip(facts['course_id'], facts['grade'], facts['date'])]
+        else:
+            grades = self.fetchall(self.sql(self.GRADES_OVER_TIME_QUERY), (self.student.student_id,))
 
         if not grades:
             self.print("No grades recorded for the student.", bcolors.FAIL)
@@ -471,6 +724,11 @@ class Student(Menu):
     def menu(self):
         """Student menu."""
         if self.student:
+            self.prefetch([
+                (self.get_courses, self.COURSES_QUERY, (self.student.student_id,)),
+                (self.get_grade_for_all_courses, self.sql(self.GRADES_QUERY), (self.student.student_id,)),
+                (self.grades_over_time, self.sql(self.GRADES_OVER_TIME_QUERY), (self.student.student_id,)),
+            ])
             self.print(f"What do you want to know about the student {self.student}?", bcolors.HEADER)
             options = {
                 '1': self.get_age,
@@ -478,6 +736,8 @@ class Student(Menu):
                 '3': self.get_gpa,
                 '4': self.get_grade_for_all_courses,
                 '5': self.grades_over_time,
+                '6': self.compare_gpa,
+                '7': self.get_course_ranks,
             }
         else:
             options = {
@@ -494,31 +754,46 @@ class Student(Menu):
 class Course(Menu):
     """Course menu."""
     course: CourseModel = None
+
+    # Queries of the screens of a selected course, also run ahead by the prefetcher
+    ENROLLED_QUERY = """
+            SELECT COUNT(*)
+            FROM enrollment
+            WHERE course_id = %s;
+        """
+
+    AVERAGE_BY_EXAM_TYPE_QUERY = """
+            SELECT exam_name, SUM(grade_sum) / SUM(assessment_count)
+            FROM exam_event_summary
+            WHERE course_id = %s
+            GROUP BY exam_name
+            HAVING SUM(assessment_count) > 0;
+        """
+
+    NEAREST_DATE_QUERY = """
+            SELECT MIN(date)
+            FROM exam_event_summary
+            WHERE course_id = %s AND date >= current_date;
+        """
+
+    BUILDING_QUERY = """
+            SELECT building_name
+            FROM exam_event_summary
+            WHERE course_id = %s
+            LIMIT 1;
+        """
          
     @enter_to_continue
     def count_students_enrolled(self):
         """Count the number of students enrolled in the course."""
-        self.cursor.execute("""
-            SELECT COUNT(*)
-            FROM enrollment
-            WHERE course_id = %s;
-        """, (self.course.course_id,))
-        response = self.cursor.fetchone()[0]
+        response = self.fetchall(self.ENROLLED_QUERY, (self.course.course_id,))[0][0]
         self.print(f"There are {response} students enrolled in the course '{self.course.course_name}'.")
         return self.menu
     
     @enter_to_continue
     def calculate_average_grade_by_exam_type(self):
         """Calculate the average grade for each exam type."""
-        self.cursor.execute("""
-            SELECT exam_type.exam_name, AVG(grade)
-            FROM assessment
-            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
-            join exam_type on exam_event.exam_type_id = exam_type.exam_type_id
-            WHERE exam_event.course_id = %s
-            group by exam_type.exam_name;
-        """, (self.course.course_id,))
-        response = self.cursor.fetchall()
+        response = self.fetchall(self.AVERAGE_BY_EXAM_TYPE_QUERY, (self.course.course_id,))
         for exam in response:
             self.print(f"The average grade for the exam type '{exam[0]}' is {exam[1]:.2f}.")
         return self.menu
@@ -526,33 +801,47 @@ class Course(Menu):
     @enter_to_continue
     def find_nearest_assessment_date(self):
         """Find the nearest assessment date for the course."""
-        self.cursor.execute("""
-            SELECT MIN(date)
-            FROM exam_event
-            WHERE course_id = %s AND date >= current_date;
-        """, (self.course.course_id,))
-        response = self.cursor.fetchone()[0]
+        response = self.fetchall(self.NEAREST_DATE_QUERY, (self.course.course_id,))[0][0]
         self.print(f"The nearest assessment date for the course '{self.course.course_name}' is {response}.")
         return self.menu
 
+    @enter_to_continue
+    def show_top_students(self):
+        """Show the top students of the course."""
+        top = ranking.top_k(self.cursor, 'course', 10, self.course.course_id)
+        if not top:
+            self.print(f"No grades recorded for the course '{self.course.course_name}'.", bcolors.FAIL)
+            return self.menu
+
+        self.print(f"Top students of the course '{self.course.course_name}':")
+        self.render(
+            [(student.rank, f"{student.first_name} {student.last_name}", float(student.value), float(student.percentile)) for student in top],
+            ('Rank', 'Name', 'Average', 'Percentile')
+        )
+        return self.menu
+
+    @enter_to_continue
+    def show_grades_by_state(self):
+        """Show the average grade of the course by home state."""
+        cells = cube.query(self.cursor, by=('state',), course_id=self.course.course_id)
+        if not cells:
+            self.print(f"No grades recorded for the course '{self.course.course_name}'.", bcolors.FAIL)
+            return self.menu
+
+        self.print(f"Grades of the course '{self.course.course_name}' by home state:")
+        self.render_cells(cells, ('State',))
+        return self.menu
+
     @enter_to_continue
     def find_building_for_course(self):
         """Find the building where the course is taught."""
-        self.cursor.execute("""
-            SELECT building.building_name
-            FROM building
-            JOIN room ON building.building_id = room.building_id
-            JOIN exam_event ON room.room_id = exam_event.room_id
-            WHERE exam_event.course_id = %s
-            limit 1;
-        """, (self.course.course_id,))
-        response = self.cursor.fetchone()[0]
+        response = self.fetchall(self.BUILDING_QUERY, (self.course.course_id,))[0][0]
         self.print(f"The course '{self.course.course_name}' is taught in the building '{response}'.")
         return self.menu
 
     def search_course(self):
         """Search for a course by name."""
-        course_name = input("What course do you want to search: ")
+        course_name = self.ask_name("What course do you want to search: ", 'course')
 
         self.cursor.execute("""
             SELECT course_id, course_name
@@ -577,13 +866,10 @@ class Course(Menu):
             SELECT course_id, course_name
             FROM course;
         """)
-        courses = self.cursor.fetchall()
 
-        if courses:
+        if self.cursor.rowcount > 0:
             self.print("All courses:")
-            for course in courses:
-                self.print(CourseModel(course_id = course[0], course_name = course[1]))
-                self.print()
+            self.render((course[1],) for course in self.cursor)
         else:
             self.print("No courses found in the database.", bcolors.FAIL)
 
@@ -616,12 +902,20 @@ class Course(Menu):
     def menu(self):
         """Course menu."""
         if self.course:
+            self.prefetch([
+                (self.count_students_enrolled, self.ENROLLED_QUERY, (self.course.course_id,)),
+                (self.calculate_average_grade_by_exam_type, self.AVERAGE_BY_EXAM_TYPE_QUERY, (self.course.course_id,)),
+                (self.find_nearest_assessment_date, self.NEAREST_DATE_QUERY, (self.course.course_id,)),
+                (self.find_building_for_course, self.BUILDING_QUERY, (self.course.course_id,)),
+            ])
             self.print(f"What do you want to know about the course '{self.course.course_name}'?", bcolors.HEADER)
             options = {
                 '1': self.count_students_enrolled,
                 '2': self.calculate_average_grade_by_exam_type,
                 '3': self.find_nearest_assessment_date,
                 '4': self.find_building_for_course,
+                '5': self.show_top_students,
+                '6': self.show_grades_by_state,
             }
         else:
             self.print("What do you want to do?", bcolors.HEADER)
@@ -638,10 +932,18 @@ class Course(Menu):
 class Building(Menu):
     """Building menu."""
     building: BuildingModel = None
+
+    # Queries of the screens of a selected building, also run ahead by the prefetcher
+    ROOMS_QUERY = """
+            SELECT room_id, room_name, building.building_id, capacity, has_projector, has_computers, is_accessible
+            FROM room
+            JOIN building ON room.building_id = building.building_id
+            WHERE building.building_id = %s;
+        """
          
     def search_building(self):
         """Search for a building by name."""
-        building_name = input("What building do you want to search: ")
+        building_name = self.ask_name("What building do you want to search: ", 'building')
 
         self.cursor.execute("""
             SELECT building_id, building_name
@@ -664,24 +966,9 @@ class Building(Menu):
         """Show rooms from building."""
 
         building_id = self.building.building_id
-        self.cursor.execute("""
-            SELECT room_id, room_name, building.building_id, capacity, has_projector, has_computers, is_accessible
-            FROM room
-            JOIN building ON room.building_id = building.building_id
-            WHERE building.building_id = %s;
-        """, (building_id,))
-        rooms = self.cursor.fetchall()
+        rooms = self.fetchall(self.ROOMS_QUERY, (building_id,))
         self.print(f"Rooms in the building '{building_id}':")
-        for room in rooms:
-            RoomModel(
-                room_id=room[0],
-                room_name=room[1],
-                building_id=room[2],
-                capacity=room[3],
-                has_projector=room[4],
-                has_computers=room[5],
-                is_accessible=room[6]
-            ).print_details()
+        self.render_rooms(rooms)
         return self.menu
     
     @enter_to_continue
@@ -691,13 +978,10 @@ class Building(Menu):
             SELECT building_id, building_name
             FROM building;
         """)
-        buildings = self.cursor.fetchall()
 
-        if buildings:
+        if self.cursor.rowcount > 0:
             self.print("All buildings:")
-            for building in buildings:
-                self.print(BuildingModel(building_id=building[0], building_name=building[1]))
-                self.print()
+            self.render((building[1],) for building in self.cursor)
         else:
             self.print("No buildings found in the database.", bcolors.FAIL)
 
@@ -707,6 +991,7 @@ class Building(Menu):
     def menu(self):
         """Building menu."""
         if self.building:
+            self.prefetch([(self.show_rooms_from_building, self.ROOMS_QUERY, (self.building.building_id,))])
             self.print(f"What do you want to know about the building '{self.building.building_name}'?", bcolors.HEADER)
             options = {
                 '1': self.show_rooms_from_building,
@@ -728,7 +1013,7 @@ class Room(Menu):
 
     def search_room(self):
         """Search for a room by name."""
-        room_name = input("What room do you want to search: ")
+        room_name = self.ask_name("What room do you want to search: ", 'room')
 
         self.cursor.execute("""
             SELECT room_id, room_name, building_id, capacity, has_projector, has_computers, is_accessible
@@ -761,22 +1046,10 @@ class Room(Menu):
             SELECT room_id, room_name, building_id, capacity, has_projector, has_computers, is_accessible
             FROM room;
         """)
-        rooms = self.cursor.fetchall()
 
-        if rooms:
+        if self.cursor.rowcount > 0:
             self.print("All rooms:")
-            for room in rooms:
-                room_model = RoomModel(
-                    room_id=room[0],
-                    room_name=room[1],
-                    building_id=room[2],
-                    capacity=room[3],
-                    has_projector=room[4],
-                    has_computers=room[5],
-                    is_accessible=room[6]
-                )
-                room_model.print_details() 
-                self.print()  # Add an empty line for better readability
+            self.render_rooms(self.cursor)
         else:
             self.print("No rooms found in the database.", bcolors.FAIL)
 
@@ -784,29 +1057,61 @@ class Room(Menu):
 
     def plot_room_utilization(self):
         """Plot a bar plot of the room utilization."""
-        self.cursor.execute("""
-            SELECT room.room_name, COUNT(*)
-            FROM assessment
-            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
-            JOIN room ON exam_event.room_id = room.room_id
-            GROUP BY room.room_name
-            ORDER BY COUNT(*) DESC;
-        """)
-        rooms, counts = zip(*self.cursor.fetchall())
-
-        if not rooms or not counts:
+        margins = None
+        title = 'Room Utilization'
+        if Menu.approximate_mode:
+            percent, estimates = self.sampled('room')
+            estimates.sort(key=lambda estimate: estimate.count, reverse=True)
+            utilization = [(estimate.label, estimate.count) for estimate in estimates]
+            margins = [estimate.count_margin for estimate in estimates]
+            title += f" (estimated, {percent:.2f}% sample)"
+        else:
+            self.cursor.execute(self.sql("""
+                SELECT room.room_name, COUNT(*)
+                FROM assessment
+                JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id {pruning}
+                JOIN room ON exam_event.room_id = room.room_id
+                GROUP BY room.room_name
+                ORDER BY COUNT(*) DESC;
+            """))
+            utilization = self.cursor.fetchall()
+
+        if not utilization:
             self.print("No rooms or counts recorded for the students.", bcolors.FAIL)
             return None, self.menu
+        rooms, counts = zip(*utilization)
 
-        plt.bar(rooms, counts, alpha=0.7, color='b')
+        plt.bar(rooms, counts, yerr=margins, alpha=0.7, color='b')
         plt.xlabel('Rooms')
         plt.ylabel('Number of exams')
-        plt.title('Room Utilization')
+        plt.title(title)
         plt.grid(True)
         plt.xticks(rotation=90)
         plt.show()
         return self.menu
     
+    @enter_to_continue
+    def check_schedule_conflicts(self):
+        """Check the exam schedule for double-booked or over capacity rooms."""
+        try:
+            start = datetime.strptime(input("Enter the first date (YYYY-MM-DD): "), "%Y-%m-%d").date()
+            end = datetime.strptime(input("Enter the last date (YYYY-MM-DD): "), "%Y-%m-%d").date()
+        except ValueError:
+            self.print("Invalid date.", bcolors.FAIL)
+            return self.menu
+
+        schedule = build_schedule(self.cursor, start, end)
+        conflicts = schedule.conflicts()
+        if not conflicts:
+            self.print(f"No conflicts found between {start} and {end}.")
+            return self.menu
+
+        for conflict in conflicts:
+            self.print(f"{conflict.date} {conflict.room.room_name}: {conflict.kind} ({conflict.seats} seats of {conflict.room.capacity})", bcolors.WARNING)
+            for suggestion in schedule.suggestions(conflict):
+                self.print(f"   - Move exam event {suggestion.exam_event_id} to {suggestion.room.room_name} (capacity {suggestion.room.capacity})")
+        return self.menu
+
     def show_details(self):
         """Show details of the room."""
         self.room.print_details()
@@ -825,6 +1130,7 @@ class Room(Menu):
                 '1': self.search_room,
                 '2': self.show_all_rooms,
                 '3': self.plot_room_utilization,
+                '4': self.check_schedule_conflicts,
             }
 
         options['9'] = self.initial_menu
@@ -835,30 +1141,58 @@ class ExamEvent(Menu):
     """Exam Event menu."""
     exam_event: ExamEventModel = None
 
+    # Queries of the screens of a selected exam event, also run ahead by the prefetcher
+    AVERAGE_GRADE_QUERY = """
+            SELECT average_grade
+            FROM exam_event_summary
+            WHERE exam_event_id = %s;
+        """
+
+    DISTRIBUTION_QUERY = """
+            SELECT grade
+            FROM assessment
+            WHERE exam_event_id = %s
+            ORDER BY grade;
+        """
+
+    # The grades of an exam event to bin, the order doesn't matter
+    BINNED_GRADES_QUERY = "SELECT grade FROM assessment WHERE exam_event_id = %s"
+
+    # Columns of exam_event_summary read into an ExamEventModel
+    SUMMARY_COLUMNS = """exam_event_id, date, exam_type_id, course_id, room_id, course_name, exam_name,
+            room_name, building_name, capacity, assessment_count, average_grade"""
+
+    def model_from_row(self, row):
+        """Build an ExamEventModel from a row of SUMMARY_COLUMNS."""
+        return ExamEventModel(
+            exam_event_id=row[0],
+            date=row[1],
+            exam_type_id=row[2],
+            course_id=row[3],
+            room_id=row[4],
+            course_name=row[5],
+            exam_name=row[6],
+            room_name=row[7],
+            building_name=row[8],
+            capacity=row[9],
+            assessment_count=row[10],
+            average_grade=row[11]
+        )
+
     @enter_to_continue
     def search_exam_event_by_id(self):
         """Search for an exam event by ID."""
         exam_event_id = input("Enter the ID of the exam event: ")
 
-        self.cursor.execute("""
-            SELECT exam_event_id, date, exam_event.exam_type_id, course.course_id, room_id, course_name, exam_name 
-            FROM exam_event
-            Join exam_type on exam_event.exam_type_id = exam_type.exam_type_id
-            Join course on exam_event.course_id = course.course_id
+        self.cursor.execute(f"""
+            SELECT {self.SUMMARY_COLUMNS}
+            FROM exam_event_summary
             WHERE exam_event_id = %s;
         """, (exam_event_id,))
 
         exam_event_info = self.cursor.fetchone()
         if exam_event_info:
-            self.exam_event = ExamEventModel(
-                exam_event_id=exam_event_info[0],
-                date=exam_event_info[1].strftime("%Y-%m-%d"),
-                exam_type_id=exam_event_info[2], 
-                course_id=exam_event_info[3], 
-                room_id=exam_event_info[4],
-                course_name=exam_event_info[5],
-                exam_name=exam_event_info[6]
-                )
+            self.exam_event = self.model_from_row(exam_event_info)
             return self.menu
         else:
             self.print(f"No exam event found with the ID {exam_event_id}.", bcolors.FAIL)
@@ -870,11 +1204,9 @@ class ExamEvent(Menu):
         """Search for an exam event by date."""
         date = input("Enter the date of the exam event (YYYY-MM-DD): ")
 
-        self.cursor.execute("""
-            SELECT exam_event_id, date, exam_type.exam_type_id, course.course_id, room_id, course_name, exam_name
-            FROM exam_event
-            JOIN exam_type ON exam_event.exam_type_id = exam_type.exam_type_id
-            JOIN course ON exam_event.course_id = course.course_id
+        self.cursor.execute(f"""
+            SELECT {self.SUMMARY_COLUMNS}
+            FROM exam_event_summary
             WHERE date = %s;
         """, (date,))
 
@@ -883,15 +1215,7 @@ class ExamEvent(Menu):
         if len(exam_event_info) > 1:
             self.print("Multiple exam events found with the same date:", bcolors.WARNING)
             for i, exam_event in enumerate(exam_event_info, 1):
-                exam = ExamEventModel(
-                    exam_event_id=exam_event[0],
-                    date=exam_event[1].strftime("%Y-%m-%d"),
-                    exam_type_id=exam_event[2], 
-                    course_id=exam_event[3], 
-                    room_id=exam_event[4],
-                    course_name=exam_event[5],
-                    exam_name=exam_event[6]
-                    )
+                exam = self.model_from_row(exam_event)
                 self.print(f"[{i}] {exam} )")
             choice = int(input("Select an exam event by number: "))
             if 1 <= choice <= len(exam_event_info):
@@ -906,47 +1230,43 @@ class ExamEvent(Menu):
             self.print(f"No exam event found on {date}.", bcolors.FAIL)
             return None
         
-        self.exam_event = ExamEventModel(
-            exam_event_id=exam_event_info[0], 
-            date=exam_event_info[1], 
-            exam_type_id=exam_event_info[2], 
-            course_id=exam_event_info[3], 
-            room_id=exam_event_info[4],
-            course_name=exam_event_info[5],
-            exam_name=exam_event_info[6]
-        )
+        self.exam_event = self.model_from_row(exam_event_info)
         return self.menu
 
     @enter_to_continue
     def calculate_average_grade(self):
         """Calculate the average grade for the exam event."""
 
-        self.cursor.execute("""
-            SELECT AVG(grade)
-            FROM assessment
-            WHERE exam_event_id = %s;
-        """, (self.exam_event.exam_event_id,))
-        response = self.cursor.fetchone()[0]
+        response = self.fetchall(self.AVERAGE_GRADE_QUERY, (self.exam_event.exam_event_id,))[0][0]
         self.print(f"The average grade for the exam event on {self.exam_event.date} is {response:.2f}.")
         return self.menu
     
     
+    def bins_grades(self):
+        """Whether the grade distribution of the exam event is binned by the server, from the read model count."""
+        return (self.exam_event.assessment_count or 0) > binning.BIN_THRESHOLD
+
     def get_grade_distribution(self):
         """Get the grade distribution for the exam event."""
-        self.cursor.execute("""
-            SELECT grade
-            FROM assessment
-            WHERE exam_event_id = %s
-            ORDER BY grade;
-        """, (self.exam_event.exam_event_id,))
-        
-        grades = [row[0] for row in self.cursor.fetchall()]
+        cache = self.cached_facts()
+        # Large events are binned by the server
+        if not cache and self.bins_grades():
+            edges, counts = binning.histogram(self.cursor, self.BINNED_GRADES_QUERY, (self.exam_event.exam_event_id,), binning.GRADE_RANGE)
+            if not any(counts):
+                self.print(f"No grades recorded for the exam event on {self.exam_event.date}.", bcolors.FAIL)
+                return None, self.menu
+            self.plot_histogram(edges, counts, alpha=0.7, color='b', edgecolor='k')
+        else:
+            if cache:
+                grades = list(cache.exam_event_grades(self.exam_event.course_id, self.exam_event.exam_event_id))
+            else:
+                grades = [row[0] for row in self.fetchall(self.DISTRIBUTION_QUERY, (self.exam_event.exam_event_id,))]
 
-        if not grades:
-            self.print(f"No grades recorded for the exam event on {self.exam_event.date}.", bcolors.FAIL)
-            return None, self.menu
+            if not grades:
+                self.print(f"No grades recorded for the exam event on {self.exam_event.date}.", bcolors.FAIL)
+                return None, self.menu
 
-        plt.hist(grades, bins=20, alpha=0.7, color='b', edgecolor='k')
+            plt.hist(grades, bins=20, alpha=0.7, color='b', edgecolor='k')
         plt.xlabel('Grades')
         plt.ylabel('Frequency')
         plt.title(f"Grade Distribution for the Exam Event on {self.exam_event.date}")
@@ -958,17 +1278,9 @@ class ExamEvent(Menu):
     @enter_to_continue
     def get_grade_from_students(self):
         """Get the grade for each student in the exam event."""
-        self.cursor.execute("""
-            SELECT student.first_name, student.last_name, assessment.grade
-            FROM assessment
-            JOIN student ON assessment.student_id = student.student_id
-            WHERE exam_event_id = %s
-            ORDER BY assessment.grade DESC;
-        """, (self.exam_event.exam_event_id,))
-        response = self.cursor.fetchall()
+        response = ranking.all_ranked(self.cursor, 'exam_event', self.exam_event.exam_event_id)
         self.print(f"Grades for the exam event on {self.exam_event.date}:")
-        for grade in response:
-            self.print(f"- {grade[0]} {grade[1]}: {grade[2]}")
+        self.render([(grade.rank, f"{grade.first_name} {grade.last_name}", grade.value) for grade in response], ('Rank', 'Name', 'Grade'))
         return self.menu
 
     @enter_to_continue
@@ -980,28 +1292,18 @@ class ExamEvent(Menu):
     
     def show_all_exam_events(self):
         """Show all exam events."""
-        self.cursor.execute("""
-            SELECT exam_event_id, date, exam_event.exam_type_id, course.course_id, room_id, course_name, exam_name
-            FROM exam_event
-            JOIN exam_type ON exam_event.exam_type_id = exam_type.exam_type_id
-            JOIN course ON exam_event.course_id = course.course_id
-            ;
+        self.cursor.execute(f"""
+            SELECT {self.SUMMARY_COLUMNS}
+            FROM exam_event_summary
+            ORDER BY date;
         """)
-        exam_events = self.cursor.fetchall()
 
-        if exam_events:
+        if self.cursor.rowcount > 0:
             self.print("All exam events:")
-            for exam_event in exam_events:
-                self.print(ExamEventModel(
-                    exam_event_id=exam_event[0], 
-                    date=exam_event[1], 
-                    exam_type_id=exam_event[2], 
-                    course_id=exam_event[3], 
-                    room_id=exam_event[4],
-                    course_name=exam_event[5],
-                    exam_name=exam_event[6]
-                ))
-                self.print()
+            self.render(
+                ((exam_event[0], exam_event[6], exam_event[1], exam_event[5], exam_event[7], exam_event[10]) for exam_event in self.cursor),
+                ('Exam Event ID', 'Exam Name', 'Date', 'Course Name', 'Room', 'Assessments')
+            )
         else:
             self.print("No exam events found in the database.", bcolors.FAIL)
 
@@ -1010,14 +1312,13 @@ class ExamEvent(Menu):
     @enter_to_continue
     def get_exam_event_by_course(self):
         """Get the exam events for by a course name."""
-        course_name = input("What course do you want to search: ")
+        course_name = self.ask_name("What course do you want to search: ", 'course')
 
-        self.cursor.execute("""
-            SELECT exam_event_id, date, exam_event.exam_type_id, course.course_id, room_id, course_name, exam_name
-            FROM exam_event
-            JOIN course ON exam_event.course_id = course.course_id
-            JOIN exam_type ON exam_event.exam_type_id = exam_type.exam_type_id
-            WHERE course_name = %s;
+        self.cursor.execute(f"""
+            SELECT {self.SUMMARY_COLUMNS}
+            FROM exam_event_summary
+            WHERE course_name = %s
+            ORDER BY date;
         """, (course_name,))
 
         exam_event_info = self.cursor.fetchall()
@@ -1026,15 +1327,7 @@ class ExamEvent(Menu):
             self.print("Multiple exam events found for the course:", bcolors.WARNING)
             for i, exam_event in enumerate(exam_event_info, 1):
                 print(exam_event)
-                exam = ExamEventModel(
-                    exam_event_id=exam_event[0],
-                    date=exam_event[1].strftime("%Y-%m-%d"),
-                    exam_type_id=exam_event[2], 
-                    course_id=exam_event[3], 
-                    room_id=exam_event[4],
-                    course_name=exam_event[5],
-                    exam_name=exam_event[6]
-                    )
+                exam = self.model_from_row(exam_event)
                 self.print(f"[{i}] {exam} )")
             choice = int(input("Select an exam event by number: "))
             if 1 <= choice <= len(exam_event_info):
@@ -1042,26 +1335,59 @@ class ExamEvent(Menu):
             else:
                 self.print("Invalid choice.", bcolors.FAIL)
                 return None
-        elif exam_event_info == 1:
+        elif len(exam_event_info) == 1:
             exam_event_info = exam_event_info[0]
 
         else:
             self.print(f"No exam event found for the course {course_name}.", bcolors.FAIL)
+            return None
+
+        self.exam_event = self.model_from_row(exam_event_info)
+        return self.menu
+
+    @enter_to_continue
+    def check_exam_clashes(self):
+        """Check the exam dates for students with two exams on the same day."""
+        try:
+            start = datetime.strptime(input("Enter the first date (YYYY-MM-DD): "), "%Y-%m-%d").date()
+            end = datetime.strptime(input("Enter the last date (YYYY-MM-DD): "), "%Y-%m-%d").date()
+        except ValueError:
+            self.print("Invalid date.", bcolors.FAIL)
+            return self.menu
 
-        self.exam_event = ExamEventModel(
-            exam_event_id=exam_event_info[0], 
-            date=exam_event_info[1], 
-            exam_type_id=exam_event_info[2], 
-            course_id=exam_event_info[3], 
-            room_id=exam_event_info[4],
-            course_name=exam_event_info[5],
-            exam_name=exam_event_info[6]
+        co_enrollment = clashes.CoEnrollment(clashes.fetch_enrollment(self.cursor))
+        exams = clashes.fetch_exam_dates(self.cursor, start, end)
+        names = clashes.fetch_course_names(self.cursor)
+        found = clashes.find_clashes(co_enrollment, exams)
+        if not found:
+            self.print(f"No clashes found between {start} and {end}.")
+            return self.menu
+
+        self.print(f"{len(found)} clashes found between {start} and {end}:", bcolors.WARNING)
+        self.render(
+            [(clash.date, names[clash.course_ids[0]], names[clash.course_ids[1]], clash.students) for clash in found],
+            ('Date', 'Course', 'Course', 'Students')
         )
+        if input("Propose dates without clashes in the same range? (y/N) ").strip().lower() != 'y':
+            return self.menu
+
+        moves, unplaced = clashes.propose_dates(co_enrollment, exams, clashes.candidate_dates(start, end))
+        self.render(
+            [(move.exam_event_id, names[move.course_id], move.old_date, move.new_date) for move in moves],
+            ('Exam Event ID', 'Course', 'Date', 'Proposed date')
+        )
+        for exam in unplaced:
+            self.print(f"No date without clashes for exam event {exam.exam_event_id} ({names[exam.course_id]}).", bcolors.FAIL)
         return self.menu
 
     def menu(self):
         """Exam Event menu."""
         if self.exam_event:
+            queries = [(self.calculate_average_grade, self.AVERAGE_GRADE_QUERY, (self.exam_event.exam_event_id,))]
+            # Binned distributions and those read from the column cache don't run the per-row query
+            if not column_cache_enabled() and not self.bins_grades():
+                queries.append((self.get_grade_distribution, self.DISTRIBUTION_QUERY, (self.exam_event.exam_event_id,)))
+            self.prefetch(queries)
             self.print(f"What do you want to know about the exam event on {self.exam_event.course_name}: {self.exam_event.exam_name}?", bcolors.HEADER)
             options = {
                 '1': self.show_exam_event_details,
@@ -1076,6 +1402,7 @@ class ExamEvent(Menu):
                 '2': self.search_exam_event_by_id,
                 '3': self.show_all_exam_events,
                 '4': self.get_exam_event_by_course,
+                '5': self.check_exam_clashes,
             }
 
         options['9'] = self.initial_menu
@@ -1083,5 +1410,91 @@ class ExamEvent(Menu):
         return self.print_menu(options)
 
 
+class Rollup(Menu):
+    """Grade rollups menu."""
+
+    # Dimensions that can be grouped by, with their column titles
+    DIMENSIONS = {
+        'state': 'State',
+        'course': 'Course',
+        'exam_type': 'Exam Type',
+        'term': 'Term',
+        'month': 'Month',
+    }
+
+    def show_rollup(self, by, title, **filters):
+        cells = cube.query(self.cursor, by, **filters)
+        if not cells:
+            self.print("No grades recorded for this slice.", bcolors.FAIL)
+            return self.menu
+        self.print(title)
+        self.render_cells(cells, [self.DIMENSIONS[dimension] for dimension in by])
+        return self.menu
+
+    @enter_to_continue
+    def grades_by_state(self):
+        """Show the grades by home state."""
+        return self.show_rollup(('state',), "Grades by home state:")
+
+    @enter_to_continue
+    def grades_by_term(self):
+        """Show the grades by term."""
+        return self.show_rollup(('term',), "Grades by term:")
+
+    @enter_to_continue
+    def grades_by_state_and_course(self):
+        """Show the grades by home state and course."""
+        return self.show_rollup(('state', 'course'), "Grades by home state and course:")
+
+    def lookup(self, table, value):
+        """Id of a state, course or exam type by name, None if there is none."""
+        column = {'state': 'state_name', 'course': 'course_name', 'exam_type': 'exam_name'}[table]
+        self.cursor.execute(f"SELECT {table}_id FROM {table} WHERE {column} = %s;", (value,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    @enter_to_continue
+    def custom_rollup(self):
+        """Show the grades of any slice or rollup."""
+        by = [dimension.strip() for dimension in input(f"Group by ({', '.join(self.DIMENSIONS)}, comma separated): ").split(',') if dimension.strip()]
+        unknown = [dimension for dimension in by if dimension not in self.DIMENSIONS]
+        if unknown:
+            self.print(f"Unknown dimensions: {', '.join(unknown)}.", bcolors.FAIL)
+            return self.menu
+
+        filters = {}
+        for table, prompt in (('state', "state"), ('course', "course"), ('exam_type', "exam type")):
+            name = self.ask_name(f"Only the {prompt} (empty for all): ", table)
+            if name:
+                filters[f"{table}_id"] = self.lookup(table, name)
+                if filters[f"{table}_id"] is None:
+                    self.print(f"No {prompt} named '{name}'.", bcolors.FAIL)
+                    return self.menu
+        term = input("Only the term, e.g. 2023_2 (empty for all): ").strip()
+        if term:
+            filters['term'] = term
+
+        return self.show_rollup(by, "Grades of the slice:", **filters)
+
+    def menu(self):
+        """Grade rollups menu."""
+        self.print("What do you want to know?", bcolors.HEADER)
+        options = {
+            '1': self.grades_by_state,
+            '2': self.grades_by_term,
+            '3': self.grades_by_state_and_course,
+            '4': self.custom_rollup,
+        }
+
+        options['9'] = self.initial_menu
+
+        return self.print_menu(options)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse the grades database.")
+    parser.add_argument('--profile', nargs='?', const='profiles', default=None, metavar='DIR',
+                        help="write CPU, allocation and stack profiles of every menu action to DIR (profiles by default)")
+    args = parser.parse_args()
+    Menu.profiler = Profiler(args.profile)
     Menu().run()
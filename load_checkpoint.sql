@@ -0,0 +1,18 @@
+SET SEARCH_PATH TO grades;
+
+-- Progress of the loads, one row per loaded file. Written in the same
+-- transaction as each batch of rows, so byte_offset is always the end of the
+-- last committed row and load_grades.py --resume can continue from there.
+CREATE TABLE IF NOT EXISTS load_checkpoint (
+    file_hash TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    partitioned BOOLEAN NOT NULL,
+    byte_offset BIGINT NOT NULL DEFAULT 0,
+    row_number BIGINT NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Size of the reject file at the checkpoint, a resumed load cuts the file
+-- there so the rejects of the replayed rows aren't written twice
+ALTER TABLE load_checkpoint ADD COLUMN IF NOT EXISTS rejects_offset BIGINT NOT NULL DEFAULT 0;
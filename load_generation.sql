@@ -0,0 +1,12 @@
+SET SEARCH_PATH TO grades;
+
+-- Number of the last load, bumped by the loader and by snapshot restores.
+-- Kept across reloads (unlike the other tables) so that local caches built
+-- from an older load never look current again.
+CREATE TABLE IF NOT EXISTS load_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    generation BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO load_generation (generation) VALUES (0) ON CONFLICT DO NOTHING;
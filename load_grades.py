@@ -1,19 +1,18 @@
-import os
-import csv
+import argparse
 import psycopg2
-from datetime import datetime
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Database connection parameters
-db_params = {
-    'host': os.getenv("HOST"),
-    'port': os.getenv("PORT"),
-    'database': os.getenv("DATABASE"),
-    'user': os.getenv("DB_USER"),
-    'password':os.getenv("DB_PASS")
-}
+from database import db_params
+from partitions import ensure_partition
+from validation import parse_row, valid_rows, validate_rows, chunks, RejectWriter
+import changefeed
+import gpa
+import ranking
+import cube
+import read_model
+import generation
+import checkpoint
+from adapters import FORMATS, open_input
+from dedup import MODES, Deduplicator, count_duplicates
+from profiling import Profiler
 
 
 def connect_to_database():
@@ -26,205 +25,407 @@ def connect_to_database():
         print(f"Error connecting to the database: {e}")
         return None
 
-def insert_student(cursor, first_name, last_name, email, date_of_birth, gpa, state_id):
-    """Insert or retrieve a student record."""
-    cursor.execute("SELECT student_id FROM student WHERE email = %s;", (email,))
-    student_id = cursor.fetchone()
-
-    if student_id is not None:
-        return student_id[0]
-
-    cursor.execute("""
-        INSERT INTO student (first_name, last_name, email, date_of_birth, gpa, state_id)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING student_id;
-    """, (first_name, last_name, email, date_of_birth, gpa, state_id))
-
-    return cursor.fetchone()[0]
-
-def insert_state(cursor, state):
-    """Insert or retrieve a state record."""
-    cursor.execute("SELECT state_id FROM state WHERE state_name = %s;", (state,))
-    state_id = cursor.fetchone()
-
-    if state_id is not None:
-        return state_id[0]
-
-    cursor.execute("""
-        INSERT INTO state (state_name)
-        VALUES (%s)
-        RETURNING state_id;
-    """, (state,))
-
-    return cursor.fetchone()[0]
-
-def insert_course(cursor, course_name):
-    """Insert or retrieve a course record."""
-    cursor.execute("SELECT course_id FROM course WHERE course_name = %s;", (course_name,))
-    course_id = cursor.fetchone()
-
-    if course_id is not None:
-        return course_id[0]
-
+def resolve(cursor, table, id_column, columns, rows):
+    """Insert the rows missing from a dimension table and return the id of every key.
+
+    rows maps a key to the values of the (column, type) columns, the key
+    being the first one. Keys that are already in the table keep their
+    values, so the first row of a key decides them, like a row by row load.
+    """
+    names = ', '.join(column for column, _ in columns)
+    key = columns[0][0]
+    # Ordered so that the ids follow the order of the rows, whatever the plan of the anti join
+    cursor.execute(f"""
+        INSERT INTO {table} ({names})
+        SELECT {names}
+        FROM unnest({', '.join(f'%s::{type}[]' for _, type in columns)}) WITH ORDINALITY AS batch ({names}, position)
+        WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.{key} = batch.{key})
+        ORDER BY position;
+    """, [list(column) for column in zip(*rows.values())])
+
+    cursor.execute(f"""
+        SELECT DISTINCT ON ({key}) {key}, {id_column}
+        FROM {table}
+        WHERE {key} = ANY(%s)
+        ORDER BY {key}, {id_column};
+    """, (list(rows),))
+    return dict(cursor.fetchall())
+
+
+def resolve_dimensions(cursor, batch):
+    """Insert or retrieve the states, students, courses, exam types, buildings and rooms of a batch of rows.
+
+    Returns (state_id, student_id, course_id, exam_type_id, room_id) for
+    every row, with two statements per table for the whole batch.
+    """
+    states, courses, exam_types, buildings = {}, {}, {}, {}
+    for values in batch:
+        states.setdefault(values['state_name'], (values['state_name'],))
+        courses.setdefault(values['course_name'], (values['course_name'],))
+        exam_types.setdefault(values['exam_name'], (values['exam_name'],))
+        buildings.setdefault(values['building_name'], (values['building_name'],))
+    state_ids = resolve(cursor, 'state', 'state_id', [('state_name', 'TEXT')], states)
+    course_ids = resolve(cursor, 'course', 'course_id', [('course_name', 'TEXT')], courses)
+    exam_type_ids = resolve(cursor, 'exam_type', 'exam_type_id', [('exam_name', 'TEXT')], exam_types)
+    building_ids = resolve(cursor, 'building', 'building_id', [('building_name', 'TEXT')], buildings)
+
+    students, rooms = {}, {}
+    for values in batch:
+        students.setdefault(values['email'], (
+            values['email'], values['first_name'], values['last_name'], values['date_of_birth'], values['gpa'],
+            state_ids[values['state_name']]))
+        rooms.setdefault(values['room_name'], (
+            values['room_name'], building_ids[values['building_name']], values['capacity'],
+            values['has_projector'], values['has_computers'], values['is_accessible']))
+    student_ids = resolve(cursor, 'student', 'student_id', [
+        ('email', 'TEXT'), ('first_name', 'TEXT'), ('last_name', 'TEXT'), ('date_of_birth', 'DATE'),
+        ('gpa', 'NUMERIC'), ('state_id', 'INTEGER')], students)
+    room_ids = resolve(cursor, 'room', 'room_id', [
+        ('room_name', 'TEXT'), ('building_id', 'INTEGER'), ('capacity', 'INTEGER'), ('has_projector', 'BOOLEAN'),
+        ('has_computers', 'BOOLEAN'), ('is_accessible', 'BOOLEAN')], rooms)
+
+    return [(state_ids[values['state_name']], student_ids[values['email']], course_ids[values['course_name']],
+             exam_type_ids[values['exam_name']], room_ids[values['room_name']]) for values in batch]
+
+
+def insert_data(cursor, batch, ids, partitioned=False):
+    """Insert a batch of rows into the exam_event, enrollment and assessment tables.
+
+    Returns the exam event id of every row and whether its assessment was
+    new. Rows that are already there are skipped, so a resumed load can
+    replay rows safely; within the batch the first row of an assessment wins.
+    """
+    events = {}
+    for values, (_, _, course_id, exam_type_id, room_id) in zip(batch, ids):
+        events.setdefault((values['exam_date'].date(), exam_type_id, course_id, room_id), None)
+    columns = [list(column) for column in zip(*events)]
     cursor.execute("""
-        INSERT INTO course (course_name)
-        VALUES (%s)
-        RETURNING course_id;
-    """, (course_name,))
-
-    return cursor.fetchone()[0]
-
-def insert_exam_type(cursor, exam_name):
-    """Insert or retrieve an exam type record."""
-    cursor.execute("SELECT exam_type_id FROM exam_type WHERE exam_name = %s;", (exam_name,))
-    exam_type_id = cursor.fetchone()
-
-    if exam_type_id is not None:
-        return exam_type_id[0]
-
+        INSERT INTO exam_event (date, exam_type_id, course_id, room_id)
+        SELECT date, exam_type_id, course_id, room_id
+        FROM unnest(%s::DATE[], %s::INTEGER[], %s::INTEGER[], %s::INTEGER[])
+            WITH ORDINALITY AS batch (date, exam_type_id, course_id, room_id, position)
+        ORDER BY position
+        ON CONFLICT DO NOTHING;
+    """, columns)
     cursor.execute("""
-        INSERT INTO exam_type (exam_name)
-        VALUES (%s)
-        RETURNING exam_type_id;
-    """, (exam_name,))
-
-    return cursor.fetchone()[0]
-
-def insert_building(cursor, building_name):
-    """Insert or retrieve a building record."""
-    cursor.execute("SELECT building_id FROM building WHERE building_name = %s;", (building_name,))
-    building_id = cursor.fetchone()
-
-    if building_id is not None:
-        return building_id[0]
-
+        SELECT date, exam_type_id, course_id, room_id, exam_event_id
+        FROM exam_event
+        JOIN unnest(%s::DATE[], %s::INTEGER[], %s::INTEGER[], %s::INTEGER[])
+            AS batch (date, exam_type_id, course_id, room_id) USING (date, exam_type_id, course_id, room_id);
+    """, columns)
+    event_ids = {tuple(row[:4]): row[4] for row in cursor.fetchall()}
+    exam_event_ids = [event_ids[values['exam_date'].date(), exam_type_id, course_id, room_id]
+                      for values, (_, _, course_id, exam_type_id, room_id) in zip(batch, ids)]
+
+    enrollments = dict.fromkeys((student_id, course_id) for _, student_id, course_id, _, _ in ids)
     cursor.execute("""
-        INSERT INTO building (building_name)
-        VALUES (%s)
-        RETURNING building_id;
-    """, (building_name,))
-
-    return cursor.fetchone()[0]
-
-def insert_room(cursor, room_name, building_id, capacity, has_projector, has_computers, is_accessible):
-    """Insert or retrieve a room record."""
-    cursor.execute("SELECT room_id FROM room WHERE room_name = %s;", (room_name,))
-    room_id = cursor.fetchone()
-
-    if room_id is not None:
-        return room_id[0]
-
-    cursor.execute("""
-        INSERT INTO room (room_name, building_id, capacity, has_projector, has_computers, is_accessible)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING room_id;
-    """, (room_name, building_id, capacity, has_projector, has_computers, is_accessible))
-
-    return cursor.fetchone()[0]
-
-
-def insert_data(conn, exam_date, student_id, course_id, exam_type_id, room_id, grade):
-    """Insert data into assessment, exam_event, and enrollment tables."""
-    conn.commit()
-    cursor = conn.cursor()
-    try:
-        
+        INSERT INTO enrollment (student_id, course_id)
+        SELECT * FROM unnest(%s::INTEGER[], %s::INTEGER[])
+        ON CONFLICT DO NOTHING;
+    """, [list(column) for column in zip(*enrollments)])
+
+    assessments = {}
+    for values, (_, student_id, *_), exam_event_id in zip(batch, ids, exam_event_ids):
+        assessments.setdefault((student_id, exam_event_id), (values['exam_date'], values['grade']))
+    student_ids, event_column = (list(column) for column in zip(*assessments))
+    dates, grades = (list(column) for column in zip(*assessments.values()))
+    if partitioned:
+        # The exam date routes the assessment to the partition of its term
         cursor.execute("""
-            INSERT INTO exam_event (date, exam_type_id, course_id, room_id)
-            VALUES (%s, %s, %s, %s)
-            RETURNING exam_event_id;
-        """, (exam_date, exam_type_id, course_id, room_id))
-
-        exam_event_id = cursor.fetchone()[0]
-    except Exception as e:
-        conn.rollback()
-        cursor = conn.cursor()
-        # Handle the case where a unique constraint violation occurred
+            INSERT INTO assessment (student_id, exam_event_id, exam_date, grade)
+            SELECT * FROM unnest(%s::INTEGER[], %s::INTEGER[], %s::DATE[], %s::NUMERIC[])
+            ON CONFLICT DO NOTHING
+            RETURNING student_id, exam_event_id;
+        """, (student_ids, event_column, dates, grades))
+    else:
         cursor.execute("""
-            SELECT exam_event_id
-            FROM exam_event
-            WHERE date = %s AND exam_type_id = %s AND course_id = %s AND room_id = %s;
-        """, (exam_date, exam_type_id, course_id, room_id))
-
-        exam_event_id = cursor.fetchone()[0]
-
-
-    cursor.execute("""
-        SELECT student_id, course_id FROM enrollment
-            WHERE student_id = %s AND course_id = %s;
-    """, (student_id, course_id))
-
-    enrollment = cursor.fetchone()
+            INSERT INTO assessment (student_id, exam_event_id, grade)
+            SELECT * FROM unnest(%s::INTEGER[], %s::INTEGER[], %s::NUMERIC[])
+            ON CONFLICT DO NOTHING
+            RETURNING student_id, exam_event_id;
+        """, (student_ids, event_column, grades))
+    inserted = set(cursor.fetchall())
+
+    results = []
+    for (_, student_id, *_), exam_event_id in zip(ids, exam_event_ids):
+        key = (student_id, exam_event_id)
+        results.append((exam_event_id, key in inserted))
+        # Later rows of the same assessment count as already loaded
+        inserted.discard(key)
+    return results
+
+
+# Rows inserted together by set-based statements and committed together,
+# the derived tables and the checkpoint are brought up to date with each batch
+BATCH_SIZE = 1000
+
+# Seconds between two allocation snapshots of a phase with --profile, the phases run for every row
+PROFILE_ALLOCATION_INTERVAL = 30
+
+
+class LoadReport:
+    """Counters of a load, printed at the end of the run."""
+
+    def __init__(self):
+        self.valid = 0
+        self.rejected = 0
+        self.inserted = 0
+        self.existing = 0
+        self.duplicate_keys = 0
+        self.duplicates = 0
+
+    def print(self, dedup='drop'):
+        print("Load report:")
+        print(f" - Rows read: {self.valid + self.rejected + self.duplicates}")
+        if self.duplicate_keys:
+            print(f" - Keys found in several rows: {self.duplicate_keys}")
+            print(f" - Duplicate rows {'merged' if dedup == 'merge' else 'dropped'}: {self.duplicates}")
+        print(f" - Rows rejected: {self.rejected}")
+        print(f" - Rows inserted: {self.inserted}")
+        if self.existing:
+            print(f" - Rows already loaded: {self.existing}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the grades CSV into the database.")
+    parser.add_argument('--input', default='grades.csv',
+                        help="file to load, CSV or JSON lines (optionally gzip or zstd compressed) or Parquet")
+    parser.add_argument('--format', choices=('auto',) + FORMATS, default='auto',
+                        help="format of the input file, detected from its content by default")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="create exam_event and assessment partitioned by term (see partitions.py)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only validate the rows and write the reject file, without touching the database")
+    parser.add_argument('--reject-file', default='rejects.csv',
+                        help="where rejected rows are written with the reason they were rejected")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of validation processes (defaults to the number of CPUs)")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the validation stage, the first bad row aborts the load")
+    parser.add_argument('--dedup', choices=MODES, default='drop',
+                        help="what to do with rows repeating the student and exam event of another row: keep the "
+                             "first one (drop), combine them into one row (merge) or send them all to the database (off)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted load of the same file after its last committed batch")
+    parser.add_argument('--profile', nargs='?', const='profiles', default=None, metavar='DIR',
+                        help="write CPU, allocation and stack profiles of the parse, resolve dimensions, insert, "
+                             "refresh derived tables and commit phases to DIR (profiles by default)")
+    return parser.parse_args()
+
+
+def find_duplicates(args, report):
+    """Count the rows of every duplicated natural key in a first pass over the input.
+
+    Unless validation is disabled only the valid rows are counted, the
+    invalid ones are rejected before deduplication and never replace or
+    merge into a valid row. Returns the deduplicator and the reasons of the
+    rejected rows by row number, so that the rows aren't validated again
+    (None without validation), or (None, None) without dedup.
+    """
+    if args.dedup == 'off':
+        return None, None
+    rejected = None if args.no_validate else {}
+    scan = open_input(args.input, args.format)
+    try:
+        rows = scan if rejected is None else first_pass_rows(scan, rejected, args.workers)
+        counts = count_duplicates(rows)
+    finally:
+        scan.close()
+    report.duplicate_keys = len(counts)
+    return Deduplicator(args.dedup, counts), rejected
+
+
+def first_pass_rows(rows, rejected, workers=None):
+    """Yield the valid rows, keeping the reasons of the others by row number."""
+    for row, reasons in validate_rows(rows, workers):
+        if reasons:
+            rejected[row[checkpoint.POSITION][1]] = reasons
+        else:
+            yield row
+
+
+def known_valid_rows(rows, rejects, rejected, replayed=0):
+    """Yield the rows the first pass found valid, sending the others after row number replayed to the reject writer."""
+    for row in rows:
+        reasons = rejected.get(row[checkpoint.POSITION][1])
+        if not reasons:
+            yield row
+        elif row[checkpoint.POSITION][1] > replayed:
+            rejects.write(row, reasons)
+
+
+def read_rows(input_rows, report, rejects, args, deduplicator=None, rejected=None, replayed=0):
+    """Yield the input rows to load, without the duplicates and, unless validation is disabled, the invalid rows.
+
+    With a deduplicator, a resumed load reads the input from the start and
+    replays the rows up to row number replayed to rebuild its state.
+    """
+    if rejected is not None:
+        input_rows = known_valid_rows(input_rows, rejects, rejected, replayed)
+    elif not args.no_validate:
+        input_rows = valid_rows(input_rows, rejects, args.workers)
+    if deduplicator:
+        input_rows = deduplicator.rows(input_rows, replayed)
+
+    for row in input_rows:
+        report.valid += 1
+        yield row
+    report.rejected = rejects.count
+    if deduplicator:
+        report.duplicates = deduplicator.removed
+
+
+def dry_run(args):
+    """Validate the input file without connecting to the database."""
+    report = LoadReport()
+    deduplicator, rejected = find_duplicates(args, report)
+    input_rows = open_input(args.input, args.format)
+    rejects = RejectWriter(args.reject_file, input_rows.fieldnames)
+    for _ in read_rows(input_rows, report, rejects, args, deduplicator, rejected):
+        pass
+    rejects.close()
+    input_rows.close()
+    report.print(args.dedup)
+    if report.rejected:
+        print(f"Rejected rows written to {args.reject_file}")
 
-    if enrollment is None:
-        cursor.execute("""
-            INSERT INTO enrollment (student_id, course_id)
-            VALUES (%s, %s)
-        """, (student_id, course_id))
 
-    cursor.execute("""
-        INSERT INTO assessment (student_id, exam_event_id, grade)
-        VALUES (%s, %s, %s);
-    """, (student_id, exam_event_id, grade))
+def main():
+    args = parse_args()
 
+    if args.dry_run:
+        dry_run(args)
+        return
 
-def main():
     # Open a connection to the database
     conn = connect_to_database()
     if conn is None:
         return
-    
+
     # Open a cursor to perform database operations
     cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+
+    digest = checkpoint.file_hash(args.input)
+    if args.resume:
+        checkpoint.install(cursor)
+        progress = checkpoint.find(cursor, digest)
+        if progress is None or progress.completed:
+            print(f"Nothing to resume: {args.input} was {'already loaded' if progress else 'never loaded'}.")
+            conn.close()
+            return
+        # The tables are kept as they are, the partitioning can't change halfway
+        args.partitioned = progress.partitioned
+        print(f"Resuming after row {progress.row_number} (byte {progress.byte_offset}).\n")
+    else:
+        # Create all the tables
+        schema = "grades_partitioned.sql" if args.partitioned else "grades.sql"
+        cursor.execute(open(schema, "r").read())
+
+        # Log the changes of the new tables and tell consumers that the old ones are gone
+        changefeed.install(cursor)
+        changefeed.mark_reset(cursor)
+
+        # Derived tables, updated with every batch of rows
+        gpa.install(cursor)
+        ranking.install(cursor)
+        read_model.install(cursor)
+        cube.install(cursor)
+        generation.install(cursor)
+
+        checkpoint.install(cursor)
+        progress = checkpoint.start(cursor, args.input, digest, args.partitioned)
+        conn.commit()
+
+    gpa_engine = gpa.GpaEngine()
+
+    # Terms whose partitions were already created during this load
+    terms = set()
+    report = LoadReport()
+
+    # Duplicates and invalid rows are found before reading the rows to load, no SQL is sent for them.
+    # The duplicates of a resumed load depend on the rows before the checkpoint too, both passes
+    # then read the whole input and the rows loaded before the checkpoint are only replayed.
+    deduplicator, rejected = find_duplicates(args, report)
+    start = (0, 0) if deduplicator else (progress.byte_offset, progress.row_number)
+
+    # Read data from the input file, whatever its format
+    input_rows = open_input(args.input, args.format, *start)
+    rejects = RejectWriter(args.reject_file, input_rows.fieldnames, progress.rejects_offset)
+    position = (progress.byte_offset, progress.row_number)
+    profiler = Profiler(args.profile, PROFILE_ALLOCATION_INTERVAL)
 
-    # Create all the tables
-    cursor.execute(open("grades.sql", "r").read())
-
-    # Read data from the CSV file
-    with open('grades.csv', 'r') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-
-        try:
-            for row in csv_reader:
-                # Just to act as a log during inserting
+    try:
+        for batch in chunks(read_rows(input_rows, report, rejects, args, deduplicator, rejected, progress.row_number),
+                            BATCH_SIZE):
+            # Just to act as a log during inserting
+            for row in batch:
                 print(f"Inserting row:\n{row}", end="\n\n")
 
-                # Extract data from the CSV row
-                exam_date = datetime.strptime(row['exam_date'], '%Y-%m-%d')
-                first_name = row['first_name']
-                last_name = row['last_name']
-                email = row['email']
-                date_of_birth = datetime.strptime(row['date_of_birth'], '%Y-%m-%d')
-                gpa = float(row['gpa'])
-                course_name = row['course_name']
-                exam_name = row['exam_name']
-                building_name = row['building_name']
-                room_name = row['room_name']
-                capacity = row["capacity"]
-                has_projector = row['has_projector'] == 't'
-                has_computers = row['has_computers'] == 't'
-                is_accessible = row['is_accessible'] == 't'
-                state_name = row["state"]
-                grade = row["grade"]
-
-                # Insert or retrieve IDs for student, course, exam type, building, and room
-                state_id = insert_state(cursor, state_name)
-                student_id = insert_student(cursor, first_name, last_name, email, date_of_birth, gpa, state_id)
-                course_id = insert_course(cursor, course_name)
-                exam_type_id = insert_exam_type(cursor, exam_name)
-                building_id = insert_building(cursor, building_name)
-                room_id = insert_room(cursor, room_name, building_id, capacity, has_projector, has_computers, is_accessible)
-
-                # Insert data into the database
-                insert_data(conn, exam_date, student_id, course_id, exam_type_id, room_id, grade)
-
-            # Commit the changes and close the connection
+            # Extract data from the input rows
+            with profiler.section('parse'):
+                rows = [parse_row(row) for row in batch]
+
+            # Insert or retrieve IDs for students, courses, exam types, buildings, and rooms
+            with profiler.section('resolve dimensions'):
+                ids = resolve_dimensions(cursor, rows)
+
+            # Insert data into the database
+            with profiler.section('insert'):
+                if args.partitioned:
+                    for exam_date in {values['exam_date'] for values in rows}:
+                        ensure_partition(cursor, exam_date, terms)
+                results = insert_data(cursor, rows, ids, args.partitioned)
+
+            new_assessments = []
+            # (state, course, exam type, date, grade) of the new assessments, added to the rollup cube
+            cube_facts = []
+            # Exam events whose summary rows are refreshed
+            touched_events = set()
+            for values, (state_id, student_id, course_id, exam_type_id, _), (exam_event_id, inserted) in zip(rows, ids, results):
+                if inserted:
+                    report.inserted += 1
+                    touched_events.add(exam_event_id)
+                    new_assessments.append((student_id, values['exam_name'], values['grade']))
+                    cube_facts.append((state_id, course_id, exam_type_id, values['exam_date'], values['grade']))
+                else:
+                    report.existing += 1
+
+            with profiler.section('refresh derived tables'):
+                gpa_engine.apply(cursor, new_assessments)
+                read_model.refresh(cursor, touched_events)
+                cube.apply(cursor, cube_facts)
+                checkpoint.save(cursor, digest, *batch[-1][checkpoint.POSITION], rejects.offset())
+            with profiler.section('commit'):
+                conn.commit()
+            position = batch[-1][checkpoint.POSITION]
+
+        # Rejected rows after the last loaded one are part of the load too
+        position = input_rows.position()
+        with profiler.section('refresh derived tables'):
+            ranking.refresh(cursor)
+
+            # Local caches of the previous load are rebuilt on their next use
+            generation.bump_generation(cursor)
+            checkpoint.save(cursor, digest, *position, rejects.offset(), completed=True)
+
+        # Commit the changes and close the connection
+        with profiler.section('commit'):
             conn.commit()
-            conn.close()
-
-        except Exception as error:
-            conn.close()
-            raise error
+        conn.close()
+
+    except Exception as error:
+        conn.close()
+        print(f"Load stopped after row {position[1]}, run again with --resume to continue from there.")
+        raise error
+    finally:
+        rejects.close()
+        input_rows.close()
+        profiler.write()
+
+    report.print(args.dedup)
+    if report.rejected:
+        print(f"Rejected rows written to {args.reject_file}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,155 @@
+import re
+import sys
+import argparse
+import psycopg2
+from psycopg2 import sql
+from datetime import date, datetime
+from database import db_params
+
+# Terms are half years: term 1 runs from January to June, term 2 from July to December
+ARCHIVE_SCHEMA = 'grades_archive'
+
+# Term names: the year and the half
+TERM_PATTERN = re.compile(r'\d{4}_[12]')
+
+
+def term_for(day):
+    """Return the term name and its [start, end) bounds for a date."""
+    if day.month < 7:
+        return f"{day.year}_1", date(day.year, 1, 1), date(day.year, 7, 1)
+    return f"{day.year}_2", date(day.year, 7, 1), date(day.year + 1, 1, 1)
+
+
+def term_bounds(term):
+    """Return the [start, end) bounds of a term name such as 2023_2."""
+    if not TERM_PATTERN.fullmatch(term):
+        raise ValueError(f"'{term}' is not a term name such as 2023_2.")
+    year, half = term.split('_')
+    return term_for(date(int(year), 1 if half == '1' else 7, 1))[1:]
+
+
+def is_partitioned(cursor):
+    """Check whether the grades schema was created from grades_partitioned.sql."""
+    cursor.execute("""
+        SELECT relkind = 'p'
+        FROM pg_class
+        WHERE oid = to_regclass('grades.exam_event');
+    """)
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def ensure_partition(cursor, day, known=None):
+    """Create the exam_event and assessment partitions of the term holding a date if they don't exist yet."""
+    term, start, end = term_for(day)
+    if known is not None and term in known:
+        return term
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS exam_event_{term}
+            PARTITION OF exam_event FOR VALUES FROM (%s) TO (%s);
+        CREATE TABLE IF NOT EXISTS assessment_{term}
+            PARTITION OF assessment FOR VALUES FROM (%s) TO (%s);
+    """, (start, end, start, end))
+
+    if known is not None:
+        known.add(term)
+    return term
+
+
+def list_partitions(cursor):
+    """List the terms with attached exam_event partitions and their number of exam events."""
+    cursor.execute("""
+        SELECT child.relname, child.reltuples::BIGINT
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace
+        WHERE pg_namespace.nspname = 'grades' AND parent.relname = 'exam_event'
+        ORDER BY child.relname;
+    """)
+    return [(name[len('exam_event_'):], rows) for name, rows in cursor.fetchall()]
+
+
+def detach_term(cursor, term, archive_schema=ARCHIVE_SCHEMA):
+    """Detach the partitions of a term and move them to the archive schema."""
+    term_bounds(term)
+    archive = sql.Identifier(archive_schema)
+    exam_event = sql.Identifier(f"exam_event_{term}")
+    assessment = sql.Identifier(f"assessment_{term}")
+    cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(archive))
+
+    # The assessment partition goes first, its rows reference the exam events of the term
+    cursor.execute(sql.SQL("ALTER TABLE assessment DETACH PARTITION {};").format(assessment))
+    cursor.execute("""
+        SELECT conname
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid = 'exam_event'::regclass;
+    """, (f"assessment_{term}",))
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(assessment, sql.Identifier(constraint)))
+
+    cursor.execute(sql.SQL("ALTER TABLE exam_event DETACH PARTITION {};").format(exam_event))
+    cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {};").format(assessment, archive))
+    cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {};").format(exam_event, archive))
+
+
+def attach_term(cursor, term, archive_schema=ARCHIVE_SCHEMA):
+    """Move the archived partitions of a term back and attach them again."""
+    start, end = term_bounds(term)
+    exam_event = sql.Identifier(f"exam_event_{term}")
+    assessment = sql.Identifier(f"assessment_{term}")
+    cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA grades;").format(sql.Identifier(archive_schema, f"exam_event_{term}")))
+    cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA grades;").format(sql.Identifier(archive_schema, f"assessment_{term}")))
+    cursor.execute(sql.SQL("""
+        ALTER TABLE exam_event ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);
+        ALTER TABLE assessment ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);
+    """).format(exam_event, assessment), (start, end, start, end))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the term partitions of exam_event and assessment.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="list the attached terms")
+    create = subparsers.add_parser('create', help="create the partitions of the term holding a date")
+    create.add_argument('date', help="a date in the term (YYYY-MM-DD)")
+    detach = subparsers.add_parser('detach', help=f"detach a term and move it to the {ARCHIVE_SCHEMA} schema")
+    detach.add_argument('term', help="term name, e.g. 2023_2")
+    attach = subparsers.add_parser('attach', help=f"attach a term archived in the {ARCHIVE_SCHEMA} schema again")
+    attach.add_argument('term', help="term name, e.g. 2023_2")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**db_params)
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+
+    if not is_partitioned(cursor):
+        print("The grades schema is not partitioned, load it with 'python load_grades.py --partitioned'.")
+        conn.close()
+        return 1
+
+    try:
+        if args.command == 'list':
+            for term, rows in list_partitions(cursor):
+                print(f"{term}: ~{rows} exam events")
+        elif args.command == 'create':
+            term = ensure_partition(cursor, datetime.strptime(args.date, '%Y-%m-%d').date())
+            print(f"Partitions for term {term} are ready.")
+        elif args.command == 'detach':
+            detach_term(cursor, args.term)
+            print(f"Term {args.term} moved to {ARCHIVE_SCHEMA}.")
+        elif args.command == 'attach':
+            attach_term(cursor, args.term)
+            print(f"Term {args.term} attached again.")
+        conn.commit()
+    except ValueError as error:
+        print(error)
+        return 1
+    finally:
+        cursor.close()
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
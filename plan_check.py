@@ -0,0 +1,444 @@
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import psycopg2
+import psycopg2.extensions
+from datetime import date
+import gpa
+import cube
+import binning
+import clashes
+import ranking
+import read_model
+import generation
+import approximate
+import autocomplete
+import scheduling
+import column_cache
+from grades import Rollup
+from types import SimpleNamespace
+
+BASELINE_FILE = 'plan_baselines.json'
+
+# Number of students of each generated dataset, the other tables grow with it
+SCALES = {
+    'small': 1_000,
+    'medium': 10_000,
+    'large': 50_000,
+}
+
+# Runs of each query, the median is compared with the latency budget
+RUNS = 5
+
+# Budgets recorded with --update are the measured median times this factor, never below MIN_BUDGET_MS
+BUDGET_FACTOR = 3
+MIN_BUDGET_MS = 20
+
+# Queries of grades.py that take parameters -> query returning sample parameters from the generated data
+SAMPLE_PARAMS = {
+    'Student.search': "SELECT first_name, last_name FROM student ORDER BY student_id LIMIT 1",
+    'Student.get_courses': "SELECT student_id FROM student ORDER BY student_id LIMIT 1",
+    'Student.get_grade_for_all_courses': "SELECT student_id FROM student ORDER BY student_id LIMIT 1",
+    'Student.grades_over_time': "SELECT student_id FROM student ORDER BY student_id LIMIT 1",
+    'Course.count_students_enrolled': "SELECT course_id FROM course ORDER BY course_id LIMIT 1",
+    'Course.calculate_average_grade_by_exam_type': "SELECT course_id FROM course ORDER BY course_id LIMIT 1",
+    'Course.find_nearest_assessment_date': "SELECT course_id FROM course ORDER BY course_id LIMIT 1",
+    'Course.find_building_for_course': "SELECT course_id FROM course ORDER BY course_id LIMIT 1",
+    'Course.search_course': "SELECT course_name FROM course ORDER BY course_id LIMIT 1",
+    'Building.search_building': "SELECT building_name FROM building ORDER BY building_id LIMIT 1",
+    'Building.show_rooms_from_building': "SELECT building_id FROM building ORDER BY building_id LIMIT 1",
+    'Room.search_room': "SELECT room_name FROM room ORDER BY room_id LIMIT 1",
+    'ExamEvent.search_exam_event_by_id': "SELECT exam_event_id FROM exam_event ORDER BY exam_event_id LIMIT 1",
+    'ExamEvent.search_exam_event_by_date': "SELECT date FROM exam_event ORDER BY exam_event_id LIMIT 1",
+    'ExamEvent.calculate_average_grade': "SELECT exam_event_id FROM exam_event ORDER BY exam_event_id LIMIT 1",
+    'ExamEvent.get_grade_distribution': "SELECT exam_event_id FROM exam_event ORDER BY exam_event_id LIMIT 1",
+    'ExamEvent.get_exam_event_by_course': "SELECT course_name FROM course ORDER BY course_id LIMIT 1",
+}
+
+# Queries the menus run through the helper modules -> call running them on a cursor,
+# with the constants of grades.py. Every statement a call executes is checked.
+HELPER_CALLS = {
+    'cube.query (state)': lambda cursor, constants: cube.query(cursor, by=('state',)),
+    'cube.query (state of a course)': lambda cursor, constants: cube.query(cursor, by=('state',), course_id=1),
+    'cube.query (course and exam type of a term)':
+        lambda cursor, constants: cube.query(cursor, by=('course', 'exam_type'), term='2023_2'),
+    'binning.histogram (GPA)':
+        lambda cursor, constants: binning.histogram(cursor, "SELECT gpa FROM student", None, binning.GPA_RANGE),
+    'binning.histogram (exam event grades)':
+        lambda cursor, constants: binning.histogram(cursor, constants['ExamEvent']['BINNED_GRADES_QUERY'], (1,),
+                                                    binning.GRADE_RANGE),
+    'binning.grid (GPA vs grade)':
+        lambda cursor, constants: binning.grid(cursor, constants['Student']['GPA_VS_GRADE_QUERY'], None,
+                                               binning.GPA_RANGE, binning.GRADE_RANGE),
+    'approximate.estimate (course)': lambda cursor, constants: approximate.estimate(cursor, 'course'),
+    'approximate.estimate (room)': lambda cursor, constants: approximate.estimate(cursor, 'room'),
+    'clashes.fetch_enrollment': lambda cursor, constants: clashes.fetch_enrollment(cursor),
+    'clashes.fetch_exam_dates':
+        lambda cursor, constants: clashes.fetch_exam_dates(cursor, date(2023, 1, 1), date(2023, 6, 30)),
+    'clashes.fetch_course_names': lambda cursor, constants: clashes.fetch_course_names(cursor),
+    'scheduling.fetch_rooms': lambda cursor, constants: scheduling.fetch_rooms(cursor),
+    'scheduling.fetch_exam_slots':
+        lambda cursor, constants: scheduling.fetch_exam_slots(cursor, date(2023, 1, 1), date(2023, 1, 31)),
+    'ranking.course_ranks_of_student': lambda cursor, constants: ranking.course_ranks_of_student(cursor, 1),
+    'ranking.all_ranked (student)': lambda cursor, constants: ranking.all_ranked(cursor, 'student'),
+    'ranking.all_ranked (exam event)': lambda cursor, constants: ranking.all_ranked(cursor, 'exam_event', 1),
+    'ranking.top_k (course)': lambda cursor, constants: ranking.top_k(cursor, 'course', 10, 1),
+    'gpa.derived_gpa': lambda cursor, constants: gpa.derived_gpa(cursor, 1),
+    'Rollup.lookup (state)': lambda cursor, constants: Rollup.lookup(SimpleNamespace(cursor=cursor), 'state', 'State 1'),
+    'Rollup.lookup (course)':
+        lambda cursor, constants: Rollup.lookup(SimpleNamespace(cursor=cursor), 'course', 'Course 1'),
+    'Rollup.lookup (exam type)':
+        lambda cursor, constants: Rollup.lookup(SimpleNamespace(cursor=cursor), 'exam_type', 'Final Exam'),
+    'autocomplete.Names.load': lambda cursor, constants: autocomplete.Names().load(cursor),
+    'column_cache (student order)': lambda cursor, constants: cursor.execute(
+        column_cache.FACTS_QUERY.format(order=', '.join(column_cache.ORDERS['student']))),
+    'column_cache (course order)': lambda cursor, constants: cursor.execute(
+        column_cache.FACTS_QUERY.format(order=', '.join(column_cache.ORDERS['course']))),
+}
+
+# Deterministic dataset, %(students)s and %(courses)s are filled in per scale
+DATASET_SQL = """
+    SELECT setseed(0.42);
+
+    INSERT INTO state (state_name)
+    SELECT 'State ' || i FROM generate_series(1, 50) i;
+
+    INSERT INTO student (first_name, last_name, email, date_of_birth, gpa, state_id)
+    SELECT 'First ' || (i %% 997), 'Last ' || i, 'student' || i || '@example.edu',
+           DATE '1995-01-01' + (random() * 3650)::INTEGER, round((random() * 4)::NUMERIC, 2), 1 + i %% 50
+    FROM generate_series(1, %(students)s) i;
+
+    INSERT INTO course (course_name)
+    SELECT 'Course ' || i FROM generate_series(1, %(courses)s) i;
+
+    INSERT INTO exam_type (exam_name)
+    VALUES ('Midterm Exam'), ('Final Exam'), ('Quiz'), ('Project');
+
+    INSERT INTO building (building_name)
+    SELECT 'Building ' || i FROM generate_series(1, 10) i;
+
+    INSERT INTO room (room_name, building_id, capacity, has_projector, has_computers, is_accessible)
+    SELECT 'Room ' || i, 1 + i %% 10, 20 + (i %% 8) * 20, i %% 2 = 0, i %% 3 = 0, i %% 5 <> 0
+    FROM generate_series(1, 100) i;
+
+    INSERT INTO exam_event (date, exam_type_id, course_id, room_id)
+    SELECT DATE '2023-01-09' + (course_id * 7 + exam_type_id * 30) %% 700, exam_type_id, course_id,
+           1 + (course_id * 4 + exam_type_id) %% 100
+    FROM course CROSS JOIN exam_type;
+
+    INSERT INTO enrollment (student_id, course_id)
+    SELECT DISTINCT student_id, 1 + (student_id * 31 + j * 7919) %% %(courses)s
+    FROM student CROSS JOIN generate_series(0, 4) j;
+
+    INSERT INTO assessment (student_id, exam_event_id, grade)
+    SELECT enrollment.student_id, exam_event.exam_event_id, round((random() * 100)::NUMERIC, 2)
+    FROM enrollment
+    JOIN exam_event ON exam_event.course_id = enrollment.course_id;
+"""
+
+
+class LocalCluster:
+    """Throwaway PostgreSQL cluster in a temporary directory, reached through a unix socket."""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin
+        self.directory = tempfile.mkdtemp(prefix='plan_check_')
+        self.data = os.path.join(self.directory, 'data')
+        self.port = free_port()
+
+    def command(self, name):
+        return os.path.join(self.pg_bin, name) if self.pg_bin else shutil.which(name) or name
+
+    def start(self):
+        subprocess.run([self.command('initdb'), '-D', self.data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                       check=True, stdout=subprocess.DEVNULL)
+        options = f"-p {self.port} -k {self.directory} -c listen_addresses='' -c fsync=off"
+        subprocess.run([self.command('pg_ctl'), '-D', self.data, '-o', options, '-l',
+                        os.path.join(self.directory, 'server.log'), '-w', 'start'],
+                       check=True, stdout=subprocess.DEVNULL)
+        return {'host': self.directory, 'port': self.port, 'user': 'postgres', 'dbname': 'postgres'}
+
+    def stop(self):
+        subprocess.run([self.command('pg_ctl'), '-D', self.data, '-m', 'fast', '-w', 'stop'],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def grades_queries(path='grades.py'):
+    """Find the SQL statements of the menus in grades.py, keyed by Class.method.
+
+    A method running several statements gets a key per statement, numbered
+    in their order in the source.
+
+    Statements are the string literals passed to cursor.execute and the
+    *_QUERY class attributes passed to fetchall. f-strings that insert other
+    class attributes (e.g. the summary columns) are expanded, and so are the
+    queries passed through Menu.sql, without their partition pruning
+    condition since the datasets aren't partitioned.
+    """
+    tree = ast.parse(open(path, 'r').read())
+    queries = {}
+    for cls in tree.body:
+        if not isinstance(cls, ast.ClassDef):
+            continue
+        constants = class_constants(cls)
+        for function in cls.body:
+            if not isinstance(function, ast.FunctionDef):
+                continue
+            calls = sorted((node for node in ast.walk(function) if isinstance(node, ast.Call)),
+                           key=lambda node: (node.lineno, node.col_offset))
+            statements = []
+            for call in calls:
+                if not (isinstance(call.func, ast.Attribute) and call.func.attr in ('execute', 'fetchall') and call.args):
+                    continue
+                sql = query_text(call.args[0], constants)
+                if sql is None or not sql.strip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                statements.append(' '.join(sql.split()))
+            key = f"{cls.name}.{function.name}"
+            for i, sql in enumerate(statements, 1):
+                queries[key if len(statements) == 1 else f"{key} #{i}"] = sql
+    return queries
+
+
+def sample_params_query(key):
+    """Query of the sample parameters of a statement, those of its method unless it has its own."""
+    return SAMPLE_PARAMS.get(key) or SAMPLE_PARAMS.get(key.split(' #')[0])
+
+
+def class_constants(cls):
+    """String class attributes of a class definition."""
+    return {
+        node.targets[0].id: node.value.value
+        for node in cls.body
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+    }
+
+
+def grades_constants(path='grades.py'):
+    """String class attributes of every class of grades.py, by class name."""
+    tree = ast.parse(open(path, 'r').read())
+    return {cls.name: class_constants(cls) for cls in tree.body if isinstance(cls, ast.ClassDef)}
+
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    """Cursor keeping the statements it executes, with their parameters bound."""
+
+    def execute(self, query, vars=None):
+        self.statements.append(self.mogrify(query, vars).decode())
+        return super().execute(query, vars)
+
+
+def helper_queries(conn, constants):
+    """Run the HELPER_CALLS on the loaded dataset and return the SELECT statements they executed.
+
+    The statements have their parameters bound already. A call executing
+    several statements gets a key per statement, numbered in their order.
+    """
+    queries = {}
+    for key, call in HELPER_CALLS.items():
+        cursor = conn.cursor(cursor_factory=RecordingCursor)
+        cursor.statements = []
+        cursor.execute("SET search_path TO grades;")
+        call(cursor, constants)
+        statements = [sql for sql in cursor.statements if sql.strip().upper().startswith(('SELECT', 'WITH'))]
+        cursor.close()
+        for i, sql in enumerate(statements, 1):
+            queries[key if len(statements) == 1 else f"{key} #{i}"] = ' '.join(sql.split())
+    return queries
+
+
+def query_text(node, constants):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Attribute) and node.attr in constants:
+        return constants[node.attr]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'sql' and node.args:
+        text = query_text(node.args[0], constants)
+        return None if text is None else text.format(pruning='')
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                part = query_text(value.value, constants)
+                if part is None:
+                    return None
+                parts.append(part)
+            else:
+                parts.append(value.value)
+        return ''.join(parts)
+    return None
+
+
+def plan_shape(plan):
+    """Node types, relations and indexes of a plan, without costs and row estimates."""
+    label = plan['Node Type']
+    if 'Index Name' in plan:
+        label += f" using {plan['Index Name']}"
+    if 'Relation Name' in plan:
+        label += f" on {plan['Relation Name']}"
+    children = plan.get('Plans', [])
+    if children:
+        label += '(' + ', '.join(plan_shape(child) for child in children) + ')'
+    return label
+
+
+def load_dataset(conn, students):
+    """Recreate the grades tables with a generated dataset and the derived tables."""
+    conn.autocommit = False
+    cursor = conn.cursor()
+    cursor.execute(open("grades.sql", "r").read())
+    cursor.execute(DATASET_SQL, {'students': students, 'courses': max(20, students // 50)})
+    gpa.install(cursor)
+    gpa.GpaEngine().rebuild(cursor)
+    ranking.install(cursor)
+    ranking.refresh(cursor)
+    read_model.install(cursor)
+    read_model.refresh(cursor)
+    cube.install(cursor)
+    cube.rebuild(cursor)
+    generation.install(cursor)
+    generation.bump_generation(cursor)
+    conn.commit()
+
+    # The checked queries only read, run them outside of a transaction so a failing one doesn't undo the settings
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE;")
+    cursor.execute("SET search_path TO grades;")
+    # Parallel plans depend on the machine, keep the shapes comparable between runs
+    cursor.execute("SET max_parallel_workers_per_gather TO 0;")
+    cursor.execute("SET jit TO off;")
+    return cursor
+
+
+def check_query(cursor, key, sql):
+    """Return the plan shape and the median time in milliseconds of a query."""
+    params = None
+    if '%s' in sql:
+        cursor.execute(sample_params_query(key))
+        params = cursor.fetchone()
+
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    shape = plan_shape(cursor.fetchone()[0][0]['Plan'])
+
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return shape, statistics.median(timings)
+
+
+def check_scale(conn, scale, queries, constants, baselines, update):
+    """Run every query at a scale and return the failures, updating the baselines if asked."""
+    print(f"Loading the {scale} dataset ({SCALES[scale]} students)...")
+    cursor = load_dataset(conn, SCALES[scale])
+    expected = baselines.setdefault(scale, {})
+    failures = []
+
+    try:
+        queries = dict(queries, **helper_queries(conn, constants))
+    except psycopg2.Error as error:
+        failures.append(f"{scale} helper queries: failed: {str(error).strip()}")
+
+    for key, sql in sorted(queries.items()):
+        try:
+            shape, elapsed = check_query(cursor, key, sql)
+        except (psycopg2.Error, IndexError, KeyError) as error:
+            # A bad sample (wrong number of parameters, none at all) fails its query, not the whole run
+            failures.append(f"{scale} {key}: query failed: {type(error).__name__}: {str(error).strip()}")
+            continue
+
+        baseline = expected.get(key)
+        if update:
+            expected[key] = {'plan': shape, 'budget_ms': round(max(MIN_BUDGET_MS, elapsed * BUDGET_FACTOR), 1)}
+            status = "recorded"
+        elif baseline is None:
+            failures.append(f"{scale} {key}: no baseline, record one with --update")
+            status = "NO BASELINE"
+        elif baseline['plan'] != shape:
+            failures.append(f"{scale} {key}: plan changed\n    expected: {baseline['plan']}\n    actual:   {shape}")
+            status = "PLAN CHANGED"
+        elif elapsed > baseline['budget_ms']:
+            failures.append(f"{scale} {key}: {elapsed:.1f} ms over the budget of {baseline['budget_ms']} ms")
+            status = "OVER BUDGET"
+        else:
+            status = "ok"
+        print(f"  {key:<50} {elapsed:9.1f} ms  {status}")
+
+    checked = len(queries)
+    if update:
+        for key in set(expected) - set(queries):
+            del expected[key]
+    cursor.close()
+    return failures, checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans and latencies of the grades.py queries and of the helper modules they call.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    parser.add_argument('--dsn', help="scratch database to use instead of a temporary cluster, its grades schema is replaced")
+    parser.add_argument('--pg-bin', help="directory of initdb and pg_ctl when they are not on the PATH")
+    parser.add_argument('--baselines', default=BASELINE_FILE)
+    parser.add_argument('--update', action='store_true', help="record the current plans and budgets as the baselines")
+    args = parser.parse_args()
+
+    queries = grades_queries()
+    constants = grades_constants()
+    missing = [key for key, sql in queries.items() if '%s' in sql and sample_params_query(key) is None]
+    if missing:
+        print(f"No sample parameters for: {', '.join(sorted(missing))}")
+        return 1
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, 'r') as baseline_file:
+            baselines = json.load(baseline_file)
+
+    cluster = None
+    if args.dsn:
+        conn = psycopg2.connect(args.dsn)
+    else:
+        cluster = LocalCluster(args.pg_bin)
+        conn = psycopg2.connect(**cluster.start())
+
+    failures = []
+    checked = len(queries)
+    try:
+        for scale in args.scales:
+            scale_failures, checked = check_scale(conn, scale, queries, constants, baselines, args.update)
+            failures += scale_failures
+    finally:
+        conn.close()
+        if cluster:
+            cluster.stop()
+
+    if args.update:
+        with open(args.baselines, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Baselines written to {args.baselines}")
+
+    for failure in failures:
+        print(failure)
+    print(f"{checked} queries at {len(args.scales)} scales, {len(failures)} failures.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
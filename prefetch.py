@@ -0,0 +1,126 @@
+import threading
+import psycopg2.extensions
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from psycopg2.pool import ThreadedConnectionPool
+from cancellable import QueryCancelled
+from generation import current_generation
+
+# Results kept in the session, the oldest are dropped first
+MAX_RESULTS = 256
+
+
+class Prefetcher:
+    """Run the queries of the likely next screens in the background.
+
+    Queries are keyed by their text and parameters. When a menu action asks
+    for a result that was prefetched it gets it from the session (waiting for
+    the query to finish if it is still running) instead of sending it again.
+
+    Every query asks the router for its server when it starts, like the menu
+    connections, and runs on a connection of the pool of that server, with
+    the statement timeout of the action that will read it. The results are
+    dropped when a new load generation shows up.
+    """
+
+    def __init__(self, router, workers=2):
+        self.router = router
+        self.workers = workers
+        # Server name -> pool of connections to it
+        self.pools = {}
+        self.lock = threading.Lock()
+        # The first server is connected right away, so that an unreachable database disables prefetching
+        self.pool(router.read_node())
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='prefetch')
+        self.results = OrderedDict()
+        # Key of each running query -> its connection, to cancel it
+        self.running = {}
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def pool(self, node):
+        with self.lock:
+            if node.name not in self.pools:
+                self.pools[node.name] = ThreadedConnectionPool(1, self.workers, **node.params)
+            return self.pools[node.name]
+
+    def _run(self, query, params, timeout):
+        pool = self.pool(self.router.read_node())
+        conn = pool.getconn()
+        self.running[(query, params)] = conn
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET search_path TO grades;")
+                # Undone by the rollback, like the search path
+                cursor.execute("SET LOCAL statement_timeout = %s;", (timeout,))
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+            conn.rollback()
+            return rows
+        finally:
+            self.running.pop((query, params), None)
+            pool.putconn(conn)
+
+    def sync(self, cursor):
+        """Drop the results of the previous load generation, if a load happened since they were read."""
+        generation = current_generation(cursor)
+        if generation != self.generation:
+            self.results.clear()
+            self.generation = generation
+
+    def prefetch(self, queries):
+        """Start the (query, params, timeout) triples that are not already in the session."""
+        for query, params, timeout in queries:
+            key = (query, params)
+            if key in self.results:
+                self.results.move_to_end(key)
+                continue
+            self.results[key] = self.executor.submit(self._run, query, params, timeout)
+            while len(self.results) > MAX_RESULTS:
+                self.results.popitem(last=False)
+
+    def cancel(self, key, future):
+        """Stop a prefetched query, on the server too, and wait until it has stopped."""
+        future.cancel()
+        while not future.done():
+            conn = self.running.get(key)
+            if conn is not None:
+                conn.cancel()
+            wait([future], timeout=0.1)
+        self.results.pop(key, None)
+
+    def fetchall(self, cursor, query, params=None):
+        """Return the rows of a query, from the session when it was prefetched."""
+        self.sync(cursor)
+        key = (query, params)
+        future = self.results.get(key)
+        if future is not None:
+            try:
+                rows = future.result()
+                self.hits += 1
+                return rows
+            except KeyboardInterrupt:
+                self.cancel(key, future)
+                raise QueryCancelled("Prefetched query cancelled.")
+            except psycopg2.extensions.QueryCanceledError:
+                del self.results[key]
+                raise QueryCancelled("Prefetched query stopped by the statement timeout.")
+            except Exception:
+                # Run it again on the menu connection so that the error shows up as usual
+                del self.results[key]
+
+        self.misses += 1
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        for conn in list(self.running.values()):
+            conn.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for pool in self.pools.values():
+            pool.closeall()
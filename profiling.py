@@ -0,0 +1,192 @@
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Seconds between two stack samples of the profiled thread
+SAMPLE_INTERVAL = 0.005
+
+# Frames kept per allocation traceback, the allocations are reported by line
+TRACEBACK_FRAMES = 1
+
+# Lines of the CPU and allocation reports
+TOP = 40
+
+
+class Section:
+    """Profiles of every run of one menu action or loader phase."""
+
+    def __init__(self, key):
+        self.key = key
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        # Wall time spent paused, e.g. waiting for the user, left out of the wall time
+        self.paused = 0.0
+        self.allocated = 0
+        self.peak = 0
+        self.profile = cProfile.Profile(time.process_time)
+        # Allocation site -> [bytes, blocks], from the sampled runs
+        self.allocations = defaultdict(lambda: [0, 0])
+        self.sampled = 0
+        self.sampled_at = None
+
+
+class Profiler:
+    """CPU, allocation and stack sampling profiles per menu action or loader phase.
+
+    Every section runs under its own cProfile profile, timed on CPU time.
+    tracemalloc counts the memory allocated by every run and, at most every
+    allocation_interval seconds per section, compares snapshots to find the
+    lines allocating it. A thread samples the stack of the profiled thread
+    every SAMPLE_INTERVAL seconds for a collapsed stack file, which
+    flamegraph.pl or speedscope draw as a flame graph.
+
+    Without a directory the profiler is disabled and sections cost nothing.
+    """
+
+    def __init__(self, directory=None, allocation_interval=0.0):
+        self.directory = directory
+        self.allocation_interval = allocation_interval
+        self.sections = {}
+        self.stacks = defaultdict(int)
+        self.current = None
+        if not self.enabled:
+            return
+        tracemalloc.start(TRACEBACK_FRAMES)
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def section(self, key):
+        """Context manager profiling the code it wraps under a key."""
+        if not self.enabled:
+            return nullcontext()
+        return self.profiled(key)
+
+    @contextmanager
+    def profiled(self, key):
+        section = self.sections.get(key)
+        if section is None:
+            section = self.sections[key] = Section(key)
+        now = time.monotonic()
+        snapshot = None
+        if section.sampled_at is None or now - section.sampled_at >= self.allocation_interval:
+            snapshot = tracemalloc.take_snapshot()
+            section.sampled_at = now
+
+        tracemalloc.reset_peak()
+        memory = tracemalloc.get_traced_memory()[0]
+        paused = section.paused
+        start = time.perf_counter()
+        cpu = time.process_time()
+        self.current = key
+        section.profile.enable()
+        try:
+            yield
+        finally:
+            section.profile.disable()
+            self.current = None
+            section.cpu += time.process_time() - cpu
+            section.wall += time.perf_counter() - start - (section.paused - paused)
+            current, peak = tracemalloc.get_traced_memory()
+            section.allocated += current - memory
+            section.peak = max(section.peak, peak - memory)
+            section.calls += 1
+            if snapshot is not None:
+                self.add_allocations(section, snapshot)
+
+    @contextmanager
+    def paused(self):
+        """Context manager leaving the code it wraps, e.g. a prompt, out of the current section."""
+        key = self.current
+        if not self.enabled or key is None:
+            yield
+            return
+        section = self.sections[key]
+        section.profile.disable()
+        self.current = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            section.paused += time.perf_counter() - start
+            self.current = key
+            section.profile.enable()
+
+    def add_allocations(self, section, before):
+        # Comparing snapshots takes a while on a large heap, hence the sampling
+        for stat in tracemalloc.take_snapshot().compare_to(before, 'lineno'):
+            frame = stat.traceback[0]
+            if stat.size_diff > 0 and frame.filename not in (tracemalloc.__file__, __file__):
+                site = section.allocations[f"{frame.filename}:{frame.lineno}"]
+                site[0] += stat.size_diff
+                site[1] += stat.count_diff
+        section.sampled += 1
+
+    def sample(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            key = self.current
+            frame = sys._current_frames().get(self.thread_id)
+            if key is None or frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Root first, the key as the root frame; ';' separates the frames
+            stack = ';'.join([key.replace(';', ',')] + [name.replace(';', ',') for name in reversed(names)])
+            self.stacks[stack] += 1
+
+    def write(self):
+        """Write the profiles of every section and print a summary."""
+        if not self.enabled:
+            return
+        self.stopped.set()
+        self.sampler.join()
+        tracemalloc.stop()
+        os.makedirs(self.directory, exist_ok=True)
+
+        names = set()
+        print(f"{'Calls':>7} {'Wall s':>9} {'CPU s':>9} {'Allocated':>12} {'Peak':>12}  Section")
+        for section in sorted(self.sections.values(), key=lambda section: section.wall, reverse=True):
+            name = file_name(section.key, names)
+            section.profile.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+            with open(os.path.join(self.directory, f"{name}.cpu.txt"), 'w') as out:
+                out.write(f"{section.key}\n{section.calls} calls, {section.cpu:.3f}s CPU, {section.wall:.3f}s wall\n\n")
+                pstats.Stats(section.profile, stream=out).sort_stats('cumulative').print_stats(TOP)
+            with open(os.path.join(self.directory, f"{name}.alloc.txt"), 'w') as out:
+                out.write(f"{section.key}\n{section.calls} calls, {section.allocated} bytes kept, "
+                          f"{section.peak} bytes peak, lines from {section.sampled} sampled calls\n\n")
+                top = sorted(section.allocations.items(), key=lambda item: item[1][0], reverse=True)[:TOP]
+                for site, (size, count) in top:
+                    out.write(f"{size:>12} B {count:>9} blocks  {site}\n")
+            print(f"{section.calls:>7} {section.wall:>9.3f} {section.cpu:>9.3f} {section.allocated:>12} {section.peak:>12}  {section.key}")
+
+        with open(os.path.join(self.directory, 'stacks.collapsed'), 'w') as out:
+            for stack, count in sorted(self.stacks.items()):
+                out.write(f"{stack} {count}\n")
+        print(f"Profiles written to {self.directory} (flame graph: flamegraph.pl {os.path.join(self.directory, 'stacks.collapsed')})")
+
+
+def file_name(key, taken):
+    """A file name for a section key, unique among the taken ones."""
+    name = re.sub(r'[^a-z0-9]+', '_', key.lower()).strip('_')[:60] or 'section'
+    unique, i = name, 1
+    while unique in taken:
+        i += 1
+        unique = f"{name}_{i}"
+    taken.add(unique)
+    return unique
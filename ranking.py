@@ -0,0 +1,121 @@
+from collections import namedtuple
+
+Ranked = namedtuple('Ranked', 'student_id first_name last_name value position rank percentile')
+
+# Ranking name -> (table, partition column or None, ranked value column)
+RANKINGS = {
+    'student': ('student_rank', None, 'average_grade'),
+    'course': ('course_rank', 'course_id', 'average_grade'),
+    'exam_event': ('exam_event_rank', 'exam_event_id', 'grade'),
+}
+
+
+def install(cursor):
+    """Create the empty ranking tables."""
+    cursor.execute(open("ranking.sql", "r").read())
+
+
+def refresh(cursor):
+    """Recompute every ranking from the assessments."""
+    cursor.execute("""
+        TRUNCATE student_rank, course_rank, exam_event_rank;
+
+        INSERT INTO student_rank (student_id, average_grade, position, rank, percentile)
+        SELECT student_id, average_grade,
+               ROW_NUMBER() OVER (ORDER BY average_grade DESC, student_id),
+               RANK() OVER (ORDER BY average_grade DESC),
+               100 * (1 - PERCENT_RANK() OVER (ORDER BY average_grade DESC))
+        FROM (
+            SELECT student_id, AVG(grade) AS average_grade
+            FROM assessment
+            GROUP BY student_id
+        ) averages;
+
+        INSERT INTO course_rank (course_id, student_id, average_grade, position, rank, percentile)
+        SELECT course_id, student_id, average_grade,
+               ROW_NUMBER() OVER (PARTITION BY course_id ORDER BY average_grade DESC, student_id),
+               RANK() OVER (PARTITION BY course_id ORDER BY average_grade DESC),
+               100 * (1 - PERCENT_RANK() OVER (PARTITION BY course_id ORDER BY average_grade DESC))
+        FROM (
+            SELECT exam_event.course_id, assessment.student_id, AVG(assessment.grade) AS average_grade
+            FROM assessment
+            JOIN exam_event ON assessment.exam_event_id = exam_event.exam_event_id
+            GROUP BY exam_event.course_id, assessment.student_id
+        ) averages;
+
+        INSERT INTO exam_event_rank (exam_event_id, student_id, grade, position, rank, percentile)
+        SELECT exam_event_id, student_id, grade,
+               ROW_NUMBER() OVER (PARTITION BY exam_event_id ORDER BY grade DESC, student_id),
+               RANK() OVER (PARTITION BY exam_event_id ORDER BY grade DESC),
+               100 * (1 - PERCENT_RANK() OVER (PARTITION BY exam_event_id ORDER BY grade DESC))
+        FROM assessment;
+
+        ANALYZE student_rank;
+        ANALYZE course_rank;
+        ANALYZE exam_event_rank;
+    """)
+
+
+def _query(cursor, ranking, where, params, order=True):
+    table, key, value = RANKINGS[ranking]
+    cursor.execute(f"""
+        SELECT student.student_id, student.first_name, student.last_name,
+               {table}.{value}, {table}.position, {table}.rank, {table}.percentile
+        FROM {table}
+        JOIN student ON student.student_id = {table}.student_id
+        WHERE {where}
+        {'ORDER BY ' + table + '.position' if order else ''};
+    """, params)
+    return [Ranked(*row) for row in cursor.fetchall()]
+
+
+def _key_filter(ranking, key_value):
+    table, key, _ = RANKINGS[ranking]
+    if key is None:
+        return "TRUE", ()
+    return f"{table}.{key} = %s", (key_value,)
+
+
+def top_k(cursor, ranking, k=10, key_value=None):
+    """The k best students of a ranking, read with a range scan on (key, position)."""
+    table = RANKINGS[ranking][0]
+    where, params = _key_filter(ranking, key_value)
+    return _query(cursor, ranking, f"{where} AND {table}.position <= %s", params + (k,))
+
+
+def all_ranked(cursor, ranking, key_value=None):
+    """Every student of a ranking, best first."""
+    where, params = _key_filter(ranking, key_value)
+    return _query(cursor, ranking, where, params)
+
+
+def student_rank(cursor, ranking, student_id, key_value=None):
+    """Rank and percentile of a student in a ranking, None if they are not in it."""
+    table = RANKINGS[ranking][0]
+    where, params = _key_filter(ranking, key_value)
+    rows = _query(cursor, ranking, f"{where} AND {table}.student_id = %s", params + (student_id,), order=False)
+    return rows[0] if rows else None
+
+
+def neighbors(cursor, ranking, student_id, k=2, key_value=None):
+    """The students ranked up to k positions above and below a student, the student included."""
+    ranked = student_rank(cursor, ranking, student_id, key_value)
+    if ranked is None:
+        return []
+    table = RANKINGS[ranking][0]
+    where, params = _key_filter(ranking, key_value)
+    return _query(cursor, ranking, f"{where} AND {table}.position BETWEEN %s AND %s",
+                  params + (ranked.position - k, ranked.position + k))
+
+
+def course_ranks_of_student(cursor, student_id):
+    """Rank and percentile of a student in each course they have grades in."""
+    cursor.execute("""
+        SELECT course.course_name, course_rank.average_grade, course_rank.rank, course_rank.percentile,
+               (SELECT MAX(position) FROM course_rank total WHERE total.course_id = course_rank.course_id)
+        FROM course_rank
+        JOIN course ON course.course_id = course_rank.course_id
+        WHERE course_rank.student_id = %s
+        ORDER BY course.course_name;
+    """, (student_id,))
+    return cursor.fetchall()
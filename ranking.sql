@@ -0,0 +1,42 @@
+SET SEARCH_PATH TO grades;
+
+-- Precomputed rankings, refreshed by ranking.py after each load. position is
+-- unique within a ranking (ties broken by student_id) and is what top-K and
+-- neighbor queries range over; rank repeats for tied grades.
+DROP TABLE IF EXISTS student_rank;
+DROP TABLE IF EXISTS course_rank;
+DROP TABLE IF EXISTS exam_event_rank;
+
+CREATE TABLE student_rank (
+    student_id INTEGER PRIMARY KEY,
+    average_grade NUMERIC NOT NULL,
+    position INTEGER NOT NULL UNIQUE,
+    rank INTEGER NOT NULL,
+    percentile NUMERIC NOT NULL
+);
+
+
+CREATE TABLE course_rank (
+    course_id INTEGER,
+    student_id INTEGER,
+    average_grade NUMERIC NOT NULL,
+    position INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    percentile NUMERIC NOT NULL,
+    PRIMARY KEY (course_id, student_id),
+    UNIQUE (course_id, position)
+);
+
+
+CREATE TABLE exam_event_rank (
+    exam_event_id INTEGER,
+    student_id INTEGER,
+    grade NUMERIC NOT NULL,
+    position INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    percentile NUMERIC NOT NULL,
+    PRIMARY KEY (exam_event_id, student_id),
+    UNIQUE (exam_event_id, position)
+);
+
+CREATE INDEX ON course_rank (student_id);
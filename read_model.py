@@ -0,0 +1,53 @@
+def install(cursor):
+    """Create an empty exam_event_summary table."""
+    cursor.execute(open("exam_event_summary.sql", "r").read())
+
+
+def refresh(cursor, exam_event_ids=None):
+    """Recompute the summary rows of the given exam events, or of all of them when no ids are given."""
+    if exam_event_ids is not None and not exam_event_ids:
+        return
+
+    if exam_event_ids is None:
+        events_filter, assessments_filter, params = "TRUE", "TRUE", ()
+    else:
+        ids = list(exam_event_ids)
+        events_filter = "exam_event.exam_event_id = ANY(%s)"
+        assessments_filter = "assessment.exam_event_id = ANY(%s)"
+        params = (ids, ids)
+
+    cursor.execute(f"""
+        INSERT INTO exam_event_summary (
+            exam_event_id, date, exam_type_id, exam_name, course_id, course_name,
+            room_id, room_name, building_id, building_name, capacity, assessment_count, grade_sum
+        )
+        SELECT exam_event.exam_event_id, exam_event.date, exam_type.exam_type_id, exam_type.exam_name,
+               course.course_id, course.course_name, room.room_id, room.room_name,
+               building.building_id, building.building_name, room.capacity,
+               COALESCE(totals.assessment_count, 0), COALESCE(totals.grade_sum, 0)
+        FROM exam_event
+        JOIN exam_type ON exam_event.exam_type_id = exam_type.exam_type_id
+        JOIN course ON exam_event.course_id = course.course_id
+        JOIN room ON exam_event.room_id = room.room_id
+        JOIN building ON room.building_id = building.building_id
+        LEFT JOIN (
+            SELECT assessment.exam_event_id, COUNT(*) AS assessment_count, SUM(assessment.grade) AS grade_sum
+            FROM assessment
+            WHERE {assessments_filter}
+            GROUP BY assessment.exam_event_id
+        ) totals ON totals.exam_event_id = exam_event.exam_event_id
+        WHERE {events_filter}
+        ON CONFLICT (exam_event_id) DO UPDATE SET
+            date = EXCLUDED.date,
+            exam_type_id = EXCLUDED.exam_type_id,
+            exam_name = EXCLUDED.exam_name,
+            course_id = EXCLUDED.course_id,
+            course_name = EXCLUDED.course_name,
+            room_id = EXCLUDED.room_id,
+            room_name = EXCLUDED.room_name,
+            building_id = EXCLUDED.building_id,
+            building_name = EXCLUDED.building_name,
+            capacity = EXCLUDED.capacity,
+            assessment_count = EXCLUDED.assessment_count,
+            grade_sum = EXCLUDED.grade_sum;
+    """, params)
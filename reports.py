@@ -0,0 +1,302 @@
+import os
+import sys
+import csv
+import html
+import time
+import argparse
+import psycopg2
+from collections import deque, namedtuple, defaultdict
+from itertools import groupby
+from multiprocessing import Pool
+from database import Router
+from validation import chunks
+
+# Rows fetched per round trip from the server side cursors
+ITERSIZE = 5000
+
+# Students or courses rendered per task sent to a worker process
+CHUNK_SIZE = 200
+
+# Lines of text per PDF page
+PAGE_LINES = 64
+
+FORMATS = ('html', 'csv', 'pdf')
+
+KINDS = ('transcripts', 'courses')
+
+# A rendered report: file name (without extension), title, (label, value) details,
+# and (heading, columns, rows) sections
+Document = namedtuple('Document', 'name title details sections')
+
+# Every student with their assessments, in primary key order of assessment so
+# that no sort is needed; the assessments of a student are sorted by date when rendered
+TRANSCRIPT_QUERY = """
+    SELECT student.student_id, student.first_name, student.last_name, student.email,
+           student.gpa::float8, state.state_name,
+           summary.date, summary.course_name, summary.exam_name, assessment.grade::float8
+    FROM student
+    JOIN state ON state.state_id = student.state_id
+    LEFT JOIN assessment ON assessment.student_id = student.student_id
+    LEFT JOIN exam_event_summary summary ON summary.exam_event_id = assessment.exam_event_id
+    ORDER BY student.student_id, assessment.exam_event_id;
+"""
+
+COURSE_EVENTS_QUERY = """
+    SELECT course.course_id, course.course_name,
+           summary.date, summary.exam_name, summary.room_name, summary.building_name,
+           summary.assessment_count, summary.grade_sum::float8
+    FROM course
+    LEFT JOIN exam_event_summary summary ON summary.course_id = course.course_id
+    ORDER BY course.course_id, summary.date;
+"""
+
+# The students of every course in rank order, read from the (course_id, position) key
+COURSE_STUDENTS_QUERY = """
+    SELECT course_rank.course_id, course_rank.rank, student.first_name, student.last_name,
+           student.email, course_rank.average_grade::float8, course_rank.percentile::float8
+    FROM course_rank
+    JOIN student ON student.student_id = course_rank.student_id
+    ORDER BY course_rank.course_id, course_rank.position;
+"""
+
+
+def stream(conn, name, query):
+    """Rows of a query from a named (server side) cursor, ITERSIZE at a time."""
+    with conn.cursor(name=name) as cursor:
+        cursor.itersize = ITERSIZE
+        cursor.execute(query)
+        yield from cursor
+
+
+def grouped(rows):
+    """(key, rows without the key) of rows sorted by their first column."""
+    for key, group in groupby(rows, key=lambda row: row[0]):
+        yield key, [row[1:] for row in group]
+
+
+def transcripts(conn):
+    """(student, assessments) of every student, from one streaming query."""
+    for student_id, rows in grouped(stream(conn, 'report_transcripts', TRANSCRIPT_QUERY)):
+        student = (student_id,) + rows[0][:5]
+        # The LEFT JOIN gives a row without grade to students without assessments
+        assessments = [row[5:] for row in rows if row[8] is not None]
+        yield student, assessments
+
+
+def courses(conn):
+    """(course, exam events, ranked students) of every course, merging two streaming queries."""
+    students = grouped(stream(conn, 'report_course_students', COURSE_STUDENTS_QUERY))
+    pending = next(students, None)
+    for course_id, rows in grouped(stream(conn, 'report_course_events', COURSE_EVENTS_QUERY)):
+        course = (course_id, rows[0][0])
+        events = [row[1:] for row in rows if row[1] is not None]
+        ranked = []
+        # Both streams are ordered by course_id, skip ranks of courses that are gone
+        while pending and pending[0] < course_id:
+            pending = next(students, None)
+        if pending and pending[0] == course_id:
+            ranked = pending[1]
+            pending = next(students, None)
+        yield course, events, ranked
+
+
+def transcript_document(entity):
+    (student_id, first_name, last_name, email, gpa, state_name), assessments = entity
+    assessments = sorted(assessments, key=lambda row: (row[0], row[1], row[2]))
+
+    by_course = defaultdict(list)
+    for _, course_name, _, grade in assessments:
+        by_course[course_name].append(grade)
+    grades = [grade for *_, grade in assessments]
+
+    return Document(
+        name=str(student_id),
+        title=f"Transcript of {first_name} {last_name}",
+        details=[
+            ('Student ID', student_id),
+            ('Email', email),
+            ('Home state', state_name),
+            ('GPA', f"{gpa:.2f}"),
+            ('Assessments', len(grades)),
+            ('Average grade', f"{sum(grades) / len(grades):.2f}" if grades else '-'),
+        ],
+        sections=[
+            ('Course averages', ('Course', 'Assessments', 'Average'),
+             [(course_name, len(course_grades), f"{sum(course_grades) / len(course_grades):.2f}")
+              for course_name, course_grades in sorted(by_course.items())]),
+            ('Assessments', ('Date', 'Course', 'Exam', 'Grade'),
+             [(date, course_name, exam_name, f"{grade:.2f}") for date, course_name, exam_name, grade in assessments]),
+        ],
+    )
+
+
+def course_document(entity):
+    (course_id, course_name), events, ranked = entity
+    count = sum(event[4] for event in events)
+    total = sum(event[5] for event in events)
+    mean = lambda count, total: f"{total / count:.2f}" if count else '-'
+
+    return Document(
+        name=str(course_id),
+        title=f"Grade report of {course_name}",
+        details=[
+            ('Course ID', course_id),
+            ('Exam events', len(events)),
+            ('Students graded', len(ranked)),
+            ('Assessments', count),
+            ('Average grade', mean(count, total)),
+        ],
+        sections=[
+            ('Exam events', ('Date', 'Exam', 'Room', 'Building', 'Assessments', 'Average'),
+             [(date, exam_name, room_name, building_name, assessments, mean(assessments, grade_sum))
+              for date, exam_name, room_name, building_name, assessments, grade_sum in events]),
+            ('Students', ('Rank', 'Name', 'Email', 'Average', 'Percentile'),
+             [(rank, f"{first_name} {last_name}", email, f"{average:.2f}", f"{percentile:.1f}")
+              for rank, first_name, last_name, email, average, percentile in ranked]),
+        ],
+    )
+
+
+DOCUMENTS = {
+    'transcripts': transcript_document,
+    'courses': course_document,
+}
+
+
+def write_html(document, path):
+    cell = lambda value: html.escape(str(value))
+    parts = [
+        f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{cell(document.title)}</title></head><body>\n",
+        f"<h1>{cell(document.title)}</h1>\n<table>\n",
+    ]
+    parts += [f"<tr><th>{cell(label)}</th><td>{cell(value)}</td></tr>\n" for label, value in document.details]
+    parts.append("</table>\n")
+    for heading, columns, rows in document.sections:
+        parts.append(f"<h2>{cell(heading)}</h2>\n<table>\n<tr>{''.join(f'<th>{cell(column)}</th>' for column in columns)}</tr>\n")
+        parts += [f"<tr>{''.join(f'<td>{cell(value)}</td>' for value in row)}</tr>\n" for row in rows]
+        parts.append("</table>\n")
+    parts.append("</body></html>\n")
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write(''.join(parts))
+
+
+def write_csv(document, path):
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow([document.title])
+        writer.writerows(document.details)
+        for heading, columns, rows in document.sections:
+            writer.writerow([])
+            writer.writerow([heading])
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+
+def text_lines(document):
+    """The document as lines of aligned text, for the PDF pages."""
+    lines = [document.title, '']
+    width = max((len(label) for label, _ in document.details), default=0)
+    lines += [f"{label:<{width}}  {value}" for label, value in document.details]
+    for heading, columns, rows in document.sections:
+        rows = [[str(value) for value in row] for row in rows]
+        widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(columns)]
+        lines += ['', heading, '  '.join(f"{column:<{width}}" for column, width in zip(columns, widths))]
+        lines += ['  '.join(f"{value:<{width}}" for value, width in zip(row, widths)) for row in rows]
+    return lines
+
+
+def write_pdf(document, path):
+    # Imported in the worker processes only, and without pyplot there is no GUI backend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    lines = text_lines(document)
+    with PdfPages(path) as pdf:
+        for start in range(0, len(lines), PAGE_LINES):
+            figure = Figure(figsize=(8.27, 11.69))
+            figure.text(0.06, 0.96, '\n'.join(lines[start:start + PAGE_LINES]),
+                        family='monospace', fontsize=7, verticalalignment='top')
+            pdf.savefig(figure)
+
+
+WRITERS = {
+    'html': write_html,
+    'csv': write_csv,
+    'pdf': write_pdf,
+}
+
+
+def render_chunk(kind, formats, directory, entities):
+    """Render a chunk of students or courses in every format, returning the number of files written."""
+    files = 0
+    for entity in entities:
+        document = DOCUMENTS[kind](entity)
+        for output_format in formats:
+            WRITERS[output_format](document, os.path.join(directory, kind, f"{document.name}.{output_format}"))
+            files += 1
+    return files
+
+
+def render_all(kind, entities, formats, directory, workers, chunk_size=CHUNK_SIZE):
+    """Render every entity across a pool of worker processes, returning (entities, files)."""
+    os.makedirs(os.path.join(directory, kind), exist_ok=True)
+    count = files = 0
+    with Pool(workers) as pool:
+        # A bounded window of chunks in flight keeps the workers busy while the stream is read
+        in_flight = deque()
+        for chunk in chunks(entities, chunk_size):
+            count += len(chunk)
+            in_flight.append(pool.apply_async(render_chunk, (kind, formats, directory, chunk)))
+            if len(in_flight) >= workers * 2:
+                files += in_flight.popleft().get()
+        while in_flight:
+            files += in_flight.popleft().get()
+    return count, files
+
+
+SOURCES = {
+    'transcripts': transcripts,
+    'courses': courses,
+}
+
+
+def generate(conn, kinds, formats, directory, workers):
+    for kind in kinds:
+        start = time.perf_counter()
+        count, files = render_all(kind, SOURCES[kind](conn), formats, directory, workers)
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed > 0 else 0
+        print(f"{count} {kind} ({files} files) written to {os.path.join(directory, kind)} in {elapsed:.2f}s ({rate:.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the transcripts of every student and the grade reports of every course.")
+    parser.add_argument('--output', default='reports', help="directory the reports are written to")
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['html'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes rendering the reports")
+    args = parser.parse_args()
+
+    try:
+        conn = Router().connect_read()
+    except psycopg2.Error as e:
+        print(f"Error connecting to the database: {e}", file=sys.stderr)
+        return 1
+
+    # Both course streams and the transcripts read the same snapshot of the data
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET search_path TO grades;")
+        start = time.perf_counter()
+        generate(conn, args.kinds, args.formats, args.output, args.workers)
+        print(f"Reports written in {time.perf_counter() - start:.2f}s")
+        conn.commit()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
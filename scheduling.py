@@ -0,0 +1,178 @@
+import sys
+import argparse
+import psycopg2
+from bisect import bisect_left
+from collections import namedtuple, defaultdict
+from datetime import datetime, timedelta
+from database import db_params
+
+ExamSlot = namedtuple('ExamSlot', 'exam_event_id date room_id course_id exam_type_id seats')
+RoomInfo = namedtuple('RoomInfo', 'room_id room_name building_id capacity has_projector has_computers is_accessible')
+Conflict = namedtuple('Conflict', 'kind room date exam_event_ids seats')
+Suggestion = namedtuple('Suggestion', 'exam_event_id date room')
+
+FEATURES = ('has_projector', 'has_computers', 'is_accessible')
+
+
+def fetch_rooms(cursor):
+    """Fetch every room with its capacity and features."""
+    cursor.execute("""
+        SELECT room_id, room_name, building_id, capacity, has_projector, has_computers, is_accessible
+        FROM room;
+    """)
+    return [RoomInfo(*row) for row in cursor.fetchall()]
+
+
+def fetch_exam_slots(cursor, start, end):
+    """Fetch the exam events between start and end with the number of seats they use."""
+    cursor.execute("""
+        SELECT exam_event.exam_event_id, exam_event.date, exam_event.room_id,
+               exam_event.course_id, exam_event.exam_type_id, COUNT(assessment.student_id)
+        FROM exam_event
+        LEFT JOIN assessment ON assessment.exam_event_id = exam_event.exam_event_id
+        WHERE exam_event.date BETWEEN %s AND %s
+        GROUP BY exam_event.exam_event_id;
+    """, (start, end))
+    return [ExamSlot(*row) for row in cursor.fetchall()]
+
+
+class Schedule:
+    """Room occupancy index for a date range.
+
+    Every room gets a bitmap with one bit per day of the range, so whether a
+    room is free on a day is a single bit test. Rooms are numbered by
+    ascending capacity and every day gets a bitmap of its busy rooms, so the
+    rooms that are free, big enough and have the required features on a day
+    are found with a handful of integer operations.
+    """
+
+    def __init__(self, rooms, slots, start, end):
+        self.start = start
+        self.days = (end - start).days + 1
+
+        self.rooms = sorted(rooms, key=lambda room: room.capacity)
+        self.capacities = [room.capacity for room in self.rooms]
+        self.index = {room.room_id: i for i, room in enumerate(self.rooms)}
+        self.all_rooms = (1 << len(self.rooms)) - 1
+
+        # Rooms (as bitmaps over room indexes) having each feature
+        self.feature_masks = {feature: 0 for feature in FEATURES}
+        for i, room in enumerate(self.rooms):
+            for feature in FEATURES:
+                if getattr(room, feature):
+                    self.feature_masks[feature] |= 1 << i
+
+        self.occupied = [0] * len(self.rooms)
+        self.busy_rooms = [0] * self.days
+        # Rooms already suggested on each day, not suggested again, and the suggestions per exam event
+        self.suggested = [0] * self.days
+        self.moves = {}
+        self.slots_by_room_day = defaultdict(list)
+        for slot in slots:
+            self.add(slot)
+
+    def day(self, value):
+        return (value - self.start).days
+
+    def add(self, slot):
+        """Book a slot in the index."""
+        room = self.index[slot.room_id]
+        day = self.day(slot.date)
+        self.occupied[room] |= 1 << day
+        self.busy_rooms[day] |= 1 << room
+        self.slots_by_room_day[room, day].append(slot)
+
+    def is_free(self, room_id, value):
+        """Check whether a room has no exam on the given date."""
+        return not (self.occupied[self.index[room_id]] >> self.day(value)) & 1
+
+    def conflicts(self):
+        """Find rooms that are double-booked or over capacity on a date."""
+        conflicts = []
+        for (room, day), slots in self.slots_by_room_day.items():
+            info = self.rooms[room]
+            date = self.start + timedelta(days=day)
+            seats = sum(slot.seats for slot in slots)
+            ids = [slot.exam_event_id for slot in slots]
+            if len(slots) > 1:
+                conflicts.append(Conflict('double-booked', info, date, ids, seats))
+            if seats > info.capacity:
+                conflicts.append(Conflict('over capacity', info, date, ids, seats))
+        conflicts.sort(key=lambda conflict: (conflict.date, conflict.room.room_name))
+        return conflicts
+
+    def candidates(self, value, seats, needs=(), limit=5):
+        """Suggest free rooms on a date with enough capacity and the needed features, smallest first."""
+        day = self.day(value)
+        # Rooms are sorted by capacity, so the big enough ones are a suffix of the indexes
+        big_enough = self.all_rooms & ~((1 << bisect_left(self.capacities, seats)) - 1)
+        mask = big_enough & ~self.busy_rooms[day] & ~self.suggested[day]
+        for feature in needs:
+            mask &= self.feature_masks[feature]
+
+        rooms = []
+        while mask and len(rooms) < limit:
+            low = mask & -mask
+            rooms.append(self.rooms[low.bit_length() - 1])
+            mask ^= low
+        return rooms
+
+    def suggestions(self, conflict, needs=None, limit=5):
+        """Suggest alternative rooms for the exam events of a conflict, keeping the first one in place.
+
+        A room is suggested to a single exam event per day, across the conflicts,
+        and an exam event in several conflicts gets the same suggestions.
+        """
+        if needs is None:
+            needs = [feature for feature in FEATURES if getattr(conflict.room, feature)]
+        room = self.index[conflict.room.room_id]
+        day = self.day(conflict.date)
+
+        suggestions = []
+        for slot in self.slots_by_room_day[room, day][1:] or self.slots_by_room_day[room, day]:
+            if slot.exam_event_id not in self.moves:
+                candidates = self.candidates(conflict.date, slot.seats, needs, limit)
+                self.moves[slot.exam_event_id] = [Suggestion(slot.exam_event_id, conflict.date, candidate)
+                                                  for candidate in candidates]
+                for candidate in candidates:
+                    self.suggested[day] |= 1 << self.index[candidate.room_id]
+            suggestions += self.moves[slot.exam_event_id]
+        return suggestions
+
+
+def build_schedule(cursor, start, end):
+    """Build the occupancy index for all rooms between start and end."""
+    return Schedule(fetch_rooms(cursor), fetch_exam_slots(cursor, start, end), start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect double-booked and over capacity rooms in a date range.")
+    parser.add_argument('start', help="first date (YYYY-MM-DD)")
+    parser.add_argument('end', help="last date (YYYY-MM-DD)")
+    parser.add_argument('--needs', nargs='*', choices=FEATURES, default=None,
+                        help="features alternative rooms must have (defaults to those of the booked room)")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date()
+
+    conn = psycopg2.connect(**db_params)
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO grades;")
+    schedule = build_schedule(cursor, start, end)
+    cursor.close()
+    conn.close()
+
+    conflicts = schedule.conflicts()
+    for conflict in conflicts:
+        print(f"{conflict.date} {conflict.room.room_name}: {conflict.kind} "
+              f"({conflict.seats} seats of {conflict.room.capacity}, exam events {conflict.exam_event_ids})")
+        for suggestion in schedule.suggestions(conflict, args.needs):
+            print(f"   - move exam event {suggestion.exam_event_id} to {suggestion.room.room_name} "
+                  f"(capacity {suggestion.room.capacity})")
+    print(f"{len(conflicts)} conflicts found between {start} and {end}.")
+    return 1 if conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import io
+import sys
+import json
+import time
+import gzip
+import hashlib
+import tarfile
+import argparse
+import psycopg2
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from database import db_params
+from partitions import is_partitioned, list_partitions, term_bounds, ensure_partition
+import changefeed
+import gpa
+import ranking
+import cube
+import read_model
+import generation
+
+FORMAT_VERSION = 1
+
+# Uncompressed bytes of COPY data per chunk of the archive
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# (table, serial column) in foreign key order
+TABLES = [
+    ('state', 'state_id'),
+    ('student', 'student_id'),
+    ('course', 'course_id'),
+    ('exam_type', 'exam_type_id'),
+    ('building', 'building_id'),
+    ('room', 'room_id'),
+    ('exam_event', 'exam_event_id'),
+    ('enrollment', None),
+    ('assessment', None),
+]
+
+
+def connect():
+    conn = psycopg2.connect(**db_params)
+    with conn.cursor() as cursor:
+        cursor.execute("SET search_path TO grades;")
+    conn.commit()
+    return conn
+
+
+def table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'grades' AND table_name = %s
+        ORDER BY ordinal_position;
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+class ChunkWriter:
+    """File-like sink for COPY TO that stores the data as gzip chunks in a tar archive."""
+
+    def __init__(self, archive, table, chunk_size):
+        self.archive = archive
+        self.table = table
+        self.chunk_size = chunk_size
+        self.buffer = io.BytesIO()
+        self.chunks = []
+        self.bytes = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.buffer.write(data)
+        self.bytes += len(data)
+        if self.buffer.tell() >= self.chunk_size:
+            self.flush_chunk()
+        return len(data)
+
+    def flush_chunk(self):
+        data = self.buffer.getvalue()
+        if not data:
+            return
+        compressed = gzip.compress(data, compresslevel=3)
+        name = f"data/{self.table}.{len(self.chunks):05d}.bin.gz"
+        info = tarfile.TarInfo(name)
+        info.size = len(compressed)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(compressed))
+        self.chunks.append({
+            'file': name,
+            'sha256': hashlib.sha256(compressed).hexdigest(),
+            'bytes': len(data),
+        })
+        self.buffer = io.BytesIO()
+
+
+def create_snapshot(path, chunk_size=CHUNK_SIZE):
+    """Dump every grades table with binary COPY into a chunked archive with a manifest."""
+    conn = connect()
+    # All tables are read from the same snapshot of the database
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor()
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'partitioned': is_partitioned(cursor),
+        'terms': [],
+        'tables': [],
+    }
+    if manifest['partitioned']:
+        manifest['terms'] = [term for term, _ in list_partitions(cursor)]
+
+    with tarfile.open(path, 'w') as archive:
+        for table, _ in TABLES:
+            start = time.perf_counter()
+            columns = table_columns(cursor, table)
+            writer = ChunkWriter(archive, table, chunk_size)
+            # A query rather than the table name, COPY TO can't read partitioned tables directly
+            cursor.copy_expert(f"COPY (SELECT {', '.join(columns)} FROM {table}) TO STDOUT (FORMAT binary)", writer)
+            writer.flush_chunk()
+            manifest['tables'].append({'name': table, 'columns': columns, 'bytes': writer.bytes, 'chunks': writer.chunks})
+            print(f"{table}: {writer.bytes} bytes in {len(writer.chunks)} chunks ({time.perf_counter() - start:.2f}s)")
+
+        data = json.dumps(manifest, indent=2).encode()
+        info = tarfile.TarInfo('manifest.json')
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+
+    cursor.close()
+    conn.close()
+    return manifest
+
+
+def read_manifest(path):
+    with tarfile.open(path, 'r') as archive:
+        return json.load(archive.extractfile('manifest.json'))
+
+
+class ChunkReader:
+    """File-like source for COPY FROM that decompresses and checks the chunks of a table in order."""
+
+    def __init__(self, path, chunks):
+        self.archive = tarfile.open(path, 'r')
+        self.chunks = list(chunks)
+        self.current = io.BytesIO()
+
+    def next_chunk(self):
+        chunk = self.chunks.pop(0)
+        compressed = self.archive.extractfile(chunk['file']).read()
+        if hashlib.sha256(compressed).hexdigest() != chunk['sha256']:
+            raise ValueError(f"Checksum mismatch in {chunk['file']}, the snapshot is corrupted.")
+        self.current = io.BytesIO(gzip.decompress(compressed))
+
+    def read(self, size=-1):
+        data = self.current.read(size)
+        while not data and self.chunks:
+            self.next_chunk()
+            data = self.current.read(size)
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+    def close(self):
+        self.archive.close()
+
+
+def constraints_and_indexes(cursor, tables):
+    """Definitions of the keys, foreign keys and other indexes of the tables, to drop and recreate them."""
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE connamespace = 'grades'::regnamespace AND contype IN ('p', 'u', 'f')
+          AND conparentid = 0 AND conrelid::regclass::text = ANY(%s);
+    """, (tables,))
+    constraints = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+        FROM pg_index
+        JOIN pg_class ON pg_class.oid = pg_index.indrelid
+        WHERE pg_class.relnamespace = 'grades'::regnamespace AND pg_class.relname = ANY(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid);
+    """, (tables,))
+    indexes = cursor.fetchall()
+    return constraints, indexes
+
+
+def load_table(path, table):
+    """COPY one table of the snapshot on its own connection."""
+    start = time.perf_counter()
+    conn = connect()
+    reader = ChunkReader(path, table['chunks'])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET synchronous_commit TO off;")
+            cursor.copy_expert(f"COPY {table['name']} ({', '.join(table['columns'])}) FROM STDIN (FORMAT binary)", reader)
+        conn.commit()
+    finally:
+        reader.close()
+        conn.close()
+    return table['name'], time.perf_counter() - start
+
+
+def restore_snapshot(path, workers=4):
+    """Recreate the grades tables from a snapshot, loading tables in parallel and building indexes afterwards."""
+    manifest = read_manifest(path)
+    if manifest['version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest['version']}.")
+
+    conn = connect()
+    cursor = conn.cursor()
+
+    schema = "grades_partitioned.sql" if manifest['partitioned'] else "grades.sql"
+    cursor.execute(open(schema, "r").read())
+    for term in manifest['terms']:
+        ensure_partition(cursor, term_bounds(term)[0])
+
+    # Empty tables without keys load faster, the keys and indexes are built once at the end
+    names = [table['name'] for table in manifest['tables']]
+    constraints, indexes = constraints_and_indexes(cursor, names)
+    for table, name, kind, _ in sorted(constraints, key=lambda constraint: constraint[2] != 'f'):
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}";')
+    for index, _ in indexes:
+        cursor.execute(f"DROP INDEX {index};")
+    conn.commit()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        for name, elapsed in executor.map(lambda table: load_table(path, table), manifest['tables']):
+            print(f"{name}: loaded in {elapsed:.2f}s")
+    print(f"Tables loaded in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for table, name, kind, definition in sorted(constraints, key=lambda constraint: constraint[2] == 'f'):
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition};')
+    for _, definition in indexes:
+        # Indexes of partitioned tables are reported ON ONLY the parent, build them on the partitions too
+        cursor.execute(definition.replace(" ON ONLY ", " ON ") + ";")
+    for table, serial in TABLES:
+        if serial:
+            cursor.execute(f"""
+                SELECT setval(pg_get_serial_sequence('grades.{table}', '{serial}'), COALESCE(MAX({serial}), 1), MAX({serial}) IS NOT NULL)
+                FROM {table};
+            """)
+    print(f"Keys and indexes built in {time.perf_counter() - start:.2f}s")
+
+    # Derived tables are rebuilt rather than stored
+    changefeed.install(cursor)
+    changefeed.mark_reset(cursor)
+    gpa.install(cursor)
+    gpa.GpaEngine().rebuild(cursor)
+    ranking.install(cursor)
+    ranking.refresh(cursor)
+    read_model.install(cursor)
+    read_model.refresh(cursor)
+    cube.install(cursor)
+    cube.rebuild(cursor)
+    generation.install(cursor)
+    generation.bump_generation(cursor)
+    conn.commit()
+
+    conn.autocommit = True
+    cursor.execute("ANALYZE;")
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot and restore the grades database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    create = subparsers.add_parser('create', help="write a snapshot of the grades tables")
+    create.add_argument('path')
+    create.add_argument('--chunk-mb', type=int, default=CHUNK_SIZE // (1024 * 1024))
+    restore = subparsers.add_parser('restore', help="replace the grades tables with a snapshot")
+    restore.add_argument('path')
+    restore.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'create':
+        create_snapshot(args.path, args.chunk_mb * 1024 * 1024)
+        print(f"Snapshot written to {args.path} in {time.perf_counter() - start:.2f}s")
+    else:
+        restore_snapshot(args.path, args.workers)
+        print(f"Snapshot restored from {args.path} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import os
+import csv
+from datetime import date, datetime
+from itertools import islice
+from collections import deque
+from multiprocessing import Pool
+
+# Rows sent to a worker process at once
+CHUNK_SIZE = 5000
+
+REQUIRED = (
+    'exam_date', 'first_name', 'last_name', 'email', 'date_of_birth', 'gpa', 'course_name', 'exam_name',
+    'building_name', 'room_name', 'capacity', 'has_projector', 'has_computers', 'is_accessible', 'grade', 'state',
+)
+BOOLEANS = ('has_projector', 'has_computers', 'is_accessible')
+
+
+def as_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def as_date(value):
+    """Dates are YYYY-MM-DD strings in CSV and JSON lines and dates in Parquet."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def as_number(value):
+    """Numbers are strings in CSV and numbers in JSON lines and Parquet, booleans are not numbers."""
+    if isinstance(value, bool):
+        raise TypeError(value)
+    return float(value)
+
+
+def as_int(value):
+    """Integers are strings in CSV and numbers without a fractional part in JSON lines and Parquet."""
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if isinstance(value, str):
+        return int(value)
+    try:
+        integer = int(value)
+    except OverflowError:
+        raise ValueError(value)
+    if integer != value:
+        raise ValueError(value)
+    return integer
+
+
+def as_bool(value):
+    """Booleans are 't' or 'f' in CSV and true booleans in JSON lines and Parquet."""
+    if isinstance(value, bool):
+        return value
+    if value in ('t', 'f'):
+        return value == 't'
+    raise ValueError(value)
+
+
+def parse_row(row):
+    """Convert an input row into the typed values inserted by the loader."""
+    return {
+        'exam_date': as_date(row['exam_date']),
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'email': row['email'],
+        'date_of_birth': as_date(row['date_of_birth']),
+        'gpa': as_number(row['gpa']),
+        'course_name': row['course_name'],
+        'exam_name': row['exam_name'],
+        'building_name': row['building_name'],
+        'room_name': row['room_name'],
+        'capacity': as_int(row['capacity']),
+        'has_projector': as_bool(row['has_projector']),
+        'has_computers': as_bool(row['has_computers']),
+        'is_accessible': as_bool(row['is_accessible']),
+        'state_name': row['state'],
+        'grade': as_number(row['grade']),
+    }
+
+
+def validate_row(row):
+    """Check an input row against the schema constraints and return the reasons it would be rejected."""
+    reasons = []
+    for field in REQUIRED:
+        if not as_text(row.get(field)):
+            reasons.append(f"{field} is empty")
+    if reasons:
+        return reasons
+
+    for field in ('exam_date', 'date_of_birth'):
+        try:
+            as_date(row[field])
+        except (TypeError, ValueError):
+            reasons.append(f"{field} '{row[field]}' is not a YYYY-MM-DD date")
+
+    try:
+        gpa = as_number(row['gpa'])
+        if not 0 <= gpa <= 4:
+            reasons.append(f"gpa {gpa} is not between 0 and 4")
+    except (TypeError, ValueError):
+        reasons.append(f"gpa '{row['gpa']}' is not a number")
+
+    try:
+        grade = as_number(row['grade'])
+        if not 0 <= grade <= 100:
+            reasons.append(f"grade {grade} is not between 0 and 100")
+    except (TypeError, ValueError):
+        reasons.append(f"grade '{row['grade']}' is not a number")
+
+    try:
+        as_int(row['capacity'])
+    except (TypeError, ValueError):
+        reasons.append(f"capacity '{row['capacity']}' is not an integer")
+
+    for field in BOOLEANS:
+        try:
+            as_bool(row[field])
+        except ValueError:
+            reasons.append(f"{field} '{row[field]}' is not 't' or 'f'")
+
+    return reasons
+
+
+def validate_chunk(rows):
+    """Validate a chunk of rows, returning the reasons of the rejected ones keyed by position."""
+    rejected = {}
+    for i, row in enumerate(rows):
+        reasons = validate_row(row)
+        if reasons:
+            rejected[i] = reasons
+    return rejected
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_rows(rows, workers=None, chunk_size=CHUNK_SIZE):
+    """Yield (row, reasons) for every row in order, validating chunks of rows in parallel worker processes."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for row in rows:
+            yield row, validate_row(row)
+        return
+
+    def results(chunk, rejected):
+        for i, row in enumerate(chunk):
+            yield row, rejected.get(i, [])
+
+    with Pool(workers) as pool:
+        # A bounded window of chunks in flight keeps the workers busy without reading the whole file ahead
+        in_flight = deque()
+        for chunk in chunks(rows, chunk_size):
+            in_flight.append((chunk, pool.apply_async(validate_chunk, (chunk,))))
+            if len(in_flight) >= workers * 2:
+                chunk, result = in_flight.popleft()
+                yield from results(chunk, result.get())
+        while in_flight:
+            chunk, result = in_flight.popleft()
+            yield from results(chunk, result.get())
+
+
+class RejectWriter:
+    """Write rejected rows to a CSV file with an extra reject_reason column."""
+
+    def __init__(self, path, fieldnames, resume_offset=0):
+        self.path = path
+        # A resumed load adds to the rejects of the interrupted one, after those of its last checkpoint
+        append = resume_offset and path and os.path.exists(path) and os.path.getsize(path) >= resume_offset
+        self.file = open(path, 'a' if append else 'w', newline='') if path else None
+        if append:
+            # Truncating doesn't move the position, which the offsets saved next are read from
+            self.file.truncate(resume_offset)
+            self.file.seek(resume_offset)
+        self.writer = None
+        if self.file:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(fieldnames) + ['reject_reason'], extrasaction='ignore')
+            if not append:
+                self.writer.writeheader()
+        self.count = 0
+
+    def write(self, row, reasons):
+        self.count += 1
+        if self.writer:
+            self.writer.writerow({**row, 'reject_reason': '; '.join(reasons)})
+
+    def offset(self):
+        """Size of the reject file so far, saved with the checkpoints."""
+        if not self.file:
+            return 0
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def valid_rows(rows, rejects, workers=None):
+    """Yield the rows that pass validation, sending the others to the reject writer."""
+    for row, reasons in validate_rows(rows, workers):
+        if reasons:
+            rejects.write(row, reasons)
+        else:
+            yield row